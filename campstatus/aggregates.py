@@ -0,0 +1,267 @@
+"""Materialized summary tables of the analyzed campgrounds
+
+Two tables are kept next to config.analyzed_file:
+
+* config.group_summary_file: one row per (Forest, Geo Group),
+* config.forest_summary_file: one row per Forest,
+
+with the number of campgrounds, how many are open or have potable
+water, fee and elevation ranges and the centroid. Reports read these
+few hundred rows instead of regrouping the whole analyzed table.
+
+The summaries are updated incrementally. A hash of the summarized
+columns of every campground is kept in config.summary_state_file; only
+groups with an added, removed or changed campground are recomputed,
+and only forests with a recomputed group are summed up again from
+their group rows.
+
+"""
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import identity
+import config
+
+# columns of the analyzed table that the summaries depend on
+SUMMARIZED_COLUMNS = ['Forest', 'Geo Group', 'Status', 'Fees',
+                      'Potable Water', 'Elevation', 'Latitude', 'Longitude']
+
+GROUP_COLUMNS = ['Forest', 'Geo Group', 'Campgrounds', 'Open',
+                 'Potable Water', 'Potable Water Share', 'Min Fee', 'Max Fee',
+                 'Min Elevation', 'Max Elevation', 'Located', 'Latitude',
+                 'Longitude']
+
+FOREST_COLUMNS = ['Forest', 'Geo Groups'] + GROUP_COLUMNS[2:]
+
+# format of config.summary_state_file; older states are recomputed
+STATE_VERSION = 2
+
+FEE = re.compile(r'\$(\d+(?:\.\d+)?)')
+
+def _fee(cell):
+    """Dollar amount of a munged fee, NaN if there is none"""
+    if not isinstance(cell, basestring):
+        return np.nan
+    found = FEE.search(cell)
+    return float(found.group(1)) if found else np.nan
+
+def _is_true(cell):
+    return cell is True or (isinstance(cell, basestring) and
+                            cell.strip().lower() == 'true')
+
+def _is_open(cell):
+    return (isinstance(cell, basestring) and
+            cell.strip().lower().startswith('open'))
+
+def _group_key(forest, group):
+    """Key of a (Forest, Geo Group); campgrounds without a group share one"""
+    if isinstance(group, float) and np.isnan(group):
+        group = ''
+    elif isinstance(group, float) and group.is_integer():
+        group = int(group)
+    return u'{}|{}'.format(forest, group)
+
+def _row_keys(df):
+    """Identifies every campground by Campground ID, or URL without one
+
+    The ID is the same text whether the table was scraped (str) or read
+    back from a csv (int, or float with missing IDs).
+    """
+    if 'Campground ID' in df:
+        ids = [identity.id_text(v) for v in df['Campground ID']]
+    else:
+        ids = [None] * len(df)
+    urls = df['URL'] if 'URL' in df else [None] * len(df)
+    return [recid if recid is not None else u'url:{}'.format(url)
+            for recid, url in zip(ids, urls)]
+
+def row_hashes(df):
+    """Group keys and hash of the summarized columns of every campground.
+
+    Rows sharing a key, e.g. a campground listed twice, are hashed
+    together, so a change to any of them is seen.
+
+    Returns:
+        dict: campground key to [sorted group keys, hash].
+    """
+    columns = [c for c in SUMMARIZED_COLUMNS if c in df]
+    hashes = pd.util.hash_pandas_object(
+        df[columns].astype(unicode), index=False).values
+    if 'Geo Group' in df:
+        geo_group = df['Geo Group']
+    else:
+        geo_group = [np.nan] * len(df)
+    group_keys = [_group_key(f, g) for f, g in zip(df['Forest'], geo_group)]
+    rows = {}
+    for key, group, h in zip(_row_keys(df), group_keys, hashes):
+        groups, hexes = rows.setdefault(key, (set(), []))
+        groups.add(group)
+        hexes.append('{:016x}'.format(h))
+    return dict(
+        (key, [sorted(groups), ','.join(sorted(hexes))])
+        for key, (groups, hexes) in rows.iteritems())
+
+def summarize_groups(df):
+    """Summary row of every (Forest, Geo Group) of an analyzed table.
+
+    Args:
+        df (pandas.DataFrame): analyzed campgrounds, or only those of
+            the groups to summarize.
+
+    Returns:
+        pandas.DataFrame: one row per group, with GROUP_COLUMNS.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=GROUP_COLUMNS)
+    if 'Geo Group' in df:
+        geo_group = df['Geo Group']
+    else:
+        geo_group = pd.Series(np.nan, index=df.index)
+    work = pd.DataFrame({
+        'Forest': df['Forest'].values,
+        'Geo Group': geo_group.fillna(-1).values,
+        'Open': df['Status'].map(_is_open).values if 'Status' in df else False,
+        'Water': df['Potable Water'].map(_is_true).values
+            if 'Potable Water' in df else False,
+        'Fee': df['Fees'].map(_fee).values if 'Fees' in df else np.nan,
+        'Elevation': pd.to_numeric(df['Elevation'], errors='coerce').values,
+        'Latitude': pd.to_numeric(df['Latitude'], errors='coerce').values,
+        'Longitude': pd.to_numeric(df['Longitude'], errors='coerce').values,
+        })
+    work['Located'] = work['Latitude'].notnull() & work['Longitude'].notnull()
+    grouped = work.groupby(['Forest', 'Geo Group'])
+    summary = pd.DataFrame({
+        'Campgrounds': grouped.size(),
+        'Open': grouped['Open'].sum(),
+        'Potable Water': grouped['Water'].sum(),
+        'Min Fee': grouped['Fee'].min(),
+        'Max Fee': grouped['Fee'].max(),
+        'Min Elevation': grouped['Elevation'].min(),
+        'Max Elevation': grouped['Elevation'].max(),
+        'Located': grouped['Located'].sum(),
+        'Latitude': grouped['Latitude'].mean(),
+        'Longitude': grouped['Longitude'].mean(),
+        }).reset_index()
+    summary['Geo Group'] = summary['Geo Group'].replace(-1, np.nan)
+    summary['Potable Water Share'] = (
+        summary['Potable Water'] / summary['Campgrounds']).round(3)
+    return summary[GROUP_COLUMNS]
+
+def summarize_forests(groups):
+    """Forest summary rows, combined from group summary rows.
+
+    Args:
+        groups (pandas.DataFrame): from :func:`summarize_groups`.
+
+    Returns:
+        pandas.DataFrame: one row per forest, with FOREST_COLUMNS.
+    """
+    if groups.empty:
+        return pd.DataFrame(columns=FOREST_COLUMNS)
+    groups = groups.copy()
+    # centroids are combined weighted by the located campgrounds
+    groups['lat_sum'] = groups['Latitude'].fillna(0) * groups['Located']
+    groups['lon_sum'] = groups['Longitude'].fillna(0) * groups['Located']
+    grouped = groups.groupby('Forest')
+    summary = pd.DataFrame({
+        'Geo Groups': grouped['Geo Group'].count(),
+        'Campgrounds': grouped['Campgrounds'].sum(),
+        'Open': grouped['Open'].sum(),
+        'Potable Water': grouped['Potable Water'].sum(),
+        'Min Fee': grouped['Min Fee'].min(),
+        'Max Fee': grouped['Max Fee'].max(),
+        'Min Elevation': grouped['Min Elevation'].min(),
+        'Max Elevation': grouped['Max Elevation'].max(),
+        'Located': grouped['Located'].sum(),
+        'Latitude': grouped['lat_sum'].sum(),
+        'Longitude': grouped['lon_sum'].sum(),
+        }).reset_index()
+    located = summary['Located'].replace(0, np.nan)
+    summary['Latitude'] = summary['Latitude'] / located
+    summary['Longitude'] = summary['Longitude'] / located
+    summary['Potable Water Share'] = (
+        summary['Potable Water'] / summary['Campgrounds']).round(3)
+    return summary[FOREST_COLUMNS]
+
+def _read_summary(path, columns):
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    return pd.DataFrame(columns=columns)
+
+def update_summaries(df, full=False):
+    """Brings the summary tables up to date with an analyzed table.
+
+    Args:
+        df (pandas.DataFrame): the analyzed campgrounds.
+        full (bool, optional): recompute everything instead of only
+            the groups that changed.
+
+    Returns:
+        tuple(pandas.DataFrame, pandas.DataFrame): group and forest
+            summaries.
+    """
+    rows = row_hashes(df)
+    previous = None
+    if not full and os.path.exists(config.summary_state_file):
+        with open(config.summary_state_file) as f:
+            previous = json.load(f)
+    if (previous is None or previous.get('version') != STATE_VERSION or
+            previous.get('columns') != SUMMARIZED_COLUMNS or
+            not os.path.exists(config.group_summary_file) or
+            not os.path.exists(config.forest_summary_file)):
+        groups = summarize_groups(df)
+        forests = summarize_forests(groups)
+        changed = None
+    else:
+        old_rows = previous['rows']
+        dirty = set()
+        for key in set(rows) | set(old_rows):
+            old, new = old_rows.get(key), rows.get(key)
+            if old != new:
+                for v in (old, new):
+                    if v is not None:
+                        dirty.update(v[0])
+        groups = _read_summary(config.group_summary_file, GROUP_COLUMNS)
+        forests = _read_summary(config.forest_summary_file, FOREST_COLUMNS)
+        if dirty:
+            group_keys = [_group_key(f, g) for f, g in
+                          zip(groups['Forest'], groups['Geo Group'])]
+            if 'Geo Group' in df:
+                geo_group = df['Geo Group']
+            else:
+                geo_group = [np.nan] * len(df)
+            df_keys = [_group_key(f, g)
+                       for f, g in zip(df['Forest'], geo_group)]
+            groups = pd.concat([
+                groups[[k not in dirty for k in group_keys]],
+                summarize_groups(df[[k in dirty for k in df_keys]]),
+                ], sort=False)
+            dirty_forests = set(k.split('|', 1)[0] for k in dirty)
+            touched = groups[groups['Forest'].isin(dirty_forests)]
+            forests = pd.concat([
+                forests[~forests['Forest'].isin(dirty_forests)],
+                summarize_forests(touched),
+                ], sort=False)
+        changed = len(dirty)
+
+    groups = groups.sort_values(['Forest', 'Geo Group'])[GROUP_COLUMNS]
+    forests = forests.sort_values('Forest')[FOREST_COLUMNS]
+    if changed is None or changed:
+        groups.to_csv(config.group_summary_file, index=False, encoding='utf-8')
+        forests.to_csv(config.forest_summary_file, index=False,
+                       encoding='utf-8')
+    with open(config.summary_state_file, 'w') as f:
+        json.dump({'version': STATE_VERSION, 'columns': SUMMARIZED_COLUMNS,
+                   'rows': rows}, f)
+    return groups, forests
+
+def main(full=False):
+    df = pd.read_csv(config.analyzed_file)
+    groups, forests = update_summaries(df, full=full)
+    print 'summarized {} forests, {} geo groups'.format(
+        len(forests), len(groups))
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,17 @@
 """Functions to analyze campground and trailhead data
 """
 
+import hashlib
+import json
+import os
+import re
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-import geopy.distance
 import config
 
-def mean_of_mean_distance_to_centroid(kmeans_data, X):
+EARTH_RADIUS_KM = 6371.0088
+
+def mean_of_mean_distance_to_centroid(kmeans_data, X, weights=None):
 	"""Calculates all of the mean of mean distances to a centroid.
 
 	Within a group, the mean distance from point to centroid is
@@ -18,11 +22,19 @@ def mean_of_mean_distance_to_centroid(kmeans_data, X):
 	    kmeans_data (list(sklearn.cluster.KMeans)): list of results of KMeans 
 	        algorithm performed with different k
 	    X (numpy.array): Input to KMeans algorithm
+	    weights (numpy.array, optional): number of points at each row of
+	        `X`, see :func:`collapse_points`. Each row counts once if
+	        not given.
 	
 	Returns:
 	    list: List of mean of mean distances to centroid for each k
 	
 	"""
+	# imported here so that importing this module stays cheap
+	import geopy.distance
+
+	if weights is None:
+		weights = np.ones(len(X))
 	all_mean_distances = []
 	for clst in kmeans_data:
 	    ssd_collect = []
@@ -34,20 +46,71 @@ def mean_of_mean_distance_to_centroid(kmeans_data, X):
 	        for idx in points:
 	            p = X[idx]
 	            dist = geopy.distance.vincenty(centroid, p).km
-	            distances += dist
+	            distances += dist * weights[idx]
 	        # this is kind of like a rough "radius" of distance around the centroid
-	        mean_distance = distances / len(points)
+	        mean_distance = distances / weights[points].sum()
 	        mean_distance_collect.append(mean_distance)
 	    mean_mean_distance = pd.np.asarray(mean_distance_collect).mean()
 	    all_mean_distances.append(mean_mean_distance)
 	return all_mean_distances
 
+def collapse_points(X, tolerance_km=0):
+	"""Merges coincident and near-coincident points into weighted locations.
+
+	Loops and group sites of one campground often share coordinates.
+	With `tolerance_km`, points are also merged into the location of a
+	seed point less than `tolerance_km` away. Points are not chained
+	through each other, so a merged location never spans more than
+	`tolerance_km` from its seed.
+
+	Args:
+	    X (numpy.array): latitude, longitude pairs.
+	    tolerance_km (float, optional): points this close to a seed are
+	        merged into it. 0, the default, only merges identical
+	        coordinates, which leaves the groups unchanged.
+
+	Returns:
+	    tuple(numpy.array, numpy.array, numpy.array): the unique
+	        locations, the number of points at each, and the index of
+	        each point's location, so that ``locations[inverse]`` lines
+	        up with `X`.
+	"""
+	X = np.asarray(X, dtype=float)
+	locations, inverse, counts = np.unique(
+		X, axis=0, return_inverse=True, return_counts=True)
+	if len(locations) < 2 or not tolerance_km:
+		return locations, counts.astype(float), inverse
+
+	from scipy.spatial import cKDTree
+
+	# equirectangular km are accurate at this scale
+	scale = np.cos(np.radians(locations[:, 0].mean()))
+	km = np.column_stack([locations[:, 0], locations[:, 1] * scale]) * (
+		np.pi / 180 * EARTH_RADIUS_KM)
+	tree = cKDTree(km)
+	seed_of = np.full(len(locations), -1, dtype=int)
+	n = 0
+	# unique locations are sorted, so the seeds do not depend on row order
+	for i in range(len(locations)):
+		if seed_of[i] >= 0:
+			continue
+		near = np.array(tree.query_ball_point(km[i], tolerance_km), dtype=int)
+		seed_of[near[seed_of[near] < 0]] = n
+		n += 1
+	merged_counts = np.bincount(seed_of, weights=counts, minlength=n)
+	merged = np.column_stack([
+		np.bincount(seed_of, weights=locations[:, 0] * counts, minlength=n),
+		np.bincount(seed_of, weights=locations[:, 1] * counts, minlength=n),
+		]) / merged_counts[:, None]
+	return merged, merged_counts, seed_of[inverse]
+
 def group_points(
 	df,
 	n_iters=250,
 	ub_in_clust=20,
 	lb_in_clust=2,
-	max_radius=2.5,):
+	max_radius=2.5,
+	tolerance_km=0,):
 	"""Groups point in a dataset together by geography.
 	
 	Uses k-means algorithm to group points together. Selects
@@ -55,9 +118,15 @@ def group_points(
 	to the centroid. For a given k, the average distance to centroid is
 	calculated for each point in the cluster, and those mean distances
 	are also averaged. The k yielding the closest mean distance to
-	2.5 kilometers, but is less than 2.5 kilometers, is selected as
-	the "best" k.
+	`max_radius` kilometers, but is less than `max_radius` kilometers,
+	is selected as the "best" k.
 	
+	Points with the same coordinates are first merged with
+	:func:`collapse_points`, and the unique locations are clustered with
+	their number of points as sample weights, which gives the same
+	groups with a smaller KMeans problem. The range of k tried is based
+	on the number of unique locations.
+
 	This can be used as a pandas groupby function.
 	
 	Args:
@@ -71,6 +140,9 @@ def group_points(
 	        points in a cluster
 	    max_radius (float, optional): Rough upper limit of the average
 	        distance from a given point to its group's centroid.
+	    tolerance_km (float, optional): points this close to another
+	        are clustered as one location, see :func:`collapse_points`.
+	        0, the default, only merges identical coordinates.
 	
 	Returns:
 	    pandas.DataFrame: Input dataframe with an additional column named
@@ -78,49 +150,493 @@ def group_points(
 	        belongs to
 	
 	"""
+	from sklearn.cluster import KMeans
 
 	# get clean values (no NaN)
 	clean = df[['Latitude', 'Longitude']].dropna()
-	X = clean.values
+	X, weights, inverse = collapse_points(clean.values, tolerance_km)
 
 	# calculate lower and upper cluster sizes
 	# want fewer than ~20 points in a cluster
-	lower_k = len(X) // ub_in_clust
-	# want more than ~2 points in a cluster
-	upper_k = len(X) // lb_in_clust
+	lower_k = max(len(X) // ub_in_clust, 1)
+	# want more than ~2 points in a cluster, and no more clusters
+	# than locations
+	upper_k = min(max(len(X) // lb_in_clust, lower_k + 1), len(X) + 1)
 
 	# calculate clusters for each k in the range
 	kmeans_data = []
 	r = range(lower_k,upper_k)
 	for k in r:
-	    clst = KMeans(k, n_jobs=-1, n_init=n_iters).fit(X)
+	    clst = KMeans(k, n_jobs=-1, n_init=n_iters).fit(
+	        X, sample_weight=weights)
 	    kmeans_data.append(clst)
 
 	# calculate the mean of mean distances to centroid
-	all_mean_distances = mean_of_mean_distance_to_centroid(kmeans_data, X)
+	all_mean_distances = mean_of_mean_distance_to_centroid(
+		kmeans_data, X, weights)
 
-	# get the number of clusters to make the mean "radius" of a cluster close to 2.5
-	# the average longest distance between two points will be 5 km
+	# get the number of clusters to make the mean "radius" of a cluster close to max_radius
+	# the average longest distance between two points will be 2 * max_radius
 	m = pd.np.asarray(all_mean_distances)
 	try:
-		best_k = pd.np.argwhere(m <= 2.5).flatten()[0]
+		best_k = pd.np.argwhere(m <= max_radius).flatten()[0]
 	except IndexError as e:
 		best_k = -1
-		print 'Warning: best_k\'s radius is {} for {}, higher than desired 2.5'.format(
+		print 'Warning: best_k\'s radius is {} for {}, higher than desired {}'.format(
 			m[best_k],
-			df['Forest'].iloc[0]
+			df['Forest'].iloc[0],
+			max_radius,
 			)
 
 	best_cluster = kmeans_data[best_k]
 
-	df.loc[clean.index, 'Geo Group'] = best_cluster.labels_
+	df.loc[clean.index, 'Geo Group'] = best_cluster.labels_[inverse]
 
 	return df
 
-def main():
-	df = pd.read_csv(config.scraped_file)
-	result = df.groupby('Forest').apply(group_points)
-	result.to_csv(config.analyzed_file, index=False)
+def _point_key(lat, lon):
+	"""Coordinates rounded the way :func:`coordinate_fingerprint` rounds them"""
+	return (round(lat, 6), round(lon, 6))
+
+def coordinate_fingerprint(X, params):
+	"""Hash of a set of coordinates and clustering parameters.
+
+	Points are rounded to 6 decimals (about 0.1 m) and sorted, so the
+	fingerprint does not depend on row order.
+
+	Args:
+	    X (numpy.array): latitude, longitude pairs.
+	    params (dict): keyword arguments of :func:`group_points`.
+
+	Returns:
+	    str: hex digest identifying the clustering problem.
+	"""
+	points = sorted('{:.6f},{:.6f}'.format(lat, lon) for lat, lon in X)
+	h = hashlib.sha1()
+	h.update(json.dumps(sorted(params.items())))
+	h.update(';'.join(points))
+	return h.hexdigest()
+
+def group_centroids(df):
+	"""Mean latitude and longitude of each Geo Group.
+
+	For a k-means solution these are the cluster centers.
+
+	Returns:
+	    dict: Geo Group label to [latitude, longitude]
+	"""
+	clean = df[['Latitude', 'Longitude', 'Geo Group']].dropna()
+	means = clean.groupby('Geo Group')[['Latitude', 'Longitude']].mean()
+	return dict((label, list(row)) for label, row in zip(means.index, means.values))
+
+def mean_radius(X, labels, centroids):
+	"""Mean over groups of the mean distance from point to centroid, in km.
+
+	Same measure :func:`group_points` uses to pick k, for an existing
+	labelling.
+
+	Args:
+	    X (numpy.array): latitude, longitude pairs.
+	    labels (list): Geo Group of each point.
+	    centroids (dict): Geo Group label to [latitude, longitude].
+
+	Returns:
+	    float: mean of mean distances to centroid
+	"""
+	import geopy.distance
+
+	distances = {}
+	for p, label in zip(X, labels):
+		d = geopy.distance.vincenty(centroids[label], p).km
+		distances.setdefault(label, []).append(d)
+	return np.mean([np.mean(d) for d in distances.values()])
+
+def incremental_group_points(df, previous, max_radius=2.5, drift=0.2,
+		max_changed=0.25):
+	"""Updates a previous grouping with added and removed points.
+
+	Points already in `previous` keep their group. Each new point joins
+	the group with the nearest centroid if it is within `max_radius`
+	km, or else opens a new group. Removed points are dropped and the
+	centroids are recomputed.
+
+	Args:
+	    df (pandas.DataFrame): Table containing latitude and longitude
+	        information for each point.
+	    previous (dict): 'points', 'labels' and 'centroids' of the last
+	        grouping of this forest.
+	    max_radius (float, optional): see :func:`group_points`.
+	    drift (float, optional): fraction by which the mean radius may
+	        exceed `max_radius` before a full recluster is needed.
+	    max_changed (float, optional): largest fraction of added or
+	        removed points handled incrementally.
+
+	Returns:
+	    pandas.DataFrame: Input dataframe with a 'Geo Group' column, or
+	        None if the forest has to be reclustered with
+	        :func:`group_points`.
+	"""
+	import geopy.distance
+
+	clean = df[['Latitude', 'Longitude']].dropna()
+	known = dict(
+		(_point_key(lat, lon), label)
+		for (lat, lon), label in zip(previous['points'], previous['labels']))
+	current = set(_point_key(lat, lon) for lat, lon in clean.values)
+	added = [p for p in current if p not in known]
+	removed = [p for p in known if p not in current]
+	if float(len(added) + len(removed)) > max_changed * max(len(known), 1):
+		return None
+
+	centroids = dict((label, tuple(c)) for label, c in previous['centroids'])
+	next_label = max(centroids.keys() + [-1]) + 1
+	for p in sorted(added):
+		distances = [
+			(geopy.distance.vincenty(c, p).km, label)
+			for label, c in centroids.iteritems()]
+		if distances and min(distances)[0] <= max_radius:
+			known[p] = min(distances)[1]
+		else:
+			known[p] = next_label
+			centroids[next_label] = p
+			next_label += 1
+
+	labels = [known[_point_key(lat, lon)] for lat, lon in clean.values]
+	df.loc[clean.index, 'Geo Group'] = labels
+	centroids = group_centroids(df.loc[clean.index])
+	if mean_radius(clean.values, labels, centroids) > max_radius * (1 + drift):
+		return None
+	return df
+
+def align_labels(X, labels, previous, max_radius=2.5):
+	"""Renumbers new groups to match the groups of a previous run.
+
+	KMeans numbers its clusters arbitrarily. Each new group is paired
+	with at most one previous group by solving an assignment problem
+	(Hungarian method) that maximizes the number of points the two
+	groups share, with the distance between their centroids breaking
+	ties. A new group that shares no points with its partner keeps the
+	partner's label only if their centroids are within `max_radius` km.
+	Unpaired groups get labels not used by the previous run.
+
+	Args:
+	    X (numpy.array): latitude, longitude pairs.
+	    labels (list): new Geo Group of each point.
+	    previous (dict): 'points', 'labels' and 'centroids' of the
+	        previous grouping.
+	    max_radius (float, optional): see :func:`group_points`.
+
+	Returns:
+	    list: Geo Group of each point, using the previous numbering.
+	"""
+	import geopy.distance
+	from scipy.optimize import linear_sum_assignment
+
+	old_of = dict(
+		(_point_key(lat, lon), label)
+		for (lat, lon), label in zip(previous['points'], previous['labels']))
+	old_centroids = dict((label, c) for label, c in previous['centroids'])
+	old_groups = sorted(old_centroids)
+	new_groups = sorted(set(labels))
+	if not old_groups or not new_groups:
+		return list(labels)
+	new_centroids = group_centroids(pd.DataFrame({
+		'Latitude': X[:, 0], 'Longitude': X[:, 1], 'Geo Group': labels}))
+
+	old_index = dict((label, j) for j, label in enumerate(old_groups))
+	new_index = dict((label, i) for i, label in enumerate(new_groups))
+	overlap = np.zeros((len(new_groups), len(old_groups)))
+	for (lat, lon), label in zip(X, labels):
+		old = old_of.get(_point_key(lat, lon))
+		if old in old_index:
+			overlap[new_index[label], old_index[old]] += 1
+	distance = np.array([
+		[geopy.distance.vincenty(new_centroids[n], old_centroids[o]).km
+		 for o in old_groups]
+		for n in new_groups])
+
+	# shared points dominate; distance only decides between equal overlaps
+	cost = distance - overlap * (distance.max() + 1)
+	rows, cols = linear_sum_assignment(cost)
+	mapping = {}
+	for i, j in zip(rows, cols):
+		if overlap[i, j] > 0 or distance[i, j] <= max_radius:
+			mapping[new_groups[i]] = old_groups[j]
+	next_label = max(old_groups) + 1
+	for label in new_groups:
+		if label not in mapping:
+			mapping[label] = next_label
+			next_label += 1
+	return [mapping[label] for label in labels]
+
+def _forest_state_path(cache_dir, forest):
+	"""File holding the latest grouping of a forest"""
+	name = re.sub('[^0-9A-Za-z]+', '_', forest).strip('_')
+	return os.path.join(cache_dir, 'forest_{}.json'.format(name))
+
+def _read_json(path):
+	if not os.path.exists(path):
+		return None
+	with open(path) as f:
+		return json.load(f)
+
+def _write_json(path, data):
+	directory = os.path.dirname(path)
+	if directory and not os.path.isdir(directory):
+		os.makedirs(directory)
+	with open(path, 'w') as f:
+		json.dump(data, f)
+
+def cached_group_points(
+	df,
+	cache_dir=None,
+	incremental=None,
+	n_iters=250,
+	ub_in_clust=20,
+	lb_in_clust=2,
+	max_radius=2.5,
+	tolerance_km=0,):
+	"""Same as :func:`group_points`, reusing results for unchanged points.
+
+	The latest result of each forest is stored in `cache_dir`, with
+	the :func:`coordinate_fingerprint` of its points and parameters.
+	When a forest's coordinates have not changed since the last run,
+	its labels are read back and KMeans is not run. Only the latest
+	result is kept, so the cache holds one file per forest.
+
+	When they have changed, and `incremental` is on, the forest's last
+	grouping is updated with :func:`incremental_group_points`. KMeans
+	is only run if there is no last grouping, too much changed, or the
+	groups drifted too far from `max_radius`. New KMeans labels are
+	then matched to the last grouping with :func:`align_labels`, so
+	Geo Group numbers stay the same between runs.
+
+	Args:
+	    df (pandas.DataFrame): Table containing latitude and longitude
+	        information for each point.
+	    cache_dir (str, optional): directory of cached results. Defaults
+	        to config.cluster_cache_dir. If None, nothing is cached.
+	    incremental (bool, optional): update the last grouping of the
+	        forest instead of reclustering. Defaults to
+	        config.incremental_clustering.
+	    n_iters, ub_in_clust, lb_in_clust, max_radius, tolerance_km: see
+	        :func:`group_points`.
+
+	Returns:
+	    pandas.DataFrame: Input dataframe with a 'Geo Group' column
+	"""
+	params = dict(
+		n_iters=n_iters,
+		ub_in_clust=ub_in_clust,
+		lb_in_clust=lb_in_clust,
+		max_radius=max_radius,
+		tolerance_km=tolerance_km)
+	cache_dir = cache_dir or config.cluster_cache_dir
+	if cache_dir is None:
+		return group_points(df, **params)
+	if incremental is None:
+		incremental = config.incremental_clustering
+
+	clean = df[['Latitude', 'Longitude']].dropna()
+	key = coordinate_fingerprint(clean.values, params)
+	forest_path = _forest_state_path(cache_dir, df['Forest'].iloc[0])
+	previous = _read_json(forest_path)
+	if previous is not None and previous.get('fingerprint') == key:
+		labels = dict(
+			(_point_key(lat, lon), label)
+			for (lat, lon), label in zip(previous['points'], previous['labels']))
+		df.loc[clean.index, 'Geo Group'] = [
+			labels[_point_key(lat, lon)] for lat, lon in clean.values]
+		return df
+
+	result = None
+	if incremental and previous is not None and previous['params'] == params:
+		result = incremental_group_points(
+			df,
+			previous,
+			max_radius=max_radius,
+			drift=config.recluster_drift,
+			max_changed=config.recluster_max_changed)
+	if result is None:
+		result = group_points(df, **params)
+		if previous is not None:
+			result.loc[clean.index, 'Geo Group'] = align_labels(
+				clean.values,
+				result.loc[clean.index, 'Geo Group'].tolist(),
+				previous,
+				max_radius=max_radius)
+
+	grouped = result.loc[clean.index]
+	state = {
+		'fingerprint': key,
+		'params': params,
+		'points': clean.values.tolist(),
+		'labels': grouped['Geo Group'].tolist(),
+		'centroids': sorted(group_centroids(grouped).items()),
+		}
+	_write_json(forest_path, state)
+	return result
+
+def haversine_pdist(X):
+	"""Great circle distances between all pairs of points, in km.
+
+	Args:
+	    X (numpy.array): latitude, longitude pairs in degrees.
+
+	Returns:
+	    numpy.array: condensed distance matrix, as from
+	        scipy.spatial.distance.pdist
+	"""
+	lat = np.radians(X[:, 0])
+	lon = np.radians(X[:, 1])
+	i, j = np.triu_indices(len(X), k=1)
+	a = (np.sin((lat[j] - lat[i]) / 2) ** 2 +
+		np.cos(lat[i]) * np.cos(lat[j]) * np.sin((lon[j] - lon[i]) / 2) ** 2)
+	return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+def build_hierarchy(df):
+	"""Builds the complete-linkage clustering tree of a forest's points.
+
+	Cutting the tree at any height gives the groups for that radius
+	without clustering again, see :func:`cut_hierarchy`.
+
+	Args:
+	    df (pandas.DataFrame): Table containing latitude and longitude
+	        information for each point.
+
+	Returns:
+	    dict: 'points' (numpy.array of latitude, longitude), 'linkage'
+	        (scipy linkage matrix, heights in km) and 'fingerprint'
+	        (see :func:`coordinate_fingerprint`).
+	"""
+	from scipy.cluster.hierarchy import linkage
+
+	X = df[['Latitude', 'Longitude']].dropna().values
+	if len(X) > 1:
+		Z = linkage(haversine_pdist(X), method='complete')
+	else:
+		Z = np.zeros((0, 4))
+	return {
+		'points': X,
+		'linkage': Z,
+		'fingerprint': coordinate_fingerprint(X, {'method': 'complete'}),
+		}
+
+def cut_hierarchy(tree, radius):
+	"""Geo Groups of the tree's points for a given radius.
+
+	With complete linkage, no two points of a group are more than
+	2 * `radius` km apart.
+
+	Args:
+	    tree (dict): from :func:`build_hierarchy`.
+	    radius (float): group radius in km.
+
+	Returns:
+	    numpy.array: 0-based Geo Group of each of the tree's points.
+	"""
+	from scipy.cluster.hierarchy import fcluster
+
+	if len(tree['points']) < 2:
+		return np.zeros(len(tree['points']), dtype=int)
+	return fcluster(tree['linkage'], 2 * radius, criterion='distance') - 1
+
+def load_hierarchy(df, cache_dir=None):
+	"""Reads a forest's tree from `cache_dir`, building it if needed.
+
+	The tree is rebuilt when the forest's coordinates have changed.
+
+	Args:
+	    df (pandas.DataFrame): one forest's table.
+	    cache_dir (str, optional): Defaults to config.cluster_cache_dir.
+	        If None, the tree is built and not stored.
+
+	Returns:
+	    dict: see :func:`build_hierarchy`.
+	"""
+	cache_dir = cache_dir or config.cluster_cache_dir
+	if cache_dir is None:
+		return build_hierarchy(df)
+	X = df[['Latitude', 'Longitude']].dropna().values
+	fingerprint = coordinate_fingerprint(X, {'method': 'complete'})
+	path = _forest_state_path(cache_dir, df['Forest'].iloc[0])
+	path = path[:-len('.json')] + '_tree.npz'
+	if os.path.exists(path):
+		saved = np.load(path)
+		if str(saved['fingerprint']) == fingerprint:
+			return {
+				'points': saved['points'],
+				'linkage': saved['linkage'],
+				'fingerprint': fingerprint,
+				}
+	tree = build_hierarchy(df)
+	if not os.path.isdir(cache_dir):
+		os.makedirs(cache_dir)
+	np.savez(path, **tree)
+	return tree
+
+def hierarchy_group_points(df, max_radius=2.5, cache_dir=None, tree=None):
+	"""Groups points by cutting the forest's stored clustering tree.
+
+	Alternative to :func:`group_points` that can be re-run for any
+	`max_radius` without clustering again. This can be used as a
+	pandas groupby function.
+
+	Args:
+	    df (pandas.DataFrame): Table containing latitude and longitude
+	        information for each point.
+	    max_radius (float, optional): group radius in km.
+	    cache_dir (str, optional): Defaults to config.cluster_cache_dir.
+	    tree (dict, optional): the forest's tree from
+	        :func:`load_hierarchy`, if already loaded.
+
+	Returns:
+	    pandas.DataFrame: Input dataframe with a 'Geo Group' column
+	"""
+	if tree is None:
+		tree = load_hierarchy(df, cache_dir)
+	labels = dict(
+		(_point_key(lat, lon), label)
+		for (lat, lon), label in zip(tree['points'], cut_hierarchy(tree, max_radius)))
+	clean = df[['Latitude', 'Longitude']].dropna()
+	df.loc[clean.index, 'Geo Group'] = [
+		labels[_point_key(lat, lon)] for lat, lon in clean.values]
+	return df
+
+def main(df=None):
+	"""Clusters the scraped campgrounds and writes config.analyzed_file.
+
+	Args:
+	    df (pandas.DataFrame, optional): scraped campground table, e.g.
+	        from :func:`scrape_campsite_data.typed_campground_table`.
+	        Read from config.scraped_file if not given.
+
+	Returns:
+	    pandas.DataFrame: the analyzed table
+	"""
+	if df is None:
+		df = pd.read_csv(config.scraped_file)
+	if config.grouping_method == 'hierarchy':
+		result = df.groupby('Forest').apply(
+			hierarchy_group_points, max_radius=config.max_radius)
+	else:
+		result = df.groupby('Forest').apply(
+			cached_group_points, max_radius=config.max_radius)
+	if config.feature_files:
+		import natural_features
+		result = natural_features.add_nearest_features(result)
+	if config.home_location and config.road_network_file:
+		# cached per coordinate, so only new campgrounds are routed
+		import drive_times
+		result = drive_times.add_drive_times(result)
+	# written whole, then renamed, so the query service never reads half a table
+	temp = config.analyzed_file + '.tmp'
+	result.to_csv(temp, index=False)
+	os.rename(temp, config.analyzed_file)
+	if config.write_summaries:
+		import aggregates
+		aggregates.update_summaries(result)
+	return result
 
 if __name__ == '__main__':
 	main()
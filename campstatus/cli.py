@@ -0,0 +1,309 @@
+"""Command line entry point for campstatus
+
+Usage::
+
+    python cli.py scrape [--pipeline [--types TYPE ...] | --deadline SECONDS]
+    python cli.py status [URL ...]
+    python cli.py analyze
+    python cli.py summarize [--full]
+    python cli.py compact
+    python cli.py run [--keep-scraped]
+    python cli.py sync-sheet
+    python cli.py publish [--dry-run]
+    python cli.py drive-times
+    python cli.py serve
+    python cli.py export-map
+    python cli.py refresh [--once] [--sheet]
+    python cli.py daemon
+    python cli.py job NAME [--urls URL ...] [--forests FOREST ...]
+                  [--max-age SECONDS] [--no-persist] [--caches CACHE ...]
+    python cli.py startup
+
+Each subcommand imports only the modules it needs, when it runs, so
+that e.g. a status check does not pay for pandas, scikit-learn or the
+Google Sheets client.
+
+Attributes:
+    COMMAND_MODULES (dict): modules of this package each subcommand
+        imports, with any of its options. Used by :func:`measure_startup`
+        to time the cold start of a subcommand; tests/test_cli.py checks
+        it against the imports of the handlers.
+
+"""
+import argparse
+import subprocess
+import sys
+import time
+import config
+
+COMMAND_MODULES = {
+    'scrape': ['scrape_campsite_data', 'deadline_scrape', 'pipeline'],
+    'status': ['update_campstatus'],
+    'analyze': ['analyze_campgrounds'],
+    'summarize': ['aggregates'],
+    'compact': ['compact_table'],
+    'run': ['scrape_campsite_data', 'analyze_campgrounds'],
+    'sync-sheet': ['update_campstatus'],
+    'publish': ['publish_sheet'],
+    'drive-times': ['drive_times'],
+    'serve': ['query_service'],
+    'export-map': ['export_map'],
+    'refresh': ['refresh_scheduler'],
+    'daemon': ['scrape_daemon'],
+    'job': ['scrape_daemon'],
+    }
+
+def scrape(args):
+    """Scrapes the forests in config.forests_to_scrape to config.scraped_file"""
+    if args.deadline is not None:
+        import deadline_scrape
+        deadline_scrape.main(args.deadline)
+    elif args.pipeline:
+        import pipeline
+        pipeline.main(args.types)
+    else:
+        import scrape_campsite_data
+        scrape_campsite_data.main()
+
+def status(args):
+    """Prints the status of the given campground URLs
+
+    Without URLs, every campground of update_campstatus.FOREST_URLS is
+    checked.
+    """
+    import update_campstatus as uc
+    if args.urls:
+        campgrounds = [[url, url] for url in args.urls]
+    else:
+        campgrounds = uc.list_campgrounds(uc.FOREST_URLS)
+    for name, url in campgrounds:
+        print u'{}\t{}'.format(name, uc.get_campground_status(url))
+
+def analyze(args):
+    """Clusters config.scraped_file into config.analyzed_file"""
+    import analyze_campgrounds
+    analyze_campgrounds.main()
+
+def summarize(args):
+    """Updates the forest and Geo Group summaries of config.analyzed_file"""
+    import aggregates
+    aggregates.main(full=args.full)
+
+def compact(args):
+    """Writes config.analyzed_file as a compact table and reports memory use"""
+    import compact_table
+    compact_table.main()
+
+def run(args):
+    """Scrapes and analyzes in one go, without re-reading the scraped csv
+
+    The scraped table is handed to the analysis in memory, with its
+    numeric columns typed. config.scraped_file is only written with
+    --keep-scraped.
+    """
+    import scrape_campsite_data as scd
+    import analyze_campgrounds
+    scraped = scd.main(persist=args.keep_scraped)
+    analyze_campgrounds.main(scd.typed_campground_table(scraped))
+
+def sync_sheet(args):
+    """Updates the campground statuses in the Google sheet"""
+    import update_campstatus
+    update_campstatus.main()
+
+def publish(args):
+    """Mirrors config.analyzed_file to the config.publish_sheet_key sheet"""
+    import publish_sheet
+    publish_sheet.main(dry_run=args.dry_run)
+
+def drive_times(args):
+    """Adds drive times from config.home_location to config.analyzed_file"""
+    import drive_times
+    drive_times.main()
+
+def serve(args):
+    """Serves JSON queries over config.analyzed_file on config.query_port"""
+    import query_service
+    query_service.main()
+
+def export_map(args):
+    """Writes GeoJSON and map tiles of config.analyzed_file to config.map_dir"""
+    import export_map
+    export_map.main()
+
+def refresh(args):
+    """Keeps campground statuses fresh, checking each page as often as needed
+
+    Intervals adapt to each campground's Open Season and how often its
+    page changes, see refresh_scheduler.py.
+    """
+    import refresh_scheduler
+    refresh_scheduler.main(sheet=args.sheet, once=args.once)
+
+def daemon(args):
+    """Runs the resident scraper daemon on config.daemon_socket
+
+    Sessions, listings, parsed pages and the Google sheet are kept warm
+    between jobs, see scrape_daemon.py.
+    """
+    import scrape_daemon
+    scrape_daemon.main()
+
+def job(args):
+    """Runs a job on the scraper daemon and prints its result"""
+    import json
+    import scrape_daemon
+    params = {}
+    if args.urls:
+        params['urls'] = args.urls
+    if args.forests:
+        params['forests'] = args.forests
+    if args.max_age is not None:
+        params['max_age'] = args.max_age
+    if args.no_persist:
+        params['persist'] = False
+    if args.caches:
+        params['caches'] = args.caches
+    try:
+        result = scrape_daemon.send(args.name, **params)
+    except scrape_daemon.DaemonError as e:
+        print e
+        sys.exit(1)
+    if 'statuses' in result:
+        for row in result.pop('statuses'):
+            print u'{}\t{}'.format(row['name'], row['status'])
+    print json.dumps(result, sort_keys=True)
+
+def measure_startup(command, repeat=3):
+    """Measures the cold start time of a subcommand.
+
+    A fresh interpreter imports this module and the modules of
+    `command`, which is what a cron invocation pays before doing any
+    work.
+
+    Args:
+        command (str): name of the subcommand.
+        repeat (int, optional): number of runs; the fastest is kept.
+
+    Returns:
+        float: seconds to start up.
+    """
+    code = 'import cli\n' + ''.join(
+        'import {}\n'.format(m) for m in COMMAND_MODULES[command])
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def startup(args):
+    """Prints cold start times and fails if one is over budget"""
+    budget = config.cli_startup_budget
+    over = False
+    for command in sorted(COMMAND_MODULES):
+        elapsed = measure_startup(command)
+        flag = ''
+        if elapsed > budget:
+            over = True
+            flag = '  OVER BUDGET'
+        print '{:<12}{:>8.3f}s{}'.format(command, elapsed, flag)
+    print 'budget: {}s'.format(budget)
+    if over:
+        sys.exit(1)
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='campstatus',
+        description='Scrape and analyze National Forest campgrounds')
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('scrape', help=scrape.__doc__)
+    p.add_argument('--pipeline', action='store_true',
+                   help='use the staged fetch/parse pipeline')
+    p.add_argument('--types', nargs='+', metavar='TYPE',
+                   help='recreation types to scrape with --pipeline, '
+                        'e.g. campgrounds trailheads (default: '
+                        'config.recreation_types_to_scrape)')
+    p.add_argument('--deadline', type=float, metavar='SECONDS',
+                   help='finish within SECONDS, fetching the most important '
+                        'campgrounds first and keeping the last known values '
+                        'of the rest')
+    p.set_defaults(func=scrape)
+
+    p = sub.add_parser('status', help=status.__doc__.splitlines()[0])
+    p.add_argument('urls', nargs='*', help='campground URLs')
+    p.set_defaults(func=status)
+
+    p = sub.add_parser('analyze', help=analyze.__doc__)
+    p.set_defaults(func=analyze)
+
+    p = sub.add_parser('summarize', help=summarize.__doc__)
+    p.add_argument('--full', action='store_true',
+                   help='recompute every summary row')
+    p.set_defaults(func=summarize)
+
+    p = sub.add_parser('compact', help=compact.__doc__)
+    p.set_defaults(func=compact)
+
+    p = sub.add_parser('run', help=run.__doc__.splitlines()[0])
+    p.add_argument('--keep-scraped', action='store_true',
+                   help='also write config.scraped_file')
+    p.set_defaults(func=run)
+
+    p = sub.add_parser('sync-sheet', help=sync_sheet.__doc__)
+    p.set_defaults(func=sync_sheet)
+
+    p = sub.add_parser('publish', help=publish.__doc__)
+    p.add_argument('--dry-run', action='store_true',
+                   help='diff against an empty in-memory sheet')
+    p.set_defaults(func=publish)
+
+    p = sub.add_parser('drive-times', help=drive_times.__doc__)
+    p.set_defaults(func=drive_times)
+
+    p = sub.add_parser('serve', help=serve.__doc__)
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser('export-map', help=export_map.__doc__)
+    p.set_defaults(func=export_map)
+
+    p = sub.add_parser('refresh', help=refresh.__doc__.splitlines()[0])
+    p.add_argument('--once', action='store_true',
+                   help='check the campgrounds that are due, then exit')
+    p.add_argument('--sheet', action='store_true',
+                   help='write status changes to the Google sheet')
+    p.set_defaults(func=refresh)
+
+    p = sub.add_parser('daemon', help=daemon.__doc__.splitlines()[0])
+    p.set_defaults(func=daemon)
+
+    p = sub.add_parser('job', help=job.__doc__)
+    p.add_argument('name', choices=['ping', 'status', 'scrape', 'sync-sheet',
+                                    'flush', 'stop'])
+    p.add_argument('--urls', nargs='+', metavar='URL',
+                   help='campgrounds to check with the status job')
+    p.add_argument('--forests', nargs='+', metavar='FOREST',
+                   help='forest URL descriptors to scrape with the scrape '
+                        'job (default: config.forests_to_scrape)')
+    p.add_argument('--max-age', type=float, metavar='SECONDS',
+                   help='refetch pages older than SECONDS (default: '
+                        'config.daemon_page_ttl)')
+    p.add_argument('--no-persist', action='store_true',
+                   help='do not write config.scraped_file with the scrape job')
+    p.add_argument('--caches', nargs='+', choices=['pages', 'catalog', 'sheet'],
+                   help='caches to empty with the flush job (default: all)')
+    p.set_defaults(func=job)
+
+    p = sub.add_parser('startup', help=startup.__doc__)
+    p.set_defaults(func=startup)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+"""Compact, array-backed analyzed campground table
+
+Read with pandas.read_csv, the analyzed table keeps one Python string
+per row in its text columns. Elevation ends up in an object column when
+some elevations could not be read. A nationwide table spends most of
+its memory on those objects. :class:`CompactTable` keeps each column
+as a few numpy arrays instead:
+
+* names and URLs, which are nearly unique: one UTF-8 buffer and the
+  offset of every row in it,
+* other text (Status, Forest, Reservations, Restroom, ...): a small
+  integer code per row into the column's distinct values,
+* Latitude and Longitude: float32, which is still within a meter,
+* Elevation, Geo Group and Campground ID: the smallest integer type
+  that holds them, with a bit-packed mask of missing values,
+* True/False columns such as Potable Water: bit-packed values, with
+  bit-packed known flags.
+
+Tables are saved with numpy.savez as plain arrays (no pickling), and
+loaded without parsing any text. :meth:`CompactTable.isin`,
+:meth:`CompactTable.between` and :meth:`CompactTable.take` filter on
+the arrays directly.
+
+Example::
+
+    python cli.py compact
+    table = CompactTable.load(config.compact_table_file)
+    rows = table.isin('Status', ['Open']) & table.between('Elevation', 0, 6000)
+    df = table.take(rows).to_frame()
+
+"""
+import time
+import numpy as np
+import pandas as pd
+import config
+
+# columns with a fixed kind; the others are inferred, see _infer_kind
+COLUMN_KINDS = {
+    'Campground': 'text',
+    'URL': 'text',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Elevation': 'int',
+    'Geo Group': 'int',
+    'Campground ID': 'int',
+    'Potable Water': 'bool',
+    }
+
+# text columns with more distinct values than this share of the rows are
+# kept as text instead of codes
+CATEGORY_SHARE = 0.5
+
+def _pack(mask):
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+def _unpack(bits, n):
+    return np.unpackbits(bits)[:n].astype(bool)
+
+def _missing(values):
+    """True where a table value is missing ('' counts as missing)"""
+    return np.array([v is None or (isinstance(v, float) and v != v) or
+                     (isinstance(v, basestring) and not v.strip())
+                     for v in values], dtype=bool)
+
+def _smallest_int(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+class TextColumn(object):
+    """Strings in one UTF-8 buffer, row i at buffer[offsets[i]:offsets[i+1]]"""
+
+    kind = 'text'
+
+    def __init__(self, buffer, offsets, missing):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.missing = missing
+
+    @classmethod
+    def from_values(cls, values):
+        values = list(values)
+        missing = _missing(values)
+        encoded = ['' if m else
+                   (v if isinstance(v, unicode) else unicode(v)).encode('utf-8')
+                   for v, m in zip(values, missing)]
+        lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if offsets[-1] < np.iinfo(np.int32).max:
+            offsets = offsets.astype(np.int32)
+        buffer = np.frombuffer(''.join(encoded), dtype=np.uint8).copy()
+        return cls(buffer, offsets, _pack(missing))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes + self.missing.nbytes
+
+    def values(self):
+        raw = self.buffer.tostring()
+        offsets = self.offsets.tolist()
+        missing = _unpack(self.missing, len(self))
+        return np.array([
+            np.nan if m else raw[start:stop].decode('utf-8')
+            for start, stop, m in zip(offsets[:-1], offsets[1:], missing)],
+            dtype=object)
+
+    def take(self, rows):
+        starts = self.offsets[:-1][rows].astype(np.int64)
+        lengths = self.offsets[1:][rows] - starts
+        offsets = np.zeros(len(starts) + 1, dtype=self.offsets.dtype)
+        np.cumsum(lengths, out=offsets[1:])
+        # byte j of the new buffer comes from starts[row of j] plus its
+        # place within the row
+        gather = (np.repeat(starts - offsets[:-1], lengths) +
+                  np.arange(offsets[-1]))
+        missing = _unpack(self.missing, len(self))[rows]
+        return TextColumn(self.buffer[gather], offsets, _pack(missing))
+
+    def isin(self, values):
+        wanted = set((v if isinstance(v, unicode) else unicode(v))
+                     .encode('utf-8') for v in values)
+        raw = self.buffer.tostring()
+        offsets = self.offsets.tolist()
+        missing = _unpack(self.missing, len(self))
+        return np.array([
+            not m and raw[start:stop] in wanted
+            for start, stop, m in zip(offsets[:-1], offsets[1:], missing)],
+            dtype=bool)
+
+    def arrays(self):
+        return {'buffer': self.buffer, 'offsets': self.offsets,
+                'missing': self.missing}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['buffer'], arrays['offsets'], arrays['missing'])
+
+class CategoryColumn(object):
+    """Code per row into the column's distinct values; -1 is missing"""
+
+    kind = 'category'
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=object)
+        missing = _missing(values)
+        present = np.array([v if isinstance(v, unicode) else unicode(v)
+                            for v in values[~missing]], dtype=object)
+        uniques, inverse = np.unique(present, return_inverse=True)
+        codes = np.full(len(values), -1,
+                        dtype=_smallest_int(-1, max(len(uniques) - 1, 0)))
+        codes[~missing] = inverse
+        return cls(codes, TextColumn.from_values(uniques))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+    def values(self):
+        return pd.Categorical.from_codes(
+            self.codes.astype(np.int64), self.categories.values())
+
+    def take(self, rows):
+        return CategoryColumn(self.codes[rows], self.categories)
+
+    def isin(self, values):
+        wanted = set(v if isinstance(v, unicode) else unicode(v)
+                     for v in values)
+        codes = [i for i, c in enumerate(self.categories.values())
+                 if c in wanted]
+        return np.in1d(self.codes, codes)
+
+    def arrays(self):
+        arrays = {'codes': self.codes}
+        for name, array in self.categories.arrays().iteritems():
+            arrays['categories.' + name] = array
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        categories = TextColumn.from_arrays(dict(
+            (name[len('categories.'):], array)
+            for name, array in arrays.iteritems()
+            if name.startswith('categories.')))
+        return cls(arrays['codes'], categories)
+
+class FloatColumn(object):
+    """Floating point values; NaN is missing"""
+
+    kind = 'float'
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_values(cls, values, dtype=np.float64):
+        return cls(pd.to_numeric(pd.Series(values), errors='coerce')
+                   .values.astype(dtype))
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def values(self):
+        return self.data
+
+    def take(self, rows):
+        return FloatColumn(self.data[rows])
+
+    def between(self, low, high):
+        return (self.data >= low) & (self.data <= high)
+
+    def isin(self, values):
+        return np.in1d(self.data, np.asarray(values, dtype=self.data.dtype))
+
+    def arrays(self):
+        return {'data': self.data}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['data'])
+
+class IntColumn(object):
+    """Integers in the smallest type that holds them, with a missing mask"""
+
+    kind = 'int'
+
+    def __init__(self, data, missing):
+        self.data = data
+        self.missing = missing
+
+    @classmethod
+    def from_values(cls, values):
+        numbers = pd.to_numeric(pd.Series(values), errors='coerce').values
+        missing = np.isnan(numbers.astype(float))
+        known = numbers[~missing]
+        if len(known) and not np.all(np.mod(known, 1) == 0):
+            raise ValueError('not all values are integers')
+        if len(known):
+            dtype = _smallest_int(known.min(), known.max())
+        else:
+            dtype = np.int8
+        data = np.zeros(len(numbers), dtype=dtype)
+        data[~missing] = known
+        return cls(data, _pack(missing))
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.missing.nbytes
+
+    def mask(self):
+        """True where a value is missing"""
+        return _unpack(self.missing, len(self))
+
+    def values(self):
+        return pd.arrays.IntegerArray(self.data, self.mask())
+
+    def take(self, rows):
+        return IntColumn(self.data[rows], _pack(self.mask()[rows]))
+
+    def between(self, low, high):
+        return (self.data >= low) & (self.data <= high) & ~self.mask()
+
+    def isin(self, values):
+        return np.in1d(self.data, values) & ~self.mask()
+
+    def arrays(self):
+        return {'data': self.data, 'missing': self.missing}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['data'], arrays['missing'])
+
+class BoolColumn(object):
+    """Bit-packed True/False values, with bit-packed known flags"""
+
+    kind = 'bool'
+
+    def __init__(self, bits, known, length):
+        self.bits = bits
+        self.known = known
+        self.length = length
+
+    @classmethod
+    def from_values(cls, values):
+        values = list(values)
+        flags = [_bool_value(v) for v in values]
+        return cls(_pack([f is True for f in flags]),
+                   _pack([f is not None for f in flags]), len(values))
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes + self.known.nbytes
+
+    def values(self):
+        bits = _unpack(self.bits, self.length)
+        known = _unpack(self.known, self.length)
+        values = bits.astype(object)
+        values[~known] = np.nan
+        return values
+
+    def take(self, rows):
+        bits = _unpack(self.bits, self.length)[rows]
+        known = _unpack(self.known, self.length)[rows]
+        return BoolColumn(_pack(bits), _pack(known), len(bits))
+
+    def isin(self, values):
+        bits = _unpack(self.bits, self.length)
+        known = _unpack(self.known, self.length)
+        found = np.zeros(self.length, dtype=bool)
+        for value in set(_bool_value(v) for v in values):
+            if value is not None:
+                found |= known & (bits == value)
+        return found
+
+    def arrays(self):
+        return {'bits': self.bits, 'known': self.known,
+                'length': np.array([self.length], dtype=np.int64)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['bits'], arrays['known'], int(arrays['length'][0]))
+
+COLUMN_TYPES = dict((c.kind, c) for c in (
+    TextColumn, CategoryColumn, FloatColumn, IntColumn, BoolColumn))
+
+def _bool_value(value):
+    """True, False, or None for anything else"""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, basestring):
+        return {'true': True, 'false': False}.get(value.strip().lower())
+    return None
+
+def _infer_kind(series):
+    """Kind of a column not in COLUMN_KINDS"""
+    values = series.values
+    missing = _missing(values)
+    present = values[~missing]
+    if len(present) and all(_bool_value(v) is not None for v in present):
+        return 'bool'
+    if series.dtype.kind in 'iuf':
+        return 'float'
+    if len(set(present)) <= CATEGORY_SHARE * max(len(values), 1):
+        return 'category'
+    return 'text'
+
+def _build_column(series, kind):
+    if kind == 'float32':
+        return FloatColumn.from_values(series.values, np.float32)
+    if kind == 'int':
+        try:
+            return IntColumn.from_values(series.values)
+        except ValueError:
+            return FloatColumn.from_values(series.values)
+    return COLUMN_TYPES[kind].from_values(series.values)
+
+class CompactTable(object):
+    """Campground table with every column kept as numpy arrays.
+
+    Attributes:
+        columns (list(str, )): column names, in order.
+        data (dict): column name to column.
+    """
+
+    def __init__(self, columns, data):
+        self.columns = list(columns)
+        self.data = data
+
+    @classmethod
+    def from_frame(cls, df, kinds=None):
+        """Builds a compact table.
+
+        Args:
+            df (pandas.DataFrame): e.g. the analyzed table.
+            kinds (dict, optional): column name to 'text', 'category',
+                'float', 'float32', 'int' or 'bool', for columns whose
+                kind should not be inferred. Defaults to COLUMN_KINDS.
+
+        Returns:
+            CompactTable
+        """
+        kinds = COLUMN_KINDS if kinds is None else kinds
+        data = {}
+        for column in df.columns:
+            kind = kinds.get(column) or _infer_kind(df[column])
+            data[column] = _build_column(df[column], kind)
+        return cls(df.columns, data)
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(self.data[self.columns[0]])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.data.itervalues())
+
+    def memory_usage(self):
+        """Bytes used by each column"""
+        return pd.Series([self.data[c].nbytes for c in self.columns],
+                         index=self.columns)
+
+    def to_frame(self, columns=None):
+        """The table as a DataFrame, with categorical text columns and
+        nullable integer columns"""
+        columns = columns or self.columns
+        return pd.DataFrame(
+            dict((c, self.data[c].values()) for c in columns),
+            columns=columns)
+
+    def isin(self, column, values):
+        """Rows whose `column` is one of `values`, as a boolean mask"""
+        return self.data[column].isin(values)
+
+    def between(self, column, low=-np.inf, high=np.inf):
+        """Rows whose numeric `column` is within [low, high]"""
+        return self.data[column].between(low, high)
+
+    def take(self, rows):
+        """Table of the rows selected by a boolean mask or positions"""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return CompactTable(self.columns, dict(
+            (c, self.data[c].take(rows)) for c in self.columns))
+
+    def save(self, path):
+        """Saves every column's arrays to one .npz file"""
+        arrays = {}
+        kinds = []
+        for i, column in enumerate(self.columns):
+            kinds.append(self.data[column].kind)
+            for name, array in self.data[column].arrays().iteritems():
+                arrays['{}/{}'.format(i, name)] = array
+        names = TextColumn.from_values(self.columns)
+        for name, array in names.arrays().iteritems():
+            arrays['columns/' + name] = array
+        arrays['kinds'] = np.array(kinds, dtype='S8')
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a table written by :meth:`save`"""
+        with np.load(path, allow_pickle=False) as saved:
+            arrays = dict((name, saved[name]) for name in saved.files)
+        grouped = {}
+        for name, array in arrays.iteritems():
+            head, _, rest = name.partition('/')
+            grouped.setdefault(head, {})[rest] = array
+        columns = list(TextColumn.from_arrays(grouped['columns']).values())
+        data = {}
+        for i, (column, kind) in enumerate(zip(columns, arrays['kinds'])):
+            data[column] = COLUMN_TYPES[kind].from_arrays(grouped[str(i)])
+        return cls(columns, data)
+
+def memory_report(df, table):
+    """Bytes per column of a DataFrame and of its compact table.
+
+    Returns:
+        pandas.DataFrame: 'DataFrame' and 'Compact' bytes and their
+            'Ratio' for every column, and a 'Total' row.
+    """
+    report = pd.DataFrame({
+        'DataFrame': df.memory_usage(index=False, deep=True),
+        'Compact': table.memory_usage(),
+        }, columns=['DataFrame', 'Compact'])
+    report.loc['Total'] = report.sum()
+    report['Ratio'] = (report['DataFrame'] /
+                       report['Compact'].replace(0, np.nan)).round(1)
+    return report
+
+def main(path=None, out_file=None):
+    """Builds the compact table of config.analyzed_file and reports on it"""
+    path = path or config.analyzed_file
+    out_file = out_file or config.compact_table_file
+    start = time.time()
+    df = pd.read_csv(path)
+    csv_seconds = time.time() - start
+    table = CompactTable.from_frame(df)
+    table.save(out_file)
+    start = time.time()
+    table = CompactTable.load(out_file)
+    load_seconds = time.time() - start
+    print memory_report(df, table).to_string()
+    print 'read {} in {:.3f}s, loaded {} in {:.3f}s'.format(
+        path, csv_seconds, out_file, load_seconds)
+    return table
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,166 @@
 # csv file to save when scraping, and/or to use for analyzing
 scraped_file = './scraped_campgrounds.csv'
 analyzed_file = './analyzed_campgrounds.csv'
+# array-backed copy of the analyzed table (see compact_table.py)
+compact_table_file = './analyzed_campgrounds.npz'
+
+# only build the parse tree of the parts of NFS pages that are read
+# (see extraction.parse_page)
+partial_parsing = True
+
+# fetching NFS pages (see fetch.py)
+# seconds to wait for a connection, and for data once connected
+connect_timeout = 5
+read_timeout = 30
+# attempts per page, and base seconds of the jittered backoff between them
+fetch_attempts = 4
+fetch_backoff = 1.0
+# concurrent requests: adapted between 1 and fetch_max_concurrency
+fetch_initial_concurrency = 4
+fetch_max_concurrency = 16
+# responses slower than this many seconds count as congestion
+fetch_target_latency = 2.0
+# pages in a row that could not be fetched from a host before its circuit
+# opens, seconds it stays open, and most seconds a request waits for it
+breaker_failures = 5
+breaker_cooldown = 60
+breaker_max_wait = 900
+# compressed transfer encodings to ask for, best first; those urllib3
+# cannot decode here (br needs the brotli package) are left out
+fetch_encodings = ['br', 'gzip', 'deflate']
+
+# fetched campground pages kept for debugging the parser (see
+# page_store.py). None keeps no pages.
+page_store_dir = None
+# keep only the parts of pages that are parsed (see
+# extraction.relevant_html), instead of the whole page
+page_store_strip = True
+# gzip level of stored pages
+page_store_level = 9
+
+# scraping within a time budget (see deadline_scrape.py)
+# campground names or Campground IDs fetched before all others
+starred_campgrounds = []
+# priority score of each reason to fetch a campground early
+deadline_priority_weights = {
+    'starred': 8,
+    'open': 4,
+    'changed': 2,
+    'in_season': 1,
+    }
+# seconds of the budget kept for building and saving the table
+deadline_margin = 2
+# most of the budget spent listing the forests' campgrounds
+deadline_listing_share = 0.25
+
+# staged scraping pipeline (see pipeline.py)
+# number of threads fetching campground pages (at most
+# fetch_max_concurrency of them request at once)
+fetch_threads = 16
+# number of processes parsing pages; None uses all cores
+parse_processes = None
+# most pages held between the fetch and parse stages
+pipeline_queue_size = 32
+# number of campgrounds munged and written to csv at a time
+pipeline_batch_size = 50
+
+# summary tables written by the analysis (see aggregates.py)
+group_summary_file = './geo_group_summary.csv'
+forest_summary_file = './forest_summary.csv'
+# hashes of the summarized campgrounds, to update the summaries incrementally
+summary_state_file = './summary_state.json'
+# update the summaries whenever config.analyzed_file is written
+write_summaries = True
+
+# how Geo Groups are made: 'kmeans' (analyze_campgrounds.group_points) or
+# 'hierarchy' (cut a stored clustering tree, for any radius)
+grouping_method = 'kmeans'
+# Geo Group radius in km; the query service's 'radius' parameter cuts the
+# clustering trees at other radii
+max_radius = 2.5
+
+# directory of cached Geo Group results per forest (see
+# analyze_campgrounds.cached_group_points). None disables the cache.
+cluster_cache_dir = './cluster_cache'
+# update the last grouping of a forest when only a few campgrounds were
+# added or removed, instead of rerunning KMeans
+incremental_clustering = True
+# rerun KMeans when the mean group radius exceeds max_radius by this fraction
+recluster_drift = 0.2
+# rerun KMeans when more than this fraction of campgrounds changed
+recluster_max_changed = 0.25
+
+# drive times from home (see drive_times.py); when both of these are set
+# the analysis adds them to config.analyzed_file
+# (latitude, longitude) of home, e.g. (37.8716, -122.2727)
+home_location = None
+# local OpenStreetMap extract (.osm XML) covering home and the forests
+road_network_file = None
+# directory of the compact road graph and cached drive times
+drive_time_cache_dir = './drive_time_cache'
+# campgrounds further than this many km from a road get no drive time
+max_snap_km = 5.0
+
+# natural features linked to campgrounds (see natural_features.py)
+# local GeoJSON files, mapped to the kind of feature they hold, e.g.
+# {'./gis/rivers.geojson': 'River', './gis/peaks.geojson': 'Peak'}
+feature_files = {}
+# property holding a feature's name
+feature_name_property = 'name'
+# directory of the prebuilt feature indexes
+feature_index_dir = './feature_index'
+
+# local JSON query service over config.analyzed_file (see query_service.py)
+query_host = '127.0.0.1'
+query_port = 8080
+# seconds between checks for a new analyzed file
+query_reload_interval = 5
+# results per page, when not given in the query, and most allowed
+query_page_size = 50
+query_max_page_size = 500
+
+# map export (see export_map.py)
+map_dir = './map'
+# zoom levels of the pre-computed tiles
+map_min_zoom = 5
+map_max_zoom = 12
+# points closer than this many pixels on a tile are shown as one cluster
+map_cluster_pixels = 40
+
+# adaptive refresh of campground pages (see refresh_scheduler.py)
+refresh_schedule_file = './refresh_schedule.json'
+# seconds between checks of an in-season campground: halved when its
+# page changed, multiplied by refresh_backoff when it did not
+refresh_min_interval = 5 * 60
+refresh_max_interval = 6 * 60 * 60
+refresh_backoff = 2.0
+# campgrounds whose status changed within refresh_volatile_window seconds
+# are checked at least every refresh_volatile_interval seconds
+refresh_volatile_window = 3 * 24 * 60 * 60
+refresh_volatile_interval = 30 * 60
+# seconds between checks of campgrounds out of their Open Season
+refresh_dormant_interval = 24 * 60 * 60
+# days before opening and after closing that still count as in season
+season_margin_days = 14
+# status changes remembered per campground
+refresh_history_size = 20
+# seconds between reads of the forests' campground listings
+refresh_listing_interval = 24 * 60 * 60
+
+# resident scraper daemon (see scrape_daemon.py)
+daemon_socket = './campstatus.sock'
+# seconds a parsed campground page is reused, and most pages kept
+daemon_page_ttl = 10 * 60
+daemon_page_cache_size = 20000
+# seconds a forest's campground listing is reused
+daemon_listing_ttl = 6 * 60 * 60
+# seconds the authorized Google sheet is reused before opening it again,
+# below the one hour lifetime of an access token
+daemon_sheet_ttl = 45 * 60
+
+# most seconds any `campstatus` subcommand may take to start up
+# (checked with `python cli.py startup`)
+cli_startup_budget = 1.5
 
 # desired final columns in the final table
 campgrounds_final_table_columns = [
@@ -30,8 +190,65 @@ campgrounds_final_table_columns = [
     'Usage',
     'Water',
     'URL',
+    'Campground ID',
     ]
 
+# desired final columns of the trailhead table
+trailheads_final_table_columns = [
+    'Trailhead',
+    'Status',
+    'Fees',
+    'Open Season',
+    'Restroom',
+    'Potable Water',
+    'Elevation',
+    'Latitude',
+    'Longitude',
+    'Usage',
+    'Water',
+    'URL',
+    'Campground ID',
+    ]
+
+# recreation types that can be scraped. For each:
+# activity: activity page of the forest linking to the type's listing
+# link: text of that link
+# heading: heading above the list of areas on the listing page
+# suffix: only areas whose name ends with this are kept (None keeps all)
+# name_column: column holding the area's name
+# columns: final columns of the type's table
+# out_file: csv the type's table is saved to
+recreation_types = {
+    'campgrounds': {
+        'activity': 'camping-cabins',
+        'link': 'Campground Camping',
+        'heading': 'Campground Camping Areas',
+        'suffix': 'Campground',
+        'name_column': 'Campground',
+        'columns': campgrounds_final_table_columns,
+        'out_file': scraped_file,
+        },
+    'trailheads': {
+        'activity': 'hiking',
+        'link': 'Day Hiking',
+        'heading': 'Day Hiking Areas',
+        'suffix': None,
+        'name_column': 'Trailhead',
+        'columns': trailheads_final_table_columns,
+        'out_file': './scraped_trailheads.csv',
+        },
+    }
+# recreation types scraped by `python cli.py scrape --pipeline`
+recreation_types_to_scrape = ['campgrounds']
+
+# Google sheet the analyzed table is published to (see publish_sheet.py)
+publish_sheet_key = None
+publish_worksheet = 'Campgrounds'
+# columns of the published table
+publish_columns = campgrounds_final_table_columns + ['Forest', 'Geo Group']
+# most ranges sent in one batched update call
+publish_ranges_per_call = 200
+
 # list of forests to scrape
 forests_to_scrape = [
 	'stanislaus',
@@ -0,0 +1,268 @@
+"""Scraping within a fixed time budget
+
+For a cron job with a hard time limit, :func:`scrape_with_deadline`
+fetches campgrounds in order of priority until the budget runs out,
+then returns a complete table straight away:
+
+* campgrounds fetched in time get fresh values,
+* the others carry forward their values from the last scraped table,
+  and their 'Scraped At' column tells how old those values are.
+
+Campgrounds not in the last table come first, then the score of
+:func:`priority`: starred (config.starred_campgrounds), currently open,
+in season, and recently changed (from the refresh schedule, see
+refresh_scheduler.py). Ties go to the campground with the oldest
+values.
+
+"""
+import datetime
+import os
+import threading
+import time
+import Queue
+import pandas as pd
+import fetch
+import identity
+import pipeline
+import scrape_campsite_data as scd
+import config
+
+def _now_text(now):
+    return datetime.datetime.utcfromtimestamp(now).strftime(
+        '%Y-%m-%dT%H:%M:%SZ')
+
+def load_previous(path=None):
+    """Last scraped table, or an empty one"""
+    path = path or config.scraped_file
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['URL'])
+    return pd.read_csv(path)
+
+def recently_changed(now=None):
+    """URLs whose status changed within config.refresh_volatile_window
+
+    Read from the refresh schedule, if one was kept.
+    """
+    if not os.path.exists(config.refresh_schedule_file):
+        return set()
+    import refresh_scheduler
+    now = time.time() if now is None else now
+    schedule = refresh_scheduler.RefreshSchedule()
+    return set(
+        url for url, entry in schedule.entries.iteritems()
+        if any(now - t < config.refresh_volatile_window
+               for t in entry['changes']))
+
+def priority(row, starred, changed, now):
+    """Priority score of a campground with last known values `row`.
+
+    Args:
+        row (dict): the campground's row of the last scraped table.
+        starred (set): starred campground names and Campground IDs.
+        changed (set): URLs whose status changed recently.
+        now (float): current time.
+
+    Returns:
+        int: higher is fetched first. Weights are in
+            config.deadline_priority_weights.
+    """
+    import refresh_scheduler
+
+    weights = config.deadline_priority_weights
+    score = 0
+    campground_id = row.get('Campground ID')
+    if isinstance(campground_id, float) and campground_id == campground_id:
+        campground_id = int(campground_id)
+    if (row.get('Campground') in starred or
+            unicode(campground_id) in starred):
+        score += weights['starred']
+    status = row.get('Status')
+    if isinstance(status, basestring) and 'open' in status.lower():
+        score += weights['open']
+    season = refresh_scheduler.parse_open_season(row.get('Open Season'))
+    if refresh_scheduler.in_season(
+            season, datetime.date.fromtimestamp(now)) is not False:
+        score += weights['in_season']
+    if row.get('URL') in changed:
+        score += weights['changed']
+    return score
+
+def prioritize(jobs, previous, starred=None, changed=None, now=None):
+    """Orders campgrounds to fetch, most important first.
+
+    Args:
+        jobs (list(tuple(str, str, str), )): (forest, campground name,
+            campground URL) of each campground.
+        previous (pandas.DataFrame): last scraped table.
+        starred (iterable, optional): Defaults to
+            config.starred_campgrounds.
+        changed (set, optional): Defaults to :func:`recently_changed`.
+        now (float, optional): current time.
+
+    Returns:
+        list(tuple(str, str, str), ): `jobs`, sorted.
+    """
+    now = time.time() if now is None else now
+    starred = set(unicode(s) for s in (
+        config.starred_campgrounds if starred is None else starred))
+    changed = recently_changed(now) if changed is None else changed
+    known = dict((row['URL'], row) for row in
+                 previous.to_dict('records'))
+
+    def key(job):
+        row = known.get(job[2])
+        if row is None:
+            return (0, 0, '')
+        scraped_at = row.get('Scraped At')
+        if not isinstance(scraped_at, basestring):
+            scraped_at = ''
+        return (1, -priority(row, starred, changed, now), scraped_at)
+    return sorted(jobs, key=key)
+
+def _list_campgrounds(forests, found):
+    """Collects (forest, name, URL) of every forest into `found`"""
+    for forest in forests:
+        full_name = config.AllNationalForests[forest]
+        try:
+            listing = scd.get_campground_urls(scd.get_forest_rec_url(forest))
+        except (fetch.FetchError, ValueError, IndexError) as e:
+            print 'could not list {}: {}'.format(full_name, e)
+            continue
+        found[full_name] = [(full_name, name, url) for name, url in listing]
+
+def fetch_until(jobs, deadline, threads=None):
+    """Fetches and parses campgrounds in order until a deadline.
+
+    Pages that are still being fetched at the deadline are abandoned.
+
+    Args:
+        jobs (list(tuple(str, str, str), )): in priority order.
+        deadline (float): time to stop at.
+        threads (int, optional): Defaults to config.fetch_threads.
+
+    Returns:
+        dict: URL to parsed page of every campground fetched in time.
+    """
+    queue = Queue.Queue()
+    for job in jobs:
+        queue.put(job)
+    results = {}
+    lock = threading.Lock()
+
+    def worker():
+        while time.time() < deadline:
+            try:
+                forest, name, url = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                html = scd.fetch_campground_page(url)
+                data = scd.parse_campground_page(html, url)
+            except Exception as e:
+                print 'could not scrape {}: {}'.format(url, e)
+                continue
+            data['Campground'] = name
+            data['Forest'] = forest
+            with lock:
+                if time.time() < deadline:
+                    results[url] = data
+
+    workers = [threading.Thread(target=worker)
+               for _ in range(threads or config.fetch_threads)]
+    for t in workers:
+        t.daemon = True
+        t.start()
+    for t in workers:
+        t.join(max(deadline - time.time(), 0))
+    with lock:
+        return dict(results)
+
+def scrape_with_deadline(seconds, forests=None, previous=None):
+    """Scrapes as many campgrounds as fit in `seconds`, most important first.
+
+    Args:
+        seconds (float): time budget, including listing the forests.
+        forests (list(str, ), optional): forest URL descriptors.
+            Defaults to config.forests_to_scrape.
+        previous (pandas.DataFrame, optional): last scraped table.
+            Defaults to :func:`load_previous`.
+
+    Returns:
+        pandas.DataFrame: munged table of every known campground, with
+            a 'Scraped At' column (UTC) telling when each row's values
+            were scraped.
+    """
+    start = time.time()
+    deadline = start + seconds - config.deadline_margin
+    forests = forests or config.forests_to_scrape
+    previous = load_previous() if previous is None else previous.copy()
+    if 'Scraped At' not in previous:
+        previous['Scraped At'] = None
+
+    # listings get a share of the budget; forests not listed in time
+    # fall back to the campgrounds of the last table
+    found = {}
+    lister = threading.Thread(target=_list_campgrounds, args=(forests, found))
+    lister.daemon = True
+    lister.start()
+    lister.join(seconds * config.deadline_listing_share)
+    found = dict(found)
+    jobs = []
+    for forest in forests:
+        full_name = config.AllNationalForests[forest]
+        listed = found.get(full_name)
+        if listed is None:
+            if 'Forest' not in previous:
+                continue
+            rows = previous[previous['Forest'] == full_name]
+            listed = zip(rows['Forest'], rows['Campground'], rows['URL'])
+        jobs.extend(listed)
+
+    jobs = prioritize(jobs, previous, now=start)
+    results = fetch_until(jobs, deadline)
+    print 'scraped {} of {} campgrounds in {:.0f}s'.format(
+        len(results), len(jobs), time.time() - start)
+
+    scraped_at = _now_text(time.time())
+    columns = config.campgrounds_final_table_columns + ['Forest']
+    parts = []
+    if results:
+        fresh = pd.concat([pipeline._campground_frame(data)
+                           for data in results.itervalues()])
+        fresh = pd.concat([pd.DataFrame(columns=scd.MUNGED_COLUMNS),
+                           fresh.reset_index(drop=True)], sort=False)
+        fresh = scd.munge_campground_data(fresh, columns)
+        fresh['Scraped At'] = scraped_at
+        parts.append(fresh)
+    job_urls = set(url for _, _, url in jobs)
+    stale = previous[previous['URL'].isin(job_urls) &
+                     ~previous['URL'].isin(results)]
+    if len(stale):
+        parts.append(stale.reindex(columns=columns + ['Scraped At']))
+    # campgrounds never scraped before and not reached this time
+    known = set(previous['URL'])
+    unseen = [(forest, name, url) for forest, name, url in jobs
+              if url not in results and url not in known]
+    if unseen:
+        forest, name, url = zip(*unseen)
+        parts.append(pd.DataFrame({
+            'Forest': forest,
+            'Campground': name,
+            'URL': url,
+            'Campground ID': [identity.campground_id(u) for u in url],
+            }).reindex(columns=columns + ['Scraped At']))
+    if not parts:
+        return pd.DataFrame(columns=columns + ['Scraped At'])
+    return pd.concat(parts, sort=False).reset_index(drop=True)
+
+def main(seconds, persist=True):
+    """Scrapes within `seconds` and writes config.scraped_file.
+
+    Returns:
+        pandas.DataFrame: see :func:`scrape_with_deadline`.
+    """
+    final = scrape_with_deadline(seconds)
+    if persist:
+        final.to_csv(config.scraped_file, index=False, encoding='utf-8')
+    scd.report_traffic()
+    return final
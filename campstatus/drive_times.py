@@ -0,0 +1,295 @@
+"""Driving times from home to every campground, computed offline
+
+A local OpenStreetMap extract is loaded once into a compact graph
+(compressed sparse rows of travel minutes) and saved next to the other
+caches. Home and the campgrounds are snapped to their nearest road
+nodes, and one Dijkstra pass from home gives the driving time to all
+of them. The parsed graph and the drive time of every coordinate are
+cached, so a repeated run with the same roads, home and campgrounds
+does no parsing or routing at all.
+
+Attributes:
+    SPEED_KMH (dict): assumed speed for each OSM highway type, used when
+        a way has no usable maxspeed tag.
+
+"""
+import hashlib
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import config
+
+SPEED_KMH = {
+    'motorway': 105,
+    'trunk': 90,
+    'primary': 80,
+    'secondary': 70,
+    'tertiary': 60,
+    'unclassified': 45,
+    'residential': 35,
+    'motorway_link': 60,
+    'trunk_link': 50,
+    'primary_link': 45,
+    'secondary_link': 40,
+    'tertiary_link': 35,
+    'living_street': 15,
+    'service': 20,
+    'track': 15,
+    }
+
+# speed assumed between a campground or home and its nearest road node
+OFF_ROAD_KMH = 20.0
+
+EARTH_RADIUS_KM = 6371.0088
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in km, vectorized over numpy arrays"""
+    lat1, lon1, lat2, lon2 = [np.radians(v) for v in (lat1, lon1, lat2, lon2)]
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+def _speed(tags):
+    """Travel speed of a way in km/h, or None if cars can't use it"""
+    highway = tags.get('highway')
+    if highway not in SPEED_KMH:
+        return None
+    maxspeed = re.match('(\d+)\s*(mph)?', tags.get('maxspeed', ''))
+    if maxspeed is not None:
+        speed = float(maxspeed.group(1))
+        if maxspeed.group(2):
+            speed *= 1.609344
+        if speed > 0:
+            return speed
+    return float(SPEED_KMH[highway])
+
+def _iter_osm(path, tag):
+    """Yields the top level `tag` elements of an OSM XML file.
+
+    Each element is cleared from the tree once the caller is done with
+    it, so memory stays flat however large the file is.
+    """
+    from xml.etree import cElementTree as ET
+
+    context = ET.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == tag:
+            yield elem
+            root.clear()
+
+def load_osm(path):
+    """Reads the drivable roads of an OSM XML extract into a compact graph.
+
+    The file is read twice: once for the drivable ways, then for the
+    coordinates of only the nodes those ways use.
+
+    Args:
+        path (str): .osm file.
+
+    Returns:
+        dict: 'lat' and 'lon' (float arrays, one per road node),
+            'indptr', 'indices' and 'minutes' (CSR adjacency of the
+            directed road graph).
+    """
+    from scipy.sparse import csr_matrix
+
+    ways = []
+    road_nodes = set()
+    for elem in _iter_osm(path, 'way'):
+        tags = dict((t.get('k'), t.get('v')) for t in elem.findall('tag'))
+        speed = _speed(tags)
+        if speed is not None:
+            refs = [nd.get('ref') for nd in elem.findall('nd')]
+            road_nodes.update(refs)
+            ways.append((refs, speed, tags.get('oneway', 'no')))
+
+    coords = {}
+    for elem in _iter_osm(path, 'node'):
+        if elem.get('id') in road_nodes:
+            coords[elem.get('id')] = (float(elem.get('lat')),
+                                      float(elem.get('lon')))
+    del road_nodes
+
+    # number only the nodes that are on a road
+    ids = {}
+    src, dst, minutes = [], [], []
+    for refs, speed, oneway in ways:
+        refs = [r for r in refs if r in coords]
+        if oneway == '-1':
+            refs = refs[::-1]
+        for a, b in zip(refs[:-1], refs[1:]):
+            i = ids.setdefault(a, len(ids))
+            j = ids.setdefault(b, len(ids))
+            (lat1, lon1), (lat2, lon2) = coords[a], coords[b]
+            t = _haversine(lat1, lon1, lat2, lon2) / speed * 60
+            src.append(i)
+            dst.append(j)
+            minutes.append(t)
+            if oneway not in ('yes', 'true', '1', '-1'):
+                src.append(j)
+                dst.append(i)
+                minutes.append(t)
+
+    lat = np.zeros(len(ids))
+    lon = np.zeros(len(ids))
+    for node, i in ids.iteritems():
+        lat[i], lon[i] = coords[node]
+    # csr_matrix sums duplicate edges; keep the faster one instead
+    order = np.lexsort((minutes, dst, src))
+    src = np.asarray(src)[order]
+    dst = np.asarray(dst)[order]
+    minutes = np.asarray(minutes)[order]
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    graph = csr_matrix(
+        (minutes[first], (src[first], dst[first])), shape=(len(ids), len(ids)))
+    return {
+        'lat': lat,
+        'lon': lon,
+        'indptr': graph.indptr,
+        'indices': graph.indices,
+        'minutes': graph.data,
+        }
+
+def _file_fingerprint(path):
+    """Identifies a version of a file by its name, size and mtime"""
+    stat = os.stat(path)
+    key = '{}:{}:{}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime)
+    return hashlib.sha1(key).hexdigest()
+
+def load_graph(path, cache_dir=None):
+    """Loads the compact road graph, parsing the OSM file only when needed.
+
+    Args:
+        path (str): .osm file.
+        cache_dir (str, optional): Defaults to config.drive_time_cache_dir.
+
+    Returns:
+        dict: see :func:`load_osm`, plus its 'fingerprint'.
+    """
+    cache_dir = cache_dir or config.drive_time_cache_dir
+    fingerprint = _file_fingerprint(path)
+    graph_file = os.path.join(cache_dir, 'graph_{}.npz'.format(fingerprint))
+    if os.path.exists(graph_file):
+        graph = dict(np.load(graph_file))
+    else:
+        graph = load_osm(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        np.savez(graph_file, **graph)
+    graph['fingerprint'] = fingerprint
+    return graph
+
+def snap(graph, lats, lons):
+    """Nearest road node of each point.
+
+    Args:
+        graph (dict): from :func:`load_graph`.
+        lats (numpy.array): latitudes of the points.
+        lons (numpy.array): longitudes of the points.
+
+    Returns:
+        tuple(numpy.array, numpy.array): node index of each point, and
+            the distance to it in km.
+    """
+    from scipy.spatial import cKDTree
+
+    # equirectangular projection is accurate enough to find the nearest node
+    scale = np.cos(np.radians(np.mean(graph['lat'])))
+    tree = cKDTree(np.column_stack([graph['lat'], graph['lon'] * scale]))
+    _, nodes = tree.query(np.column_stack([lats, np.asarray(lons) * scale]))
+    km = _haversine(lats, lons, graph['lat'][nodes], graph['lon'][nodes])
+    return nodes, km
+
+def drive_minutes(graph, home, lats, lons, max_snap_km=None):
+    """Driving time from home to each point, from one Dijkstra pass.
+
+    Args:
+        graph (dict): from :func:`load_graph`.
+        home (tuple(float, float)): latitude, longitude of home.
+        lats (numpy.array): latitudes of the campgrounds.
+        lons (numpy.array): longitudes of the campgrounds.
+        max_snap_km (float, optional): points further than this from a
+            road get NaN. Defaults to config.max_snap_km.
+
+    Returns:
+        numpy.array: minutes to each point, NaN if unreachable.
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    max_snap_km = max_snap_km or config.max_snap_km
+    n = len(graph['lat'])
+    roads = csr_matrix(
+        (graph['minutes'], graph['indices'], graph['indptr']), shape=(n, n))
+    home_node, home_km = snap(graph, np.array([home[0]]), np.array([home[1]]))
+    nodes, km = snap(graph, np.asarray(lats), np.asarray(lons))
+
+    reach = dijkstra(roads, indices=home_node[0])
+    minutes = reach[nodes] + (km + home_km[0]) / OFF_ROAD_KMH * 60
+    minutes[~np.isfinite(minutes) | (km > max_snap_km)] = np.nan
+    return minutes
+
+def add_drive_times(df, home=None, road_file=None, cache_dir=None):
+    """Adds a 'Drive Time' column (minutes from home) to a campground table.
+
+    Results are cached per road graph and home, keyed by coordinates,
+    so only campgrounds not seen before are routed.
+
+    Args:
+        df (pandas.DataFrame): table with Latitude and Longitude.
+        home (tuple(float, float), optional): Defaults to
+            config.home_location.
+        road_file (str, optional): Defaults to config.road_network_file.
+        cache_dir (str, optional): Defaults to config.drive_time_cache_dir.
+
+    Returns:
+        pandas.DataFrame: `df` with the new column.
+    """
+    home = home or config.home_location
+    road_file = road_file or config.road_network_file
+    cache_dir = cache_dir or config.drive_time_cache_dir
+    if home is None or road_file is None:
+        raise ValueError(
+            'config.home_location and config.road_network_file must be set')
+
+    key = hashlib.sha1('{}:{:.6f},{:.6f}'.format(
+        _file_fingerprint(road_file), home[0], home[1])).hexdigest()
+    cache_file = os.path.join(cache_dir, 'minutes_{}.json'.format(key))
+    cached = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cached = json.load(f)
+
+    coords = df[['Latitude', 'Longitude']].apply(
+        pd.to_numeric, errors='coerce').dropna()
+    keys = ['{:.6f},{:.6f}'.format(lat, lon) for lat, lon in coords.values]
+    missing = sorted(set(k for k in keys if k not in cached))
+    if missing:
+        graph = load_graph(road_file, cache_dir)
+        points = np.array([[float(v) for v in k.split(',')] for k in missing])
+        minutes = drive_minutes(graph, home, points[:, 0], points[:, 1])
+        for k, m in zip(missing, minutes):
+            cached[k] = None if np.isnan(m) else round(float(m), 1)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(cache_file, 'w') as f:
+            json.dump(cached, f)
+
+    df.loc[coords.index, 'Drive Time'] = [
+        np.nan if cached[k] is None else cached[k] for k in keys]
+    return df
+
+def main():
+    df = pd.read_csv(config.analyzed_file)
+    df = add_drive_times(df)
+    # written whole, then renamed, so the query service never reads half a table
+    temp = config.analyzed_file + '.tmp'
+    df.to_csv(temp, index=False)
+    os.rename(temp, config.analyzed_file)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""Exports the analyzed campgrounds as GeoJSON and pre-computed map tiles
+
+Writes, under config.map_dir:
+
+* campgrounds.geojson: every campground with coordinates as a point
+  feature with the table columns as properties.
+* groups.geojson: the convex hull and centroid of every
+  (Forest, Geo Group).
+* tiles/{z}/{x}/{y}.json: for every zoom level, the campgrounds that
+  fall in each web mercator tile, with nearby points merged into
+  clusters, and the groups whose centroid is in the tile.
+
+A manifest keeps a hash of every (Forest, Geo Group) and the tiles it
+touches, so only the tiles of groups that changed are computed again.
+
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import config
+
+TILE_PIXELS = 256
+
+# properties kept on tile points, to keep tiles small
+TILE_PROPERTIES = ['Campground', 'Status', 'Forest', 'Geo Group', 'URL']
+
+def _json_value(value):
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def tile_xy(lat, lon, zoom):
+    """Fractional web mercator tile coordinates of points.
+
+    Works on numbers or numpy arrays of latitudes and longitudes.
+    """
+    n = 2 ** zoom
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n
+    lat = np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511)
+    lat_rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2 * n
+    return x, y
+
+def convex_hull(points):
+    """Convex hull of (lon, lat) points, counterclockwise (monotone chain)"""
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+def _located(df):
+    """Rows with numeric coordinates"""
+    df = df.copy()
+    for col in ['Latitude', 'Longitude']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna(subset=['Latitude', 'Longitude'])
+
+def campground_features(df):
+    """GeoJSON point feature of every campground"""
+    columns = [c for c in df.columns if c not in ('Latitude', 'Longitude')]
+    features = []
+    for _, row in df.iterrows():
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [round(row['Longitude'], 6),
+                                round(row['Latitude'], 6)],
+                },
+            'properties': dict((c, _json_value(row[c])) for c in columns),
+            })
+    return features
+
+def group_features(df):
+    """GeoJSON hull and centroid of every (Forest, Geo Group)"""
+    features = []
+    grouped = df.dropna(subset=['Geo Group']).groupby(['Forest', 'Geo Group'])
+    for (forest, group), members in grouped:
+        points = zip(members['Longitude'].round(6), members['Latitude'].round(6))
+        hull = [list(p) for p in convex_hull(points)]
+        if len(hull) >= 3:
+            geometry = {'type': 'Polygon', 'coordinates': [hull + hull[:1]]}
+        elif len(hull) == 2:
+            geometry = {'type': 'LineString', 'coordinates': hull}
+        else:
+            geometry = {'type': 'Point', 'coordinates': hull[0]}
+        features.append({
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {
+                'Forest': forest,
+                'Geo Group': _json_value(group),
+                'Campgrounds': len(members),
+                'Centroid': [round(members['Longitude'].mean(), 6),
+                             round(members['Latitude'].mean(), 6)],
+                },
+            })
+    return features
+
+def _cluster(points):
+    """Merges the points of one tile that fall in the same pixel cell.
+
+    Args:
+        points (list(tuple(float, float, dict))): position of each point
+            within the tile (0 to 1), and its feature.
+
+    Returns:
+        list(dict): single points are kept; cells with several points
+            become one cluster feature at their mean position.
+    """
+    cell = float(config.map_cluster_pixels) / TILE_PIXELS
+    cells = {}
+    for x, y, feature in points:
+        cells.setdefault((int(x / cell), int(y / cell)), []).append(feature)
+    features = []
+    for key in sorted(cells):
+        members = cells[key]
+        if len(members) == 1:
+            features.append(members[0])
+            continue
+        lon = np.mean([m['geometry']['coordinates'][0] for m in members])
+        lat = np.mean([m['geometry']['coordinates'][1] for m in members])
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point',
+                         'coordinates': [round(lon, 6), round(lat, 6)]},
+            'properties': {'cluster': True, 'count': len(members)},
+            })
+    return features
+
+def _point_features(df, properties):
+    """Tile point feature of every row of `df`"""
+    return [{
+        'type': 'Feature',
+        'geometry': {'type': 'Point',
+                     'coordinates': [round(lon, 6), round(lat, 6)]},
+        'properties': dict((c, _json_value(v)) for c, v in zip(properties, row)),
+        } for lat, lon, row in zip(
+            df['Latitude'].values, df['Longitude'].values,
+            df[properties].itertuples(index=False))]
+
+def _group_name(forest, group):
+    """Manifest key of a (Forest, Geo Group); ungrouped rows share one"""
+    return json.dumps([forest, _json_value(group)])
+
+def _centroids(groups):
+    """Latitude and longitude arrays of the group centroids"""
+    lats = np.array([g['properties']['Centroid'][1] for g in groups])
+    lons = np.array([g['properties']['Centroid'][0] for g in groups])
+    return lats, lons
+
+def group_state(df, groups, min_zoom=None, max_zoom=None):
+    """Content hash and tiles of every (Forest, Geo Group).
+
+    Args:
+        df (pandas.DataFrame): campgrounds with numeric coordinates.
+        groups (list(dict)): from :func:`group_features`.
+        min_zoom, max_zoom (int, optional): Default to config.map_min_zoom
+            and config.map_max_zoom.
+
+    Returns:
+        dict: group name to its 'digest' and the sorted 'tiles'
+            ('z/x/y') its campgrounds or its centroid fall in.
+    """
+    min_zoom = config.map_min_zoom if min_zoom is None else min_zoom
+    max_zoom = config.map_max_zoom if max_zoom is None else max_zoom
+    properties = [c for c in TILE_PROPERTIES if c in df.columns]
+    names = [_group_name(f, g) for f, g in zip(df['Forest'], df['Geo Group'])]
+    content = {}
+    for name, point in zip(names, _point_features(df, properties)):
+        content.setdefault(name, []).append(point)
+    group_names = [_group_name(g['properties']['Forest'],
+                               g['properties']['Geo Group']) for g in groups]
+    for name, group in zip(group_names, groups):
+        content.setdefault(name, []).append(group)
+
+    tiles = dict((name, set()) for name in content)
+    glats, glons = _centroids(groups)
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_xy(df['Latitude'].values, df['Longitude'].values, zoom)
+        gxs, gys = tile_xy(glats, glons, zoom)
+        for name, x, y in zip(names + group_names,
+                              np.append(xs, gxs), np.append(ys, gys)):
+            tiles[name].add('{}/{}/{}'.format(zoom, int(x), int(y)))
+
+    state = {}
+    for name, features in content.iteritems():
+        data = json.dumps(sorted(json.dumps(f, sort_keys=True)
+                                 for f in features))
+        state[name] = {
+            'digest': hashlib.sha1(data).hexdigest(),
+            'tiles': sorted(tiles[name]),
+            }
+    return state
+
+def build_tiles(df, groups, min_zoom=None, max_zoom=None, only=None):
+    """Computes the content of non-empty tiles.
+
+    Campgrounds are placed in the tile they fall in, groups in the
+    tile of their centroid, so a group is in one tile per zoom level.
+
+    Args:
+        df (pandas.DataFrame): campgrounds with numeric coordinates.
+        groups (list(dict)): from :func:`group_features`.
+        min_zoom, max_zoom (int, optional): Default to config.map_min_zoom
+            and config.map_max_zoom.
+        only (set(tuple(int, int, int)), optional): compute only these
+            (z, x, y) tiles. All tiles if not given.
+
+    Returns:
+        dict: (z, x, y) to a GeoJSON FeatureCollection.
+    """
+    min_zoom = config.map_min_zoom if min_zoom is None else min_zoom
+    max_zoom = config.map_max_zoom if max_zoom is None else max_zoom
+    properties = [c for c in TILE_PROPERTIES if c in df.columns]
+    lats = df['Latitude'].values
+    lons = df['Longitude'].values
+    glats, glons = _centroids(groups)
+    points = {}
+
+    tiles = {}
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_xy(lats, lons, zoom)
+        keys = [(zoom, int(x), int(y)) for x, y in zip(xs, ys)]
+        wanted = [i for i, key in enumerate(keys)
+                  if only is None or key in only]
+        # features are only built for campgrounds in a wanted tile
+        missing = [i for i in wanted if i not in points]
+        points.update(zip(missing, _point_features(df.iloc[missing], properties)))
+        in_tile = {}
+        for i in wanted:
+            x, y = xs[i], ys[i]
+            in_tile.setdefault(keys[i], []).append(
+                (x - int(x), y - int(y), points[i]))
+        for key, members in in_tile.iteritems():
+            tiles[key] = _cluster(members)
+
+        gxs, gys = tile_xy(glats, glons, zoom)
+        for group, x, y in zip(groups, gxs, gys):
+            key = (zoom, int(x), int(y))
+            if only is None or key in only:
+                tiles.setdefault(key, []).append(group)
+
+    return dict(
+        (key, {'type': 'FeatureCollection', 'features': features})
+        for key, features in tiles.iteritems())
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        f.write(data)
+
+def export(df, out_dir=None):
+    """Writes the GeoJSON files and the tiles that changed.
+
+    Args:
+        df (pandas.DataFrame): analyzed campground table.
+        out_dir (str, optional): Defaults to config.map_dir.
+
+    Returns:
+        tuple(int, int): number of tiles written and removed.
+    """
+    out_dir = out_dir or config.map_dir
+    df = _located(df)
+    groups = group_features(df)
+    _write(os.path.join(out_dir, 'campgrounds.geojson'), json.dumps({
+        'type': 'FeatureCollection', 'features': campground_features(df)},
+        separators=(',', ':')))
+    _write(os.path.join(out_dir, 'groups.geojson'), json.dumps({
+        'type': 'FeatureCollection', 'features': groups},
+        separators=(',', ':')))
+
+    manifest_path = os.path.join(out_dir, 'tiles', 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    settings = {
+        'min_zoom': config.map_min_zoom,
+        'max_zoom': config.map_max_zoom,
+        'cluster_pixels': config.map_cluster_pixels,
+        }
+    old_tiles = manifest.get('tiles', {})
+    old_state = manifest.get('groups', {})
+    state = group_state(df, groups)
+
+    if manifest.get('settings') != settings:
+        dirty = set(old_tiles)
+        for entry in state.itervalues():
+            dirty.update(entry['tiles'])
+    else:
+        dirty = set()
+        for name in set(state) | set(old_state):
+            old, new = old_state.get(name), state.get(name)
+            if old is None or new is None or old['digest'] != new['digest']:
+                dirty.update(old['tiles'] if old else [])
+                dirty.update(new['tiles'] if new else [])
+
+    tiles = build_tiles(df, groups, only=set(
+        tuple(int(v) for v in name.split('/')) for name in dirty))
+    new_tiles = dict(
+        (name, digest) for name, digest in old_tiles.iteritems()
+        if name not in dirty)
+    written = 0
+    for (z, x, y), content in tiles.iteritems():
+        name = '{}/{}/{}'.format(z, x, y)
+        data = json.dumps(content, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha1(data).hexdigest()
+        new_tiles[name] = digest
+        if old_tiles.get(name) != digest:
+            _write(os.path.join(out_dir, 'tiles', name + '.json'), data)
+            written += 1
+    removed = 0
+    for name in set(old_tiles) - set(new_tiles):
+        path = os.path.join(out_dir, 'tiles', name + '.json')
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    _write(manifest_path, json.dumps({
+        'settings': settings, 'groups': state, 'tiles': new_tiles},
+        sort_keys=True))
+    return written, removed
+
+def main():
+    df = pd.read_csv(config.analyzed_file)
+    written, removed = export(df)
+    print 'wrote {} tiles, removed {}'.format(written, removed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""Declarative extraction schema for NFS campground and forest pages
+
+Instead of walking the parsed page once per piece of data, the fields
+to pull out of a page are described as a list of :class:`Field`
+entries. The list is compiled once into lookup tables, and
+:func:`apply_schema` collects every field in a single traversal of the
+page.
+
+Only a small part of an NFS page is ever read, so with
+config.partial_parsing a fast pre-scan (:func:`relevant_html`) first
+slices out the elements around the labels being looked for, and only
+those fragments are built into a BeautifulSoup tree
+(:func:`parse_page`). Navigation, footers, scripts and styles are
+skipped.
+
+Attributes:
+    Field (namedtuple): one entry of an extraction schema.
+    HEADING (re.Pattern): matches HTML heading tag names.
+    CAMPGROUND_SCHEMA (CompiledSchema): schema used for campground pages.
+
+"""
+from collections import namedtuple
+from bs4 import BeautifulSoup, NavigableString
+import re
+import config
+
+url_pref = 'https://www.fs.usda.gov'
+
+HEADING = re.compile('^h\d$')
+
+# name: column name in the scraped table
+# kind: 'glance' (row of the "At a Glance" table), 'sidebar' (div after
+#       the div containing the label) or 'strong' (text after a <strong>
+#       tag containing the label)
+# label: text identifying the field on the page. Case insensitive.
+# coerce: function applied to the raw text of the field
+Field = namedtuple('Field', ['name', 'kind', 'label', 'coerce'])
+
+CompiledSchema = namedtuple(
+    'CompiledSchema', ['section', 'glance', 'sidebar', 'strong'])
+
+def clean_text(text):
+    """Strips whitespace and non-breaking spaces from scraped text.
+
+    Args:
+        text (str): raw text from the page.
+
+    Returns:
+        str: cleaned text, or None if `text` is None.
+    """
+    if text is None:
+        return None
+    return text.replace(u'\xa0', '').strip()
+
+def compile_schema(fields, section='At a Glance'):
+    """Compiles a list of fields into lookup tables keyed by label.
+
+    Args:
+        fields (list(Field, )): fields to extract from a page.
+        section (str, optional): heading text of the table whose rows
+            are collected. None skips the table. Rows whose header is
+            not in `fields` are kept under their own header with
+            :func:`clean_text`.
+
+    Returns:
+        CompiledSchema: lookup tables consumed by :func:`apply_schema`.
+    """
+    tables = {'glance': {}, 'sidebar': [], 'strong': []}
+    for field in fields:
+        if field.kind == 'glance':
+            tables['glance'][field.label.lower()] = field
+        elif field.kind in ('sidebar', 'strong'):
+            tables[field.kind].append((field.label.lower(), field))
+        else:
+            raise ValueError('unknown field kind {}'.format(field.kind))
+    return CompiledSchema(
+        section=section,
+        glance=tables['glance'],
+        sidebar=tuple(tables['sidebar']),
+        strong=tuple(tables['strong']),
+        )
+
+CAMPGROUND_SCHEMA = compile_schema([
+    Field('Usage', 'glance', 'Usage', clean_text),
+    Field('Elevation', 'sidebar', 'elevation :', clean_text),
+    Field('Latitude', 'sidebar', 'latitude :', clean_text),
+    Field('Longitude', 'sidebar', 'longitude :', clean_text),
+    Field('Status', 'strong', 'Area Status: ', clean_text),
+    ])
+
+def _strings(tag):
+    """Lower-cased direct text children of a tag"""
+    return [x.lower() for x in tag.contents if isinstance(x, NavigableString)]
+
+def _read_glance(heading, schema, data):
+    """Collects the rows of the table(s) following a section heading"""
+    for div in heading.find_next_siblings('div'):
+        for row in div.find_all('tr'):
+            th = row.find('th')
+            td = row.find('td')
+            if th is None or td is None or th.string is None:
+                continue
+            header = th.string.replace(':', '').strip()
+            field = schema.glance.get(header.lower())
+            if field is None:
+                name, coerce = header, clean_text
+            else:
+                name, coerce = field.name, field.coerce
+            data.setdefault(name, []).append(coerce(td.get_text()))
+
+def apply_schema(soup, schema=CAMPGROUND_SCHEMA):
+    """Extracts every field of a schema in one traversal of the page.
+
+    "At a Glance" values are returned as lists, since a header can
+    appear more than once. Sidebar and strong fields take the first
+    match in document order. Fields that were not found are absent
+    from the result.
+
+    Args:
+        soup (bs4.BeautifulSoup): Parsed HTML text of a webpage.
+        schema (CompiledSchema, optional): fields to extract.
+
+    Returns:
+        dict: field name to extracted value.
+
+    See Also:
+        * :func:`scrape_campsite_data.get_campground_data`
+    """
+    data = {}
+    pending_sidebar = list(schema.sidebar)
+    pending_strong = list(schema.strong)
+    for tag in soup.find_all(True):
+        if HEADING.match(tag.name):
+            if schema.section is not None and schema.section in tag.contents:
+                _read_glance(tag, schema, data)
+            continue
+        if not (pending_sidebar or pending_strong):
+            if schema.section is None:
+                break
+            continue
+        texts = _strings(tag)
+        if not texts:
+            continue
+        if tag.name == 'strong':
+            for label, field in list(pending_strong):
+                if label in texts:
+                    sibling = tag.next_sibling
+                    if sibling is not None:
+                        data[field.name] = field.coerce(unicode(sibling))
+                    pending_strong.remove((label, field))
+        for label, field in list(pending_sidebar):
+            if any(label in t for t in texts):
+                siblings = tag.find_next_siblings()
+                if siblings:
+                    data[field.name] = field.coerce(siblings[0].text)
+                pending_sidebar.remove((label, field))
+    return data
+
+def extract_listing(soup, heading='Campground Camping Areas', suffix=None):
+    """Collects the links listed under a heading of a forest page.
+
+    Args:
+        soup (bs4.BeautifulSoup): Parsed HTML text of the forest's
+            recreation listing page.
+        heading (str, optional): heading text above the lists of links.
+        suffix (str, optional): if given, only names ending with this
+            text are kept, e.g. 'Campground'.
+
+    Returns:
+        list(list(str, )): with the inner list's first element being
+            the name, and the second element being the full URL.
+
+    See Also:
+        * :func:`scrape_campsite_data.get_campground_urls`
+        * :func:`update_campstatus.update_campground_status`
+    """
+    urls = []
+    for i in soup.find_all(HEADING):
+        if heading not in i.contents:
+            continue
+        for j in i.find_next_siblings('ul'):
+            for k in j.find_all('a'):
+                url = k.get('href')
+                if url is None or url.endswith('.pdf'):
+                    continue
+                name = clean_text(k.get_text())
+                if not name:
+                    continue
+                if suffix is not None and not name.endswith(suffix):
+                    continue
+                urls.append([name, url_pref + url])
+    return urls
+
+# tags, comments and declarations, with quoted attribute values
+TAG = re.compile(
+    r'<(/?)([a-zA-Z][a-zA-Z0-9:-]*)'
+    r'([^"\'>]*(?:(?:"[^"]*"|\'[^\']*\')[^"\'>]*)*)>'
+    r'|<!--.*?-->|<![^>]*>|<\?[^>]*>', re.S)
+
+# elements without content or end tag
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'])
+
+# elements whose content is not markup
+RAW_TEXT_ELEMENTS = frozenset(['script', 'style'])
+
+def schema_markers(schema):
+    """Texts that locate the fields of a schema on a page"""
+    markers = [label for label, _ in schema.sidebar + schema.strong]
+    if schema.section is not None:
+        markers.append(schema.section)
+    return markers
+
+def _parent_spans(html, positions):
+    """Span of the parent of the innermost element around each position.
+
+    Tags are matched with a stack, like html.parser does: an end tag
+    closes the nearest open element of its name and any left open
+    inside it, and stray end tags are ignored.
+
+    Args:
+        html (str): page text.
+        positions (list(int, )): sorted text offsets.
+
+    Returns:
+        list(tuple(int, int)): (start, end) of each parent element.
+            The whole page when the position is not two levels deep.
+    """
+    # each open element is [name, start, end]; end is set when it closes
+    root = [None, 0, len(html)]
+    stack = [root]
+    wanted = []
+    # wanted elements not closed yet, by id
+    waiting = set()
+    lowered = None
+    i = 0
+    pos = 0
+    while i < len(positions) or waiting:
+        match = TAG.search(html, pos)
+        if match is None:
+            break
+        pos = match.end()
+        while i < len(positions) and positions[i] < match.start():
+            parent = stack[-2] if len(stack) > 1 else root
+            wanted.append(parent)
+            if parent is not root:
+                waiting.add(id(parent))
+            i += 1
+        closing, name = match.group(1), match.group(2)
+        if name is None:
+            continue
+        name = name.lower()
+        if closing:
+            for depth in range(len(stack) - 1, 0, -1):
+                if stack[depth][0] == name:
+                    for element in stack[depth + 1:]:
+                        element[2] = match.start()
+                        waiting.discard(id(element))
+                    stack[depth][2] = match.end()
+                    waiting.discard(id(stack[depth]))
+                    del stack[depth:]
+                    break
+        elif name in RAW_TEXT_ELEMENTS:
+            # the content is text, so the element is the innermost one
+            # around positions in it and its parent is the current top
+            if lowered is None:
+                lowered = html.lower()
+            end = lowered.find('</' + name, pos)
+            pos = len(html) if end < 0 else html.find('>', end) + 1 or len(html)
+            while i < len(positions) and positions[i] < pos:
+                parent = stack[-1]
+                wanted.append(parent)
+                if parent is not root:
+                    waiting.add(id(parent))
+                i += 1
+        elif name not in VOID_ELEMENTS and not match.group(3).endswith('/'):
+            stack.append([name, match.start(), None])
+    while i < len(positions):
+        wanted.append(stack[-2] if len(stack) > 1 else root)
+        i += 1
+    for element in stack:
+        if element[2] is None:
+            element[2] = len(html)
+    return [(element[1], element[2]) for element in wanted]
+
+def relevant_html(html, markers):
+    """Slices out the parts of a page around some texts.
+
+    For every occurrence of a marker, the parent of the element
+    containing it is kept, so the element's siblings (the value next to
+    a label, the table after a heading, the text after a <strong>) come
+    along. The kept elements are joined in page order.
+
+    Args:
+        html (str): page text.
+        markers (list(str, )): texts to look for. Case insensitive.
+
+    Returns:
+        str: the kept elements, '' if no marker is on the page.
+    """
+    lowered = html.lower()
+    positions = []
+    for marker in markers:
+        marker = marker.strip().lower()
+        if not marker:
+            continue
+        found = lowered.find(marker)
+        while found >= 0:
+            positions.append(found)
+            found = lowered.find(marker, found + 1)
+    if not positions:
+        return ''
+    spans = sorted(set(_parent_spans(html, sorted(positions))))
+    kept = []
+    end = -1
+    for start, stop in spans:
+        if start >= end:
+            kept.append((start, stop))
+            end = stop
+        elif stop > end:
+            # spans nest or are disjoint, but be safe
+            kept[-1] = (kept[-1][0], stop)
+            end = stop
+    return ''.join(html[start:stop] for start, stop in kept)
+
+def parse_page(html, markers=None):
+    """Builds the BeautifulSoup tree of a page, or of its relevant parts.
+
+    Args:
+        html (str): page text.
+        markers (list(str, ), optional): texts locating everything that
+            will be read from the page, see :func:`relevant_html`. If
+            not given, or config.partial_parsing is off, the whole page
+            is parsed.
+
+    Returns:
+        bs4.BeautifulSoup: parsed page.
+    """
+    if markers is not None and config.partial_parsing:
+        html = relevant_html(html, markers)
+    return BeautifulSoup(html, 'html.parser')
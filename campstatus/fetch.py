@@ -0,0 +1,345 @@
+"""Polite, robust fetching of NFS pages
+
+Every page request goes through a :class:`Fetcher`, which:
+
+* sets connect and read timeouts on every request, so a stalled
+  connection can't hang a run,
+* adapts the number of concurrent requests with AIMD (additive
+  increase, multiplicative decrease): the limit grows while responses
+  are fast and successful, and is halved on 429/5xx responses,
+  errors or slow responses,
+* retries failed requests with exponential backoff and full jitter,
+  honouring Retry-After,
+* opens a per-host circuit after several pages in a row failed:
+  requests to the host wait until a cooldown has passed and a trial
+  request succeeds,
+* asks for compressed responses (config.fetch_encodings) and counts
+  the bytes received per forest in a :class:`TrafficLog`.
+
+"""
+import random
+import threading
+import time
+import urlparse
+import requests
+import urllib3.response
+import config
+
+# first part of the path of NFS pages that is followed by the forest,
+# e.g. /recarea/sierra/...
+FOREST_SECTIONS = set(['recarea', 'activity', 'recmain', 'main'])
+
+class FetchError(Exception):
+    """A page could not be fetched"""
+
+class AdaptiveLimiter(object):
+    """Concurrency limit adapted by additive increase, multiplicative decrease.
+
+    Attributes:
+        limit (float): current number of requests allowed at once.
+        in_flight (int): number of requests running.
+    """
+
+    def __init__(self, initial=None, maximum=None, target_latency=None):
+        self.maximum = maximum or config.fetch_max_concurrency
+        self.limit = float(min(initial or config.fetch_initial_concurrency,
+                               self.maximum))
+        self.target_latency = target_latency or config.fetch_target_latency
+        self.in_flight = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Waits until another request may start"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, congested):
+        """Records the outcome of a request and frees its slot.
+
+        Args:
+            latency (float): seconds the request took.
+            congested (bool): the server pushed back (429/5xx/error).
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.time()
+            if congested or latency > self.target_latency:
+                # only requests sent after the last decrease count, so one
+                # burst of errors halves the limit once, not per request
+                if now - latency >= self._last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.maximum),
+                                 self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+class CircuitBreaker(object):
+    """Holds back requests to a host after repeated failures.
+
+    Closed: requests pass. Once `failures` pages in a row could not be
+    fetched, the circuit opens and requests wait for `cooldown`
+    seconds. Then one trial request is let through while the others
+    keep waiting; its success closes the circuit, its failure opens it
+    again.
+    """
+
+    def __init__(self, failures=None, cooldown=None, max_wait=None):
+        self.max_failures = failures or config.breaker_failures
+        self.cooldown = config.breaker_cooldown if cooldown is None \
+            else cooldown
+        self.max_wait = config.breaker_max_wait if max_wait is None \
+            else max_wait
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._cond = threading.Condition()
+
+    def wait(self):
+        """Waits until a request may be sent.
+
+        Returns:
+            bool: True if the request is the trial of the circuit, whose
+                outcome must be recorded.
+
+        Raises:
+            FetchError: if the circuit stayed open for more than
+                `max_wait` seconds.
+        """
+        deadline = time.time() + self.max_wait
+        with self._cond:
+            while True:
+                if self.opened_at is None:
+                    return False
+                now = time.time()
+                reopens = self.opened_at + self.cooldown
+                if not self._trial and now >= reopens:
+                    self._trial = True
+                    return True
+                if now >= deadline:
+                    raise FetchError('circuit open for {:.0f}s'.format(
+                        now - self.opened_at))
+                # a trial's outcome is notified, the cooldown is not
+                until = deadline if self._trial else min(reopens, deadline)
+                self._cond.wait(max(until - now, 0.01))
+
+    def record(self, ok):
+        """Records whether a page, or the trial request, could be fetched"""
+        with self._cond:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self._trial or self.failures >= self.max_failures:
+                    self.opened_at = time.time()
+            self._trial = False
+            self._cond.notify_all()
+
+def _congested(status):
+    return status == 429 or status >= 500
+
+def _retry_after(response):
+    """Seconds asked for by a Retry-After header, if any"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def forest_of(url):
+    """Forest of an NFS page URL, e.g. 'sierra', or the host otherwise"""
+    parsed = urlparse.urlparse(url)
+    parts = [p for p in parsed.path.split('/') if p]
+    if len(parts) > 1 and parts[0] in FOREST_SECTIONS:
+        return parts[1]
+    return parsed.netloc
+
+def accept_encoding(encodings=None):
+    """Accept-Encoding header asking for the encodings that can be decoded"""
+    encodings = config.fetch_encodings if encodings is None else encodings
+    if urllib3.response.brotli is None:
+        encodings = [e for e in encodings if e != 'br']
+    return ', '.join(encodings) or 'identity'
+
+class TrafficLog(object):
+    """Requests and response body bytes, per forest.
+
+    'wire' bytes are as received, compressed or not; 'decoded' bytes
+    are the page as handed to the parser.
+    """
+
+    def __init__(self):
+        self.forests = {}
+        self._lock = threading.Lock()
+
+    def add(self, url, wire, decoded):
+        forest = forest_of(url)
+        with self._lock:
+            counts = self.forests.setdefault(
+                forest, {'requests': 0, 'wire': 0, 'decoded': 0})
+            counts['requests'] += 1
+            counts['wire'] += wire
+            counts['decoded'] += decoded
+
+    def snapshot(self):
+        """Copy of the counts of every forest, safe to read while fetching"""
+        with self._lock:
+            return dict((forest, dict(counts))
+                        for forest, counts in self.forests.iteritems())
+
+    def totals(self):
+        with self._lock:
+            return {
+                'requests': sum(c['requests'] for c in self.forests.values()),
+                'wire': sum(c['wire'] for c in self.forests.values()),
+                'decoded': sum(c['decoded'] for c in self.forests.values()),
+                }
+
+    def report(self):
+        """Table of the traffic of every forest, as text"""
+        with self._lock:
+            rows = sorted(self.forests.iteritems())
+        rows.append(('total', self.totals()))
+        lines = ['{:<24}{:>9}{:>14}{:>14}{:>7}'.format(
+            'forest', 'requests', 'wire bytes', 'decoded bytes', 'ratio')]
+        for forest, counts in rows:
+            ratio = float(counts['decoded']) / counts['wire'] \
+                if counts['wire'] else 0
+            lines.append('{:<24}{:>9}{:>14}{:>14}{:>7.1f}'.format(
+                forest, counts['requests'], counts['wire'],
+                counts['decoded'], ratio))
+        return '\n'.join(lines)
+
+def _wire_bytes(response):
+    """Bytes of the response body as received"""
+    try:
+        return response.raw.tell()
+    except (AttributeError, IOError):
+        pass
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return len(response.content)
+
+class Fetcher(object):
+    """Fetches pages with timeouts, adaptive concurrency, retries and
+    circuit breaking. Safe to share between threads.
+    """
+
+    def __init__(self, limiter=None, attempts=None, backoff=None,
+                 timeout=None):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.traffic = TrafficLog()
+        self.attempts = attempts or config.fetch_attempts
+        self.backoff = backoff or config.fetch_backoff
+        self.timeout = timeout or (config.connect_timeout, config.read_timeout)
+        self.breakers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """requests.Session of the calling thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers['Accept-Encoding'] = accept_encoding()
+        return session
+
+    def breaker(self, url):
+        host = urlparse.urlparse(url).netloc
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker()
+            return self.breakers[host]
+
+    def _sleep(self, attempt, response=None):
+        """Full jitter exponential backoff, or the server's Retry-After
+
+        Retry-After is capped at the longest backoff, so a server asking
+        for hours does not park a worker.
+        """
+        wait = None
+        if response is not None:
+            wait = _retry_after(response)
+        if wait is None:
+            wait = random.uniform(0, self.backoff * 2 ** attempt)
+        time.sleep(max(0, min(wait, self.backoff * 2 ** self.attempts)))
+
+    def get(self, url, **kwargs):
+        """GETs a page.
+
+        Args:
+            url (str): page URL.
+            **kwargs: passed on to requests.Session.get.
+
+        Returns:
+            requests.Response: a successful response.
+
+        Raises:
+            FetchError: if the host's circuit stayed open too long, or
+                every attempt failed.
+        """
+        breaker = self.breaker(url)
+        kwargs.setdefault('timeout', self.timeout)
+        error = None
+        for attempt in range(self.attempts):
+            try:
+                trial = breaker.wait()
+            except FetchError as e:
+                raise FetchError('{} for {}'.format(e, url))
+            recorded = False
+            try:
+                self.limiter.acquire()
+                start = time.time()
+                response = None
+                try:
+                    response = self.session.get(url, **kwargs)
+                except requests.RequestException as e:
+                    error = e
+                latency = time.time() - start
+                if response is not None:
+                    congested = _congested(response.status_code)
+                else:
+                    congested = True
+                self.limiter.release(latency, congested)
+
+                if response is not None and not congested:
+                    breaker.record(True)
+                    recorded = True
+                    self.traffic.add(url, _wire_bytes(response),
+                                     len(response.content))
+                    if response.status_code >= 400:
+                        # not worth retrying, e.g. a page that was removed
+                        raise FetchError('{} for {}'.format(
+                            response.status_code, url))
+                    return response
+            finally:
+                if trial and not recorded:
+                    # the host still fails: the circuit opens again
+                    breaker.record(False)
+            if response is not None:
+                error = '{} for {}'.format(response.status_code, url)
+            if attempt + 1 < self.attempts:
+                self._sleep(attempt, response)
+        # failures are counted per page, not per attempt
+        breaker.record(False)
+        raise FetchError('gave up on {}: {}'.format(url, error))
+
+_default = None
+_default_lock = threading.Lock()
+
+def default_fetcher():
+    """Fetcher shared by the whole process"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Fetcher()
+        return _default
+
+def get(url, **kwargs):
+    """GETs a page with the shared :class:`Fetcher`, see :meth:`Fetcher.get`"""
+    return default_fetcher().get(url, **kwargs)
@@ -0,0 +1,225 @@
+"""Stable identities for campgrounds
+
+Campgrounds are identified by the `recid` of their NFS URL, which does
+not change between scrapes. When only a name is known, e.g. in a
+Google sheet without URLs, names are normalized and looked up in a
+dictionary. A name shared by several rows matches none of them.
+
+A trigram similarity search for spelling differences can be asked for,
+but it is never used when writing: names like 'Upper Sardine Lake' and
+'Lower Sardine Lake' are similar and still different campgrounds.
+
+"""
+import re
+import unicodedata
+import urlparse
+
+_PUNCTUATION = re.compile('[^a-z0-9 ]+')
+_SPACES = re.compile(' +')
+# words left out when comparing names, since sheets often drop them
+_GENERIC = re.compile(' (campground|cg)$')
+
+def campground_id(url):
+    """Canonical ID of a campground, taken from its NFS URL.
+
+    Args:
+        url (str): campground URL, e.g.
+            'https://www.fs.usda.gov/recarea/sierra/recarea/?recid=15520'
+
+    Returns:
+        str: the recid, or None if the URL does not have one.
+    """
+    if not isinstance(url, basestring):
+        return None
+    query = urlparse.parse_qs(urlparse.urlparse(url).query)
+    recid = query.get('recid')
+    if not recid:
+        return None
+    return recid[0]
+
+def normalize_name(name):
+    """Normalizes a campground name for comparison.
+
+    Accents, case, punctuation and repeated spaces are dropped, as is
+    a trailing 'Campground'.
+
+    Examples:
+        >>> normalize_name(u'Lower  Sardine Lake (Sierra) Campground')
+        u'lower sardine lake sierra'
+    """
+    if not isinstance(name, basestring):
+        return u''
+    if not isinstance(name, unicode):
+        name = name.decode('utf-8')
+    name = unicodedata.normalize('NFKD', name)
+    name = u''.join(c for c in name if not unicodedata.combining(c))
+    name = _PUNCTUATION.sub(' ', name.lower())
+    name = _SPACES.sub(' ', name).strip()
+    return _GENERIC.sub('', name)
+
+def trigrams(normalized):
+    """Set of character trigrams of a normalized name, padded with spaces"""
+    padded = u'  {} '.format(normalized)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class CampgroundIndex(object):
+    """Lookup table from campground IDs and names to keys.
+
+    A key is whatever the caller uses to find the campground again,
+    e.g. a sheet row number.
+
+    Attributes:
+        min_similarity (float): lowest trigram Jaccard similarity
+            accepted by the fuzzy search.
+        min_lead (float): how much more similar the best name must be
+            than the second best for the fuzzy search to accept it.
+    """
+
+    def __init__(self, min_similarity=0.8, min_lead=0.1):
+        self.min_similarity = min_similarity
+        self.min_lead = min_lead
+        self._by_id = {}
+        self._by_name = {}
+        # IDs and names added with more than one key
+        self._ambiguous_ids = set()
+        self._ambiguous_names = set()
+        self._trigrams = {}
+        self._key_trigrams = {}
+
+    def __len__(self):
+        return len(self._key_trigrams)
+
+    def add(self, key, name, url=None, recid=None):
+        """Adds a campground to the index.
+
+        Args:
+            key: value returned by :meth:`lookup` for this campground.
+            name (str): campground name.
+            url (str, optional): campground URL, used for its ID.
+            recid (str, optional): campground ID, if known without a URL.
+        """
+        recid = id_text(recid) or campground_id(url)
+        if recid is not None:
+            if self._by_id.setdefault(recid, key) != key:
+                self._ambiguous_ids.add(recid)
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        if self._by_name.setdefault(normalized, key) != key:
+            self._ambiguous_names.add(normalized)
+        grams = trigrams(normalized)
+        self._key_trigrams[key] = grams
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(key)
+
+    def lookup(self, name=None, url=None, recid=None, fuzzy=False):
+        """Finds the key of a campground.
+
+        The campground ID (`recid`, or the one in `url`) is tried first.
+        If the index has IDs, a campground whose ID is not in it is not
+        matched by name. Otherwise the normalized name must match
+        exactly one campground. Ambiguous matches are logged and
+        rejected.
+
+        Args:
+            name (str, optional): campground name.
+            url (str, optional): campground URL.
+            recid (str, optional): campground ID.
+            fuzzy (bool, optional): fall back to the most similar name,
+                if it is similar enough and clearly ahead of the next
+                one. Not for writing.
+
+        Returns:
+            the key given to :meth:`add`, or None if nothing matched.
+        """
+        recid = id_text(recid) or campground_id(url)
+        if recid is not None and self._by_id:
+            if recid in self._ambiguous_ids:
+                print u'campground ID {} is on several rows'.format(recid)
+                return None
+            return self._by_id.get(recid)
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+        if normalized in self._ambiguous_names:
+            print u'{} is on several rows'.format(name)
+            return None
+        if normalized in self._by_name:
+            return self._by_name[normalized]
+        if not fuzzy:
+            return None
+        return self._fuzzy(normalized, name)
+
+    def _fuzzy(self, normalized, name=None):
+        """Key of the most similar name, if similar enough and unambiguous"""
+        grams = trigrams(normalized)
+        shared = {}
+        for gram in grams:
+            for key in self._trigrams.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        scores = sorted(
+            (float(n) / (len(grams) + len(self._key_trigrams[key]) - n), key)
+            for key, n in shared.iteritems())
+        if not scores or scores[-1][0] < self.min_similarity:
+            return None
+        if len(scores) > 1 and scores[-1][0] - scores[-2][0] < self.min_lead:
+            print u'{} is too close to several names'.format(name or normalized)
+            return None
+        return scores[-1][1]
+
+def id_text(recid):
+    """Campground ID as text, whether read as a string, int or float"""
+    if recid is None or isinstance(recid, bool):
+        return None
+    if isinstance(recid, float):
+        if recid != recid:
+            return None
+        if recid.is_integer():
+            recid = int(recid)
+    recid = unicode(recid).strip()
+    return recid or None
+
+def index_table(df, name_col='Campground', url_col='URL'):
+    """Indexes a campground table by row label.
+
+    Args:
+        df (pandas.DataFrame): campground table, e.g. a previous scrape.
+        name_col (str, optional): column with campground names.
+        url_col (str, optional): column with campground URLs.
+
+    Returns:
+        CampgroundIndex: keys are the row labels of `df`.
+    """
+    index = CampgroundIndex()
+    urls = df[url_col] if url_col in df else [None] * len(df)
+    for key, name, url in zip(df.index, df[name_col], urls):
+        index.add(key, name, url)
+    return index
+
+def index_sheet(sheet, name_col=1):
+    """Indexes the campgrounds of a worksheet.
+
+    If the first row has a 'URL' or 'Campground ID' column, campgrounds
+    are matched by ID, see :meth:`CampgroundIndex.lookup`.
+
+    Args:
+        sheet (gspread.Worksheet): worksheet with one campground per row.
+        name_col (int, optional): 1-based column with campground names.
+
+    Returns:
+        CampgroundIndex: keys are 1-based sheet row numbers.
+    """
+    header = [h.strip().lower() for h in sheet.row_values(1)]
+    urls = ids = []
+    if 'url' in header:
+        urls = sheet.col_values(header.index('url') + 1)
+    if 'campground id' in header:
+        ids = sheet.col_values(header.index('campground id') + 1)
+    index = CampgroundIndex()
+    for row, name in enumerate(sheet.col_values(name_col), 1):
+        if row == 1 and (urls or ids):
+            continue
+        url = urls[row - 1] if row <= len(urls) else None
+        recid = ids[row - 1] if row <= len(ids) else None
+        index.add(row, name, url or None, recid or None)
+    return index
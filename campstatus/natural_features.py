@@ -0,0 +1,176 @@
+"""Links campgrounds to the nearest natural features from local GIS files
+
+Each kind of feature (river, lake, peak, ...) is read from a local
+GeoJSON file once. Lines and outlines are densified into vertices a
+short distance apart, and all vertices go into a KD-tree on the unit
+sphere, where straight-line distance orders points the same way as
+great circle distance. The tree is saved, so later runs only load it.
+All campgrounds are then looked up in one batched query per kind.
+
+"""
+import cPickle as pickle
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import config
+
+EARTH_RADIUS_KM = 6371.0088
+
+# most km between vertices of a densified line
+VERTEX_SPACING_KM = 0.25
+
+def _unit_vectors(lats, lons):
+    """Points on the unit sphere for latitudes and longitudes in degrees"""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat)])
+
+def _densify(line):
+    """Vertices of a [lon, lat] line, at most VERTEX_SPACING_KM apart"""
+    points = [line[0]]
+    for (lon1, lat1), (lon2, lat2) in zip(line[:-1], line[1:]):
+        # flat approximation is fine for picking the number of steps
+        dx = (lon2 - lon1) * 111.32 * np.cos(np.radians((lat1 + lat2) / 2))
+        dy = (lat2 - lat1) * 110.57
+        steps = max(int(np.ceil(np.hypot(dx, dy) / VERTEX_SPACING_KM)), 1)
+        for t in np.arange(1, steps + 1) / float(steps):
+            points.append([lon1 + t * (lon2 - lon1), lat1 + t * (lat2 - lat1)])
+    return points
+
+def _geometry_vertices(geometry):
+    """[lon, lat] vertices of a GeoJSON geometry"""
+    kind = geometry['type']
+    coords = geometry.get('coordinates')
+    if kind == 'Point':
+        return [coords[:2]]
+    if kind == 'MultiPoint':
+        return [c[:2] for c in coords]
+    if kind == 'LineString':
+        lines = [coords]
+    elif kind in ('MultiLineString', 'Polygon'):
+        lines = coords
+    elif kind == 'MultiPolygon':
+        lines = [ring for polygon in coords for ring in polygon]
+    elif kind == 'GeometryCollection':
+        return [v for g in geometry['geometries'] for v in _geometry_vertices(g)]
+    else:
+        return []
+    return [v for line in lines if line for v in _densify([c[:2] for c in line])]
+
+def build_index(path, name_property=None):
+    """Builds the nearest-feature index of a GeoJSON file.
+
+    Args:
+        path (str): GeoJSON FeatureCollection.
+        name_property (str, optional): property with the feature name.
+            Defaults to config.feature_name_property.
+
+    Returns:
+        dict: 'tree' (scipy.spatial.cKDTree of the vertices), 'feature'
+            (index into 'names' of each vertex) and 'names'.
+    """
+    from scipy.spatial import cKDTree
+
+    name_property = name_property or config.feature_name_property
+    with open(path) as f:
+        collection = json.load(f)
+    names = []
+    vertex_feature = []
+    vertices = []
+    for feature in collection.get('features', []):
+        if not feature.get('geometry'):
+            continue
+        found = _geometry_vertices(feature['geometry'])
+        if not found:
+            continue
+        properties = feature.get('properties') or {}
+        vertex_feature.extend([len(names)] * len(found))
+        names.append(properties.get(name_property) or '')
+        vertices.extend(found)
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    return {
+        'tree': cKDTree(_unit_vectors(vertices[:, 1], vertices[:, 0])),
+        'feature': np.asarray(vertex_feature, dtype=np.int32),
+        'names': names,
+        }
+
+def load_index(path, index_dir=None):
+    """Loads the saved index of a GeoJSON file, building it if needed.
+
+    The index is rebuilt when the file's size or modification time
+    changes.
+
+    Args:
+        path (str): GeoJSON FeatureCollection.
+        index_dir (str, optional): Defaults to config.feature_index_dir.
+
+    Returns:
+        dict: see :func:`build_index`.
+    """
+    index_dir = index_dir or config.feature_index_dir
+    stat = os.stat(path)
+    key = hashlib.sha1('{}:{}:{}:{}'.format(
+        os.path.abspath(path), stat.st_size, stat.st_mtime,
+        config.feature_name_property)).hexdigest()
+    index_file = os.path.join(index_dir, key + '.pkl')
+    if os.path.exists(index_file):
+        with open(index_file, 'rb') as f:
+            return pickle.load(f)
+    index = build_index(path)
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    with open(index_file, 'wb') as f:
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+    return index
+
+def nearest_features(index, lats, lons):
+    """Nearest feature of each point, in one batched query.
+
+    Args:
+        index (dict): from :func:`load_index`.
+        lats (numpy.array): latitudes of the points.
+        lons (numpy.array): longitudes of the points.
+
+    Returns:
+        tuple(list(str, ), numpy.array): name of the nearest feature of
+            each point, and the great circle distance to it in km.
+    """
+    chord, vertex = index['tree'].query(_unit_vectors(lats, lons))
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1))
+    names = [index['names'][i] for i in index['feature'][vertex]]
+    return names, km
+
+def add_nearest_features(df, feature_files=None, index_dir=None):
+    """Adds the nearest feature of each kind to a campground table.
+
+    For a kind such as 'River', the columns 'Nearest River' (feature
+    name) and 'River Distance' (km) are added.
+
+    Args:
+        df (pandas.DataFrame): table with Latitude and Longitude.
+        feature_files (dict, optional): GeoJSON file to kind of feature.
+            Defaults to config.feature_files.
+        index_dir (str, optional): Defaults to config.feature_index_dir.
+
+    Returns:
+        pandas.DataFrame: `df` with the new columns.
+    """
+    feature_files = feature_files or config.feature_files
+    coords = df[['Latitude', 'Longitude']].apply(
+        pd.to_numeric, errors='coerce').dropna()
+    if coords.empty:
+        return df
+    for path, kind in sorted(feature_files.iteritems()):
+        index = load_index(path, index_dir)
+        if not index['names']:
+            continue
+        names, km = nearest_features(
+            index, coords['Latitude'].values, coords['Longitude'].values)
+        df.loc[coords.index, 'Nearest {}'.format(kind)] = names
+        df.loc[coords.index, '{} Distance'.format(kind)] = np.round(km, 2)
+    return df
@@ -0,0 +1,112 @@
+"""Compact storage of fetched NFS pages
+
+Fetched campground pages are kept in config.page_store_dir, for
+debugging the parser; :meth:`PageStore.load` reads a page back. Pages
+are not served from the store: scraping always fetches them. Most of
+an NFS page is site chrome (menus, header, footer) shared by every
+page. So, with config.page_store_strip, a page is cut down to the parts
+that are parsed (see extraction.relevant_html) before it is stored.
+Those parts parse to the same values as the whole page. Stored pages
+are gzipped, one file per URL, and can be read with zcat.
+
+"""
+import gzip
+import hashlib
+import io
+import os
+import threading
+import extraction
+import config
+
+class PageStore(object):
+    """Directory of stripped, gzipped pages.
+
+    Attributes:
+        pages (int): pages saved.
+        raw_bytes (int): UTF-8 bytes of the saved pages as fetched.
+        stored_bytes (int): bytes written to disk for them.
+    """
+
+    def __init__(self, directory=None, strip=None, level=None):
+        self.directory = directory or config.page_store_dir
+        self.strip = config.page_store_strip if strip is None else strip
+        self.level = level or config.page_store_level
+        self.pages = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def path(self, url):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.html.gz')
+
+    def save(self, url, html, markers=None):
+        """Stores a page.
+
+        Args:
+            url (str): URL the page was fetched from.
+            html (str): page text.
+            markers (list(str, ), optional): texts of the parts to keep,
+                e.g. scrape_campsite_data.CAMPGROUND_MARKERS. The whole
+                page is kept without them, or if none is on the page.
+
+        Returns:
+            int: bytes written.
+        """
+        kept = html
+        if self.strip and markers:
+            kept = extraction.relevant_html(html, markers) or html
+        # the URL goes first, so a stored page says where it came from
+        kept = u'<!-- {} -->\n{}'.format(url, kept)
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb',
+                           compresslevel=self.level) as f:
+            f.write(kept.encode('utf-8'))
+        data = buffer.getvalue()
+        path = self.path(url)
+        # written whole, then renamed, so readers never see half a page
+        temp = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.rename(temp, path)
+        with self._lock:
+            self.pages += 1
+            self.raw_bytes += len(html.encode('utf-8'))
+            self.stored_bytes += len(data)
+        return len(data)
+
+    def load(self, url):
+        """Stored page of a URL, without the URL line; None if not stored"""
+        path = self.path(url)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            text = f.read().decode('utf-8')
+        return text.split(u'\n', 1)[1]
+
+    def report(self):
+        ratio = float(self.raw_bytes) / self.stored_bytes \
+            if self.stored_bytes else 0
+        return 'stored {} pages: {} bytes as fetched, {} on disk ({:.0f}x)'\
+            .format(self.pages, self.raw_bytes, self.stored_bytes, ratio)
+
+_default = None
+_default_lock = threading.Lock()
+
+def default_store():
+    """Store in config.page_store_dir, or None if pages are not kept"""
+    global _default
+    if config.page_store_dir is None:
+        return None
+    with _default_lock:
+        if _default is None or _default.directory != config.page_store_dir:
+            _default = PageStore()
+        return _default
+
+def keep(url, html, markers=None):
+    """Saves a page to the default store, if pages are kept"""
+    store = default_store()
+    if store is not None:
+        store.save(url, html, markers)
@@ -0,0 +1,317 @@
+"""Staged scraping pipeline
+
+Scraping is split into four stages that run at the same time:
+
+1. fetch: a pool of threads downloads campground pages.
+2. parse: a pool of processes builds the BeautifulSoup tree and
+   extracts the fields, so parsing is not limited by the GIL.
+3. munge: batches of parsed campgrounds are cleaned up in-process.
+4. write: each munged batch is appended to the output csv.
+
+Stages are connected by bounded queues, so a slow stage makes the
+earlier ones wait instead of piling up pages in memory.
+
+Several recreation types (see config.recreation_types) can be scraped
+in one run: an area listed under more than one type is fetched and
+parsed once, and its row is written to the table of every type.
+
+"""
+from multiprocessing import Pool, cpu_count
+import threading
+import Queue
+import fetch
+import pandas as pd
+import scrape_campsite_data as scd
+import config
+
+# marks the end of a queue
+_DONE = None
+# seconds a blocked stage waits before checking whether the run stopped
+_POLL = 0.5
+
+def _put(queue, item, stop):
+    """Puts an item on a bounded queue unless the run is stopped
+
+    Returns:
+        bool: whether the item was put.
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=_POLL)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+def _fetch_worker(jobs, pages, fetcher, stop):
+    """Downloads pages for jobs until the job queue is empty or stop is set"""
+    while not stop.is_set():
+        try:
+            forest, url, names = jobs.get_nowait()
+        except Queue.Empty:
+            return
+        try:
+            html = scd.fetch_campground_page(url, fetcher)
+        except fetch.FetchError as e:
+            print 'could not fetch {}: {}'.format(url, e)
+            continue
+        if not _put(pages, (forest, url, names, html), stop):
+            return
+
+def _parse_job(page):
+    """Parses one fetched page in a worker process"""
+    forest, url, names, html = page
+    try:
+        data = scd.parse_campground_page(html, url)
+    except Exception as e:
+        print 'could not parse {}: {}'.format(url, e)
+        return None
+    data['Forest'] = forest
+    return names, data
+
+def _drain(pages, slots, stop):
+    """Yields fetched pages, waiting for a free parse slot before each"""
+    while not stop.is_set():
+        try:
+            page = pages.get(timeout=_POLL)
+        except Queue.Empty:
+            continue
+        if page is _DONE:
+            return
+        slots.acquire()
+        if stop.is_set():
+            return
+        yield page
+
+def _stop(stop, jobs, slots):
+    """Stops the fetchers and the pool's feeding of pages after an error
+
+    The pool's task thread may be waiting in :func:`_drain` for a
+    parse slot that will not be released, so one is released for it.
+    """
+    stop.set()
+    while True:
+        try:
+            jobs.get_nowait()
+        except Queue.Empty:
+            break
+    try:
+        slots.release()
+    except ValueError:
+        # every slot was free
+        pass
+
+def _campground_frame(data):
+    """Single campground's parsed data as a table"""
+    if any(isinstance(v, list) for v in data.itervalues()):
+        return pd.DataFrame(data)
+    return pd.DataFrame(data, index=[0])
+
+def _write_batch(batch, out_file, header, kind='campgrounds'):
+    """Munges a batch of parsed areas and appends it to the csv"""
+    df = pd.concat([_campground_frame(data) for data in batch])
+    forest = df['Forest'].values
+    df = pd.concat([pd.DataFrame(columns=scd.MUNGED_COLUMNS), df])
+    df = scd.munge_campground_data(
+        df.reset_index(drop=True), config.recreation_types[kind]['columns'])
+    df.loc[:, 'Forest'] = forest
+    df.to_csv(out_file, mode='w' if header else 'a', header=header,
+              index=False, encoding='utf-8')
+    return len(df)
+
+def run_pipeline(jobs, out_file, fetch_threads=None, parse_processes=None,
+                 queue_size=None, batch_size=None):
+    """Scrapes campgrounds through the staged pipeline.
+
+    Args:
+        jobs (list(tuple(str, str, str), )): (forest, campground name,
+            campground URL) for each campground to scrape.
+        out_file (str): csv file the munged table is streamed to.
+        fetch_threads (int, optional): number of fetching threads.
+            Defaults to config.fetch_threads. How many of them send
+            requests at once is adapted by :class:`fetch.AdaptiveLimiter`.
+        parse_processes (int, optional): number of parsing processes.
+            Defaults to config.parse_processes, or the number of cores.
+        queue_size (int, optional): most pages waiting to be parsed,
+            and most pages being parsed. Defaults to
+            config.pipeline_queue_size.
+        batch_size (int, optional): number of campgrounds munged and
+            written at a time. Defaults to config.pipeline_batch_size.
+
+    Returns:
+        int: number of rows written to `out_file`.
+
+    See Also:
+        * :func:`scrape_all_forests_pipelined`
+        * :func:`run_typed_pipeline`
+    """
+    typed_jobs = [(forest, url, {'campgrounds': campground})
+                  for forest, campground, url in jobs]
+    written = run_typed_pipeline(
+        typed_jobs, {'campgrounds': out_file}, fetch_threads,
+        parse_processes, queue_size, batch_size)
+    return written.get('campgrounds', 0)
+
+def run_typed_pipeline(jobs, out_files, fetch_threads=None,
+                       parse_processes=None, queue_size=None,
+                       batch_size=None):
+    """Scrapes areas of several recreation types through the pipeline.
+
+    Args:
+        jobs (list(tuple(str, str, dict), )): (forest, area URL, names)
+            for each area to scrape, where names maps each recreation
+            type the area is listed under to its name in that listing.
+            Each URL should appear once.
+        out_files (dict): recreation type to the csv file its munged
+            table is streamed to.
+        fetch_threads, parse_processes, queue_size, batch_size: see
+            :func:`run_pipeline`.
+
+    Returns:
+        dict: recreation type to the number of rows written.
+    """
+    fetch_threads = fetch_threads or config.fetch_threads
+    parse_processes = parse_processes or config.parse_processes or cpu_count()
+    queue_size = queue_size or config.pipeline_queue_size
+    batch_size = batch_size or config.pipeline_batch_size
+
+    # the parsing processes are forked before any thread starts, so none
+    # of them inherits a lock held by a thread (sessions, the limiter)
+    pool = Pool(parse_processes)
+
+    # the fetcher adapts how many of the threads request at once
+    fetcher = fetch.default_fetcher()
+    job_queue = Queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    pages = Queue.Queue(maxsize=queue_size)
+    slots = threading.BoundedSemaphore(queue_size)
+    stop = threading.Event()
+
+    fetchers = [
+        threading.Thread(target=_fetch_worker,
+                         args=(job_queue, pages, fetcher, stop))
+        for _ in range(fetch_threads)]
+    for t in fetchers:
+        t.daemon = True
+        t.start()
+
+    def close_pages():
+        for t in fetchers:
+            t.join()
+        _put(pages, _DONE, stop)
+    closer = threading.Thread(target=close_pages)
+    closer.daemon = True
+    closer.start()
+
+    written = dict((kind, 0) for kind in out_files)
+    batches = dict((kind, []) for kind in out_files)
+
+    def flush(kind):
+        written[kind] += _write_batch(batches[kind], out_files[kind],
+                                      header=written[kind] == 0, kind=kind)
+        batches[kind] = []
+
+    try:
+        for parsed in pool.imap(_parse_job, _drain(pages, slots, stop)):
+            slots.release()
+            if parsed is None:
+                continue
+            names, data = parsed
+            for kind, name in names.iteritems():
+                if kind not in out_files:
+                    continue
+                row = dict(data)
+                row[config.recreation_types[kind]['name_column']] = name
+                batches[kind].append(row)
+                if len(batches[kind]) >= batch_size:
+                    flush(kind)
+        for kind in out_files:
+            if batches[kind]:
+                flush(kind)
+    except BaseException:
+        # a failed munge or write must not leave the pool waiting for
+        # pages, or the fetchers for room in the queue
+        _stop(stop, job_queue, slots)
+        pool.terminate()
+        # the fetchers finish the page they are on, then quit
+        closer.join()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return written
+
+def scrape_all_forests_pipelined(URLS, out_file):
+    """Pipelined equivalent of :func:`scrape_campsite_data.scrape_all_forests`.
+
+    Args:
+        URLS (dict): forest name to the URL of its campground listing.
+        out_file (str): csv file the munged table is streamed to.
+
+    Returns:
+        int: number of rows written to `out_file`.
+    """
+    jobs = []
+    for forest, url in URLS.iteritems():
+        print 'listing {} National Forest'.format(forest)
+        try:
+            listing = scd.get_campground_urls(url)
+        except (fetch.FetchError, ValueError) as e:
+            print 'could not list {}: {}'.format(forest, e)
+            continue
+        for campground, camp_url in listing:
+            jobs.append((forest, campground, camp_url))
+    print 'scraping {} campgrounds'.format(len(jobs))
+    return run_pipeline(jobs, out_file)
+
+def scrape_recreation_pipelined(forests=None, kinds=None, out_files=None):
+    """Scrapes several recreation types of the forests in one crawl.
+
+    Each forest's listings of all `kinds` are found in one discovery
+    pass (:func:`scrape_campsite_data.discover_recreation`), then every
+    area page is fetched and parsed once, whatever types list it.
+
+    Args:
+        forests (list(str, ), optional): forest URL descriptors.
+            Defaults to config.forests_to_scrape.
+        kinds (list(str, ), optional): keys of config.recreation_types.
+            Defaults to config.recreation_types_to_scrape.
+        out_files (dict, optional): recreation type to csv file.
+            Defaults to each type's out_file in config.recreation_types.
+
+    Returns:
+        dict: recreation type to the number of rows written.
+    """
+    forests = forests or config.forests_to_scrape
+    kinds = kinds or config.recreation_types_to_scrape
+    if out_files is None:
+        out_files = dict((kind, config.recreation_types[kind]['out_file'])
+                         for kind in kinds)
+    jobs = {}
+    for forest in forests:
+        full_name = config.AllNationalForests[forest]
+        print 'listing {}'.format(full_name)
+        try:
+            found = scd.discover_recreation(forest, kinds)
+        except (fetch.FetchError, ValueError) as e:
+            print 'could not list {}: {}'.format(full_name, e)
+            continue
+        for kind, areas in sorted(found.iteritems()):
+            for name, url in areas:
+                jobs.setdefault(url, (full_name, url, {}))[2][kind] = name
+    print 'scraping {} areas'.format(len(jobs))
+    return run_typed_pipeline(jobs.values(), out_files)
+
+def main(kinds=None):
+    print 'These forests will be scraped:'
+    print config.forests_to_scrape
+    print
+    written = scrape_recreation_pipelined(kinds=kinds)
+    for kind, rows in sorted(written.iteritems()):
+        print 'wrote {} {}'.format(rows, kind)
+    scd.report_traffic()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Publishes the analyzed campground table to a Google sheet
+
+The current sheet is read once, compared with the table, and only the
+cells that changed are written. Changed cells are merged into
+rectangular ranges, and all ranges are sent in a few batched value
+update calls instead of one call per cell.
+
+Values are written RAW, so the sheet stores exactly the strings
+produced by :func:`table_to_grid` and the next comparison is exact.
+
+"""
+import pandas as pd
+import config
+
+def cell_text(value):
+    """Text written to the sheet for one table value"""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if pd.isnull(value):
+            return ''
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    if isinstance(value, unicode):
+        return value
+    return str(value)
+
+def table_to_grid(df, columns=None):
+    """Converts a table to the rows of text written to the sheet.
+
+    Args:
+        df (pandas.DataFrame): analyzed campground table.
+        columns (list(str, ), optional): columns to publish. Defaults
+            to config.publish_columns.
+
+    Returns:
+        list(list(str, )): header row followed by one row per campground.
+    """
+    columns = columns or config.publish_columns
+    grid = [list(columns)]
+    for row in df.reindex(columns=columns).itertuples(index=False):
+        grid.append([cell_text(v) for v in row])
+    return grid
+
+def column_letter(col):
+    """Sheet column letter(s) for a zero based column index"""
+    letters = ''
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+def a1_range(top, left, bottom, right):
+    """A1 notation for a zero based, inclusive rectangle of cells"""
+    return '{}{}:{}{}'.format(
+        column_letter(left), top + 1, column_letter(right), bottom + 1)
+
+def _row_runs(old_row, new_row, width):
+    """(start, end) of the runs of changed cells in one row, end inclusive"""
+    runs = []
+    start = None
+    for c in range(width):
+        old = old_row[c] if c < len(old_row) else ''
+        new = new_row[c] if c < len(new_row) else ''
+        if old != new:
+            if start is None:
+                start = c
+        elif start is not None:
+            runs.append((start, c - 1))
+            start = None
+    if start is not None:
+        runs.append((start, width - 1))
+    return runs
+
+def changed_ranges(old, new):
+    """Finds the rectangles of cells that differ between two grids.
+
+    Runs of changed cells are found in every row. A run is merged with
+    the run of the same columns in the row above, so a changed column
+    or block becomes a single rectangle. Cells that exist in `old` but
+    not in `new` are cleared.
+
+    Args:
+        old (list(list(str, ))): current values of the sheet.
+        new (list(list(str, ))): values the sheet should have.
+
+    Returns:
+        list(dict): each with 'range' in A1 notation and the 'values'
+            to write there.
+    """
+    height = max(len(old), len(new))
+    width = max([len(r) for r in old + new] or [0])
+    # (left, right) -> [top, bottom] of the rectangle still growing
+    open_rects = {}
+    rects = []
+    for r in range(height):
+        old_row = old[r] if r < len(old) else []
+        new_row = new[r] if r < len(new) else []
+        runs = set(_row_runs(old_row, new_row, width))
+        for span in list(open_rects):
+            if span not in runs:
+                rects.append((open_rects.pop(span), span))
+        for span in runs:
+            if span in open_rects:
+                open_rects[span][1] = r
+            else:
+                open_rects[span] = [r, r]
+    for span, rows in open_rects.iteritems():
+        rects.append((rows, span))
+
+    updates = []
+    for (top, bottom), (left, right) in sorted(rects):
+        values = []
+        for r in range(top, bottom + 1):
+            row = new[r] if r < len(new) else []
+            values.append([row[c] if c < len(row) else ''
+                           for c in range(left, right + 1)])
+        updates.append({
+            'range': a1_range(top, left, bottom, right),
+            'values': values,
+            })
+    return updates
+
+def publish_table(sheet, df, columns=None, ranges_per_call=None):
+    """Mirrors a table to a worksheet with as few writes as possible.
+
+    Args:
+        sheet (gspread.Worksheet): worksheet to publish to, or a
+            :class:`MemoryWorksheet`.
+        df (pandas.DataFrame): analyzed campground table.
+        columns (list(str, ), optional): columns to publish. Defaults
+            to config.publish_columns.
+        ranges_per_call (int, optional): most ranges per batched update
+            call. Defaults to config.publish_ranges_per_call.
+
+    Returns:
+        list(dict): the ranges that were written.
+    """
+    ranges_per_call = ranges_per_call or config.publish_ranges_per_call
+    new = table_to_grid(df, columns)
+    old = sheet.get_all_values()
+    updates = changed_ranges(old, new)
+    if not updates:
+        return updates
+
+    rows = max(len(new), sheet.row_count)
+    cols = max(len(new[0]), sheet.col_count)
+    if rows > sheet.row_count or cols > sheet.col_count:
+        sheet.resize(rows, cols)
+    for i in range(0, len(updates), ranges_per_call):
+        sheet.batch_update(updates[i:i + ranges_per_call],
+                           value_input_option='RAW')
+    return updates
+
+def _parse_a1(a1):
+    """Zero based (top, left) of the first cell of an A1 range"""
+    cell = a1.split(':')[0]
+    letters = cell.rstrip('0123456789')
+    col = 0
+    for ch in letters:
+        col = col * 26 + ord(ch) - ord('A') + 1
+    return int(cell[len(letters):]) - 1, col - 1
+
+class MemoryWorksheet(object):
+    """In-memory stand-in for a gspread worksheet.
+
+    Implements the calls :func:`publish_table` makes, and counts them.
+    Used for dry runs, and to check what a publish would send.
+
+    Attributes:
+        values (list(list(str, ))): cell values, row major.
+        reads (int): number of get_all_values calls.
+        update_calls (int): number of batch_update calls.
+        cells_written (int): number of cells written.
+    """
+
+    def __init__(self, values=None, rows=1000, cols=26):
+        self.values = [list(r) for r in (values or [])]
+        self.row_count = max(rows, len(self.values))
+        self.col_count = max([cols] + [len(r) for r in self.values])
+        self.reads = 0
+        self.update_calls = 0
+        self.cells_written = 0
+
+    def get_all_values(self):
+        self.reads += 1
+        # like the Sheets API, trailing empty rows and cells are dropped
+        rows = [list(r) for r in self.values]
+        for row in rows:
+            while row and row[-1] == '':
+                row.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+        width = max([len(r) for r in rows] or [0])
+        return [r + [''] * (width - len(r)) for r in rows]
+
+    def resize(self, rows=None, cols=None):
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+
+    def batch_update(self, data, **kwargs):
+        self.update_calls += 1
+        for update in data:
+            top, left = _parse_a1(update['range'])
+            for i, row in enumerate(update['values']):
+                r = top + i
+                if r >= self.row_count:
+                    raise ValueError('row {} is outside the sheet'.format(r))
+                while len(self.values) <= r:
+                    self.values.append([])
+                cells = self.values[r]
+                for j, value in enumerate(row):
+                    c = left + j
+                    if c >= self.col_count:
+                        raise ValueError(
+                            'column {} is outside the sheet'.format(c))
+                    while len(cells) <= c:
+                        cells.append('')
+                    cells[c] = value
+                    self.cells_written += 1
+
+def main(dry_run=False):
+    """Publishes config.analyzed_file to config.publish_sheet_key.
+
+    Args:
+        dry_run (bool, optional): compare against an empty in-memory
+            sheet instead of opening the Google sheet, and only report.
+
+    Raises:
+        ValueError: if config.publish_sheet_key is not set and this is
+            not a dry run.
+    """
+    if not dry_run and config.publish_sheet_key is None:
+        raise ValueError('config.publish_sheet_key must be set to publish '
+                         '(or use --dry-run)')
+    df = pd.read_csv(config.analyzed_file)
+    if dry_run:
+        sheet = MemoryWorksheet()
+    else:
+        import update_campstatus as uc
+        sheet = uc.open_camping_sheet(
+            config.publish_sheet_key, config.publish_worksheet)
+    updates = publish_table(sheet, df)
+    cells = sum(len(u['values']) * len(u['values'][0]) for u in updates)
+    print 'wrote {} cells in {} ranges'.format(cells, len(updates))
+
+if __name__ == '__main__':
+    main()
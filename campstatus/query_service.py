@@ -0,0 +1,347 @@
+"""Local read-only JSON query service over the analyzed campgrounds
+
+The analyzed table is loaded once into a :class:`CampgroundStore`, which
+precomputes an index of row positions for every value of the filterable
+columns and a sorted elevation index. A query intersects the matching
+index entries, so it never scans the table. Responses carry an ETag, and
+the store is swapped for a new one in the background when a new
+analyzed file lands.
+
+Example::
+
+    python query_service.py
+    curl 'localhost:8080/campgrounds?forest=tahoe&status=open&potable_water=true&max_elevation=6000'
+
+Query parameters:
+
+* forest, status, reservations, restroom, potable_water, geo_group:
+  case insensitive. forest also matches part of the name, e.g. 'tahoe'.
+  Repeat a parameter to match any of several values.
+* min_elevation, max_elevation: feet.
+* radius: Geo Group radius in km. Each forest's stored clustering tree
+  (see analyze_campgrounds.load_hierarchy) is cut at this radius, and
+  geo_group and the 'Geo Group' of the results use those groups
+  instead of the analyzed ones.
+* offset, limit: pagination.
+
+"""
+import BaseHTTPServer
+import SocketServer
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import urlparse
+import numpy as np
+import pandas as pd
+import config
+
+# query parameter -> indexed column
+INDEXED_COLUMNS = {
+    'forest': 'Forest',
+    'status': 'Status',
+    'reservations': 'Reservations',
+    'restroom': 'Restroom',
+    'potable_water': 'Potable Water',
+    'geo_group': 'Geo Group',
+    }
+
+# parameters matched against part of the value instead of all of it
+PARTIAL_MATCH = set(['forest'])
+
+# parameters that are not filters on an indexed column
+OPTIONS = set(['offset', 'limit', 'min_elevation', 'max_elevation', 'radius'])
+
+# radii whose Geo Groups are kept by a store
+RADIUS_CACHE_SIZE = 16
+
+class QueryError(ValueError):
+    """A query parameter could not be understood"""
+
+def _key(value):
+    """Normalized index key of a table value or query value"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if not isinstance(value, unicode):
+        value = str(value).decode('utf-8')
+    return value.strip().lower()
+
+def _json_value(value):
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class CampgroundStore(object):
+    """In-memory analyzed table with indexes for fast filtering.
+
+    Attributes:
+        version (str): identifies the loaded data, used in ETags.
+        records (list(dict)): one JSON-ready dictionary per campground.
+    """
+
+    def __init__(self, df, version):
+        self.version = version
+        columns = list(df.columns)
+        self.records = [
+            dict((c, _json_value(v)) for c, v in zip(columns, row))
+            for row in df.itertuples(index=False)]
+        self.indexes = {}
+        for param, column in INDEXED_COLUMNS.iteritems():
+            if column not in df:
+                continue
+            positions = {}
+            for i, value in enumerate(df[column].values):
+                positions.setdefault(_key(value), []).append(i)
+            self.indexes[param] = dict(
+                (k, np.array(v, dtype=np.int32))
+                for k, v in positions.iteritems())
+        if 'Elevation' in df:
+            elevation = pd.to_numeric(df['Elevation'], errors='coerce')
+            elevation = elevation.values.astype(float)
+        else:
+            elevation = np.full(len(df), np.nan)
+        known = np.flatnonzero(~np.isnan(elevation))
+        order = np.argsort(elevation[known], kind='mergesort')
+        self.elevation_rows = known[order].astype(np.int32)
+        self.elevation_sorted = elevation[known][order]
+
+        # coordinates for cutting the forests' clustering trees
+        columns = [c for c in ('Forest', 'Latitude', 'Longitude') if c in df]
+        self._points = df[columns].reset_index(drop=True)
+        self._trees = {}
+        self._groups = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path):
+        stat = os.stat(path)
+        version = hashlib.sha1('{}:{}:{}'.format(
+            os.path.abspath(path), stat.st_size, stat.st_mtime)).hexdigest()
+        return cls(pd.read_csv(path), version)
+
+    def _matches(self, param, values):
+        """Rows whose `param` column matches any of `values`"""
+        index = self.indexes.get(param)
+        if index is None:
+            raise QueryError('cannot filter on {}'.format(param))
+        hits = []
+        for value in values:
+            key = _key(value)
+            if param in PARTIAL_MATCH:
+                hits.extend(rows for k, rows in index.iteritems() if key in k)
+            elif key in index:
+                hits.append(index[key])
+        if not hits:
+            return np.array([], dtype=np.int32)
+        return np.unique(np.concatenate(hits))
+
+    def geo_groups(self, radius):
+        """Geo Group of every row when groups have the given radius.
+
+        Args:
+            radius (float): group radius in km.
+
+        Returns:
+            numpy.array: Geo Group of each record, NaN where the
+                coordinates are missing.
+        """
+        import analyze_campgrounds as ac
+
+        with self._lock:
+            groups = self._groups.get(radius)
+        if groups is not None:
+            return groups
+        groups = np.full(len(self.records), np.nan)
+        if 'Forest' in self._points and 'Latitude' in self._points:
+            for forest, part in self._points.groupby('Forest'):
+                tree = self._trees.get(forest)
+                if tree is None:
+                    tree = self._trees[forest] = ac.load_hierarchy(part)
+                labeled = ac.hierarchy_group_points(part.copy(), radius,
+                                                    tree=tree)
+                groups[part.index.values] = labeled['Geo Group'].values
+        with self._lock:
+            self._groups[radius] = groups
+            while len(self._groups) > RADIUS_CACHE_SIZE:
+                self._groups.popitem(last=False)
+        return groups
+
+    def _group_rows(self, groups, values):
+        """Rows whose Geo Group in `groups` is one of `values`"""
+        keys = set(_key(v) for v in values)
+        return np.array([i for i, g in enumerate(groups) if _key(g) in keys],
+                        dtype=np.int32)
+
+    def _elevation_rows(self, low, high):
+        """Rows with elevation between `low` and `high`, inclusive"""
+        start = np.searchsorted(self.elevation_sorted, low, side='left')
+        stop = np.searchsorted(self.elevation_sorted, high, side='right')
+        return np.sort(self.elevation_rows[start:stop])
+
+    def query(self, params):
+        """Finds campgrounds matching all filters.
+
+        Args:
+            params (dict): query parameter to list of values, as from
+                urlparse.parse_qs.
+
+        Returns:
+            dict: 'total' number of matches, 'offset', 'limit' and the
+                page of matching 'results'.
+
+        Raises:
+            QueryError: for unknown parameters or bad numbers.
+        """
+        rows = None
+        try:
+            offset = int(params.get('offset', [0])[0])
+            limit = int(params.get('limit', [config.query_page_size])[0])
+            low = float(params.get('min_elevation', ['-inf'])[0])
+            high = float(params.get('max_elevation', ['inf'])[0])
+            radius = float(params['radius'][0]) if 'radius' in params \
+                else None
+        except ValueError as e:
+            raise QueryError(str(e))
+        if radius is not None and not radius > 0:
+            raise QueryError('radius must be positive')
+        groups = None if radius is None else self.geo_groups(radius)
+        limit = max(0, min(limit, config.query_max_page_size))
+        offset = max(0, offset)
+
+        for param, values in sorted(params.iteritems()):
+            if param in OPTIONS:
+                continue
+            if param not in INDEXED_COLUMNS:
+                raise QueryError('unknown parameter {}'.format(param))
+            if param == 'geo_group' and groups is not None:
+                found = self._group_rows(groups, values)
+            else:
+                found = self._matches(param, values)
+            rows = found if rows is None else np.intersect1d(
+                rows, found, assume_unique=True)
+        if 'min_elevation' in params or 'max_elevation' in params:
+            found = self._elevation_rows(low, high)
+            rows = found if rows is None else np.intersect1d(
+                rows, found, assume_unique=True)
+        if rows is None:
+            rows = np.arange(len(self.records))
+
+        results = []
+        for i in rows[offset:offset + limit]:
+            record = self.records[i]
+            if groups is not None:
+                record = dict(record)
+                record['Geo Group'] = _json_value(groups[i])
+            results.append(record)
+        return {
+            'total': len(rows),
+            'offset': offset,
+            'limit': limit,
+            'results': results,
+            }
+
+class StoreReloader(object):
+    """Holds the current store and replaces it when the file changes"""
+
+    def __init__(self, path, interval=None):
+        self.path = path
+        self.interval = interval or config.query_reload_interval
+        self.store = CampgroundStore.from_csv(path)
+        self._mtime = os.stat(path).st_mtime
+
+    def check(self):
+        """Loads the file again if it changed; True if it did"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        # build the new store fully before swapping it in, so queries
+        # never see a half loaded table. The writers rename a finished
+        # file into place; if parsing fails anyway the old store is kept
+        # and the mtime not recorded, so the next check tries again.
+        store = CampgroundStore.from_csv(self.path)
+        self.store = store
+        self._mtime = mtime
+        return True
+
+    def watch(self):
+        """Checks the file every `interval` seconds in a daemon thread"""
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    if self.check():
+                        print 'reloaded {}'.format(self.path)
+                except Exception as e:
+                    print 'could not reload {}: {}'.format(self.path, e)
+        thread = threading.Thread(target=loop)
+        thread.daemon = True
+        thread.start()
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """GET /campgrounds?... returns JSON matches; GET /health returns ok"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, code, body, headers=()):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path == '/health':
+            return self._send(200, '{"ok": true}')
+        if url.path != '/campgrounds':
+            return self._send(404, '{"error": "not found"}')
+
+        store = self.server.reloader.store
+        params = urlparse.parse_qs(url.query)
+        canonical = sorted((k, sorted(v)) for k, v in params.iteritems())
+        etag = '"{}"'.format(hashlib.sha1(
+            store.version + json.dumps(canonical)).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, '', [('ETag', etag)])
+        try:
+            result = store.query(params)
+        except QueryError as e:
+            return self._send(400, json.dumps({'error': str(e)}))
+        self._send(200, json.dumps(result), [
+            ('ETag', etag),
+            ('Cache-Control', 'no-cache'),
+            ])
+
+    def log_message(self, format, *args):
+        pass
+
+class QueryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, reloader):
+        BaseHTTPServer.HTTPServer.__init__(self, address, QueryHandler)
+        self.reloader = reloader
+
+def main(path=None, host=None, port=None):
+    """Serves queries over `path` (config.analyzed_file) until interrupted"""
+    reloader = StoreReloader(path or config.analyzed_file)
+    reloader.watch()
+    server = QueryServer(
+        (host or config.query_host, port or config.query_port), reloader)
+    print 'serving {} campgrounds on http://{}:{}/campgrounds'.format(
+        len(reloader.store.records), *server.server_address)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+"""Adaptive refresh of campground pages
+
+Instead of re-scraping every campground at the same frequency, each
+campground page gets its own refresh interval:
+
+* campgrounds out of their Open Season (and not reported open) are
+  dormant, and are checked once every config.refresh_dormant_interval,
+* in season, the interval halves down to config.refresh_min_interval
+  whenever the page changed since the last check, and grows by
+  config.refresh_backoff up to config.refresh_max_interval while it
+  does not,
+* campgrounds whose status changed within config.refresh_volatile_window
+  are checked at least every config.refresh_volatile_interval.
+
+The schedule, with the status history and a hash of the parsed page of
+every campground, is kept in config.refresh_schedule_file so it carries
+over between runs.
+
+"""
+import calendar
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+from multiprocessing.pool import ThreadPool
+import pandas as pd
+import fetch
+import config
+
+MONTHS = dict((m, i + 1) for i, m in enumerate([
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun',
+    'jul', 'aug', 'sep', 'oct', 'nov', 'dec']))
+
+# a whole month word, full or abbreviated, so 'Decided' or 'Marina'
+# don't read as dates
+SEASON_DATE = re.compile(
+    r'\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|'
+    r'aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|'
+    r'dec(?:ember)?)\b\.?(?:\s+(\d{1,2})(?!\d))?', re.I)
+
+# dash between the opening and closing dates, not one inside a date
+# like 'Mid-May'
+SEASON_DASH = re.compile(r'(?<![a-z])-', re.I)
+
+YEAR_ROUND = re.compile(r'year[\s-]*round|all\s+year', re.I)
+
+def parse_open_season(text):
+    """Reads the opening and closing dates of an Open Season text.
+
+    Args:
+        text (str): e.g. 'May 25 - October 15', 'Mid-May - September',
+            '- October 8' or 'year-round'.
+
+    Returns:
+        tuple: (month, day) of opening and of closing, either of which
+            is None when the text does not say. The day is None when
+            only a month is given. None if the text has no dates, and
+            'year-round' for campgrounds that never close.
+    """
+    if not isinstance(text, basestring) or not text.strip():
+        return None
+    if YEAR_ROUND.search(text):
+        return 'year-round'
+    dates = [(MONTHS[m.group(1).lower()[:3]],
+              int(m.group(2)) if m.group(2) else None)
+             for m in SEASON_DATE.finditer(text)]
+    if not dates:
+        return None
+    if not SEASON_DATE.search(SEASON_DASH.split(text, 1)[0]):
+        # '- October 8': only the closing date is known
+        return None, dates[0]
+    if len(dates) == 1:
+        # 'May': only the opening month is known
+        return dates[0], None
+    return dates[0], dates[-1]
+
+def in_season(season, day, margin_days=None):
+    """Whether a campground is in its Open Season on a day.
+
+    Args:
+        season: from :func:`parse_open_season`.
+        day (datetime.date): day to check.
+        margin_days (int, optional): days before opening and after
+            closing that still count as in season, since openings are
+            often announced early. Defaults to config.season_margin_days.
+
+    Returns:
+        bool: None if the season is unknown.
+    """
+    if season is None:
+        return None
+    if season == 'year-round':
+        return True
+    if margin_days is None:
+        margin_days = config.season_margin_days
+    opening, closing = season
+
+    def as_date(month_day, year, last):
+        month, d = month_day
+        days = calendar.monthrange(year, month)[1]
+        if d is None:
+            # a bare month opens on its first day and closes on its last
+            d = days if last else 1
+        return datetime.date(year, month, min(d, days))
+
+    margin = datetime.timedelta(days=margin_days)
+    if closing is None:
+        # open-ended: in season from the opening to the end of the year
+        start = as_date(opening, day.year, False) - margin
+        return day >= start
+    end = as_date(closing, day.year, True) + margin
+    if opening is None:
+        return day <= end
+    start = as_date(opening, day.year, False) - margin
+    if start <= end:
+        return start <= day <= end
+    # the season wraps around the new year, e.g. 'November - March'
+    return day >= start or day <= end
+
+def _first(value):
+    """First value of an 'At a Glance' list, NaN as None"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def page_hash(record):
+    """Hash of the parsed fields of a campground page.
+
+    The parsed fields are hashed rather than the HTML, so changes to
+    the page layout or navigation do not count as changes.
+    """
+    fields = sorted((k, _first(v)) for k, v in record.iteritems())
+    return hashlib.sha1(json.dumps(fields)).hexdigest()
+
+def _spread(url, interval):
+    """Seconds between 0 and `interval`, fixed for a URL.
+
+    Used to spread the first checks of newly added campgrounds, so
+    they do not all come due at once.
+    """
+    return int(hashlib.sha1(url).hexdigest()[:8], 16) % max(int(interval), 1)
+
+class RefreshSchedule(object):
+    """Refresh interval and history of every campground page.
+
+    Attributes:
+        entries (dict): URL to a dictionary with the campground's
+            'name', 'season' text, last 'status', page 'hash',
+            'interval' and 'due' time in seconds, 'checked' time and
+            the times of its last status 'changes'.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.refresh_schedule_file
+        self.entries = {}
+        self.listed = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            self.entries = saved['entries']
+            self.listed = saved.get('listed', 0)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'entries': self.entries, 'listed': self.listed}, f)
+        os.rename(tmp, self.path)
+
+    def add(self, url, name, season=None, status=None, now=None):
+        """Adds a campground; known campgrounds only get their name updated
+
+        Returns:
+            bool: True if the campground is new.
+        """
+        if url in self.entries:
+            self.entries[url]['name'] = name
+            return False
+        now = time.time() if now is None else now
+        entry = {
+            'name': name,
+            'season': season,
+            'status': status,
+            'hash': None,
+            'checked': None,
+            'changes': [],
+            }
+        entry['interval'] = self.next_interval(entry, False, now)
+        entry['due'] = now + _spread(url, entry['interval'])
+        self.entries[url] = entry
+        return True
+
+    def seed(self, df, now=None):
+        """Adds the campgrounds of a scraped table.
+
+        Args:
+            df (pandas.DataFrame): table with Campground and URL, and
+                optionally Open Season and Status columns.
+
+        Returns:
+            int: number of campgrounds added.
+        """
+        added = 0
+        for _, row in df.iterrows():
+            url = row.get('URL')
+            if not isinstance(url, basestring) or not url:
+                continue
+            season = row.get('Open Season')
+            status = row.get('Status')
+            added += self.add(
+                url, row.get('Campground'),
+                season if isinstance(season, basestring) else None,
+                status if isinstance(status, basestring) else None,
+                now)
+        return added
+
+    def dormant(self, entry, now):
+        """True for campgrounds out of season and not reported open"""
+        day = datetime.date.fromtimestamp(now)
+        season = in_season(parse_open_season(entry.get('season')), day)
+        status = (entry.get('status') or '').lower()
+        return season is False and 'open' not in status
+
+    def next_interval(self, entry, changed, now):
+        """Seconds until a campground should be checked again.
+
+        Args:
+            entry (dict): the campground's entry, after the check.
+            changed (bool): the page changed at this check.
+            now (float): time of the check.
+
+        Returns:
+            float: refresh interval.
+        """
+        if self.dormant(entry, now):
+            return float(config.refresh_dormant_interval)
+        interval = entry.get('interval') or config.refresh_min_interval
+        interval = min(interval, config.refresh_max_interval)
+        if changed:
+            interval /= 2.0
+        elif entry.get('checked') is not None:
+            interval *= config.refresh_backoff
+        recent = [t for t in entry['changes']
+                  if now - t < config.refresh_volatile_window]
+        if recent:
+            interval = min(interval, config.refresh_volatile_interval)
+        return float(max(config.refresh_min_interval,
+                         min(interval, config.refresh_max_interval)))
+
+    def due(self, now=None, limit=None):
+        """URLs due for a check, most overdue first"""
+        now = time.time() if now is None else now
+        urls = sorted((e['due'], url) for url, e in self.entries.iteritems()
+                      if e['due'] <= now)
+        return [url for _, url in urls[:limit]]
+
+    def next_due(self):
+        """Time the next campground comes due, None if there are none"""
+        if not self.entries:
+            return None
+        return min(e['due'] for e in self.entries.itervalues())
+
+    def record(self, url, record, now=None):
+        """Updates a campground's history and interval after a check.
+
+        Args:
+            url (str): campground URL.
+            record (dict): parsed page, see
+                :func:`scrape_campsite_data.parse_campground_page`.
+                None if the page could not be fetched.
+            now (float, optional): time of the check.
+
+        Returns:
+            bool: True if the campground's status changed.
+        """
+        now = time.time() if now is None else now
+        entry = self.entries[url]
+        if record is None:
+            # keep the interval, the fetcher already backed off
+            entry['due'] = now + entry['interval']
+            return False
+        digest = page_hash(record)
+        changed = entry['hash'] is not None and digest != entry['hash']
+        status = _first(record.get('Status'))
+        status_changed = (entry['checked'] is not None and
+                          status != entry['status'])
+        if status_changed:
+            entry['changes'] = (entry['changes'] + [now])[
+                -config.refresh_history_size:]
+        season = _first(record.get('Open Season'))
+        if isinstance(season, basestring):
+            entry['season'] = season
+        entry['status'] = status
+        entry['hash'] = digest
+        entry['interval'] = self.next_interval(entry, changed, now)
+        entry['checked'] = now
+        entry['due'] = now + entry['interval']
+        return status_changed
+
+    def requests_per_day(self):
+        """Page requests per day at the current intervals"""
+        return sum(86400.0 / e['interval'] for e in self.entries.itervalues())
+
+def check(url):
+    """Fetches and parses a campground page; None if it failed"""
+    import scrape_campsite_data as scd
+    try:
+        html = scd.fetch_campground_page(url)
+    except fetch.FetchError as e:
+        print 'could not check {}: {}'.format(url, e)
+        return None
+    return scd.parse_campground_page(html, url)
+
+def discover(schedule, now=None):
+    """Adds the campgrounds listed on the configured forests' pages"""
+    import scrape_campsite_data as scd
+    now = time.time() if now is None else now
+    added = 0
+    for forest, forest_url in scd.configured_forest_urls().iteritems():
+        try:
+            listed = scd.get_campground_urls(forest_url)
+        except fetch.FetchError as e:
+            print 'could not list {}: {}'.format(forest, e)
+            continue
+        for name, url in listed:
+            added += schedule.add(url, name, now=now)
+    schedule.listed = now
+    return added
+
+def refresh_due(schedule, on_change=None, now=None, threads=None):
+    """Checks every campground that is due.
+
+    Args:
+        schedule (RefreshSchedule): schedule to check and update.
+        on_change (func, optional): called with the name, URL and new
+            status of every campground whose status changed.
+        now (float, optional): current time.
+        threads (int, optional): pages fetched at once. Defaults to
+            config.fetch_threads.
+
+    Returns:
+        int: number of campgrounds checked.
+    """
+    urls = schedule.due(now)
+    if not urls:
+        return 0
+    pool = ThreadPool(threads or config.fetch_threads)
+    try:
+        records = pool.map(check, urls)
+    finally:
+        pool.close()
+    checked_at = time.time() if now is None else now
+    for url, record in zip(urls, records):
+        if schedule.record(url, record, checked_at) and on_change is not None:
+            entry = schedule.entries[url]
+            on_change(entry['name'], url, entry['status'])
+    return len(urls)
+
+def run(schedule, on_change=None, once=False):
+    """Keeps the campgrounds refreshed until interrupted.
+
+    The configured forests' listings are read again every
+    config.refresh_listing_interval to pick up new campgrounds.
+
+    Args:
+        schedule (RefreshSchedule): schedule to run.
+        on_change (func, optional): see :func:`refresh_due`.
+        once (bool, optional): check what is due once, then return.
+    """
+    while True:
+        now = time.time()
+        if now - schedule.listed >= config.refresh_listing_interval:
+            print 'found {} new campgrounds'.format(discover(schedule, now))
+        checked = refresh_due(schedule, on_change)
+        schedule.save()
+        if checked:
+            print 'checked {} campgrounds, {:.0f} requests/day'.format(
+                checked, schedule.requests_per_day())
+        if once:
+            return
+        wait = (schedule.next_due() or now + 60) - time.time()
+        time.sleep(min(max(wait, 1), 60))
+
+def main(sheet=False, once=False):
+    """Runs the refresh schedule in config.refresh_schedule_file
+
+    Args:
+        sheet (bool, optional): write status changes to the Google
+            sheet of update_campstatus.SHEET_KEY.
+        once (bool, optional): see :func:`run`.
+    """
+    schedule = RefreshSchedule()
+    if not schedule.entries and os.path.exists(config.scraped_file):
+        added = schedule.seed(pd.read_csv(config.scraped_file))
+        print 'seeded {} campgrounds from {}'.format(
+            added, config.scraped_file)
+
+    def report(name, url, status):
+        print u'{}\t{}'.format(name, status)
+    on_change = report
+    if sheet:
+        import identity
+        import update_campstatus as uc
+        worksheet = uc.open_camping_sheet(uc.SHEET_KEY)
+        index = identity.index_sheet(worksheet)
+
+        def on_change(name, url, status):
+            report(name, url, status)
+            uc.update_sheet(worksheet, name, status, index=index, url=url)
+    run(schedule, on_change, once)
+
+if __name__ == '__main__':
+    main()
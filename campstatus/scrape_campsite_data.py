@@ -2,17 +2,32 @@
 
 Attributes:
     url_pref (str): prefix for the forest service
+    CAMPGROUND_MARKERS (list(str, )): texts locating the fields of a
+        campground page.
+    MUNGED_COLUMNS (list(str, )): raw columns read by
+        :func:`munge_campground_data`.
 
 """
-from bs4 import BeautifulSoup
-import update_campstatus as uc
-import requests
+import extraction
+import identity
+import fetch
+import page_store
 import re
 import pandas as pd
 import config
 
 url_pref = 'https://www.fs.usda.gov'
 
+# heading above the campground links of a forest's listing page
+LISTING_HEADING = 'Campground Camping Areas'
+
+# texts locating the fields of a campground page, see extraction.parse_page
+CAMPGROUND_MARKERS = extraction.schema_markers(extraction.CAMPGROUND_SCHEMA)
+
+# raw columns read by munge_campground_data, which may be missing from
+# pages without an "At a Glance" table
+MUNGED_COLUMNS = ['Reservations', 'Fees', 'Water', 'Restroom', 'Elevation']
+
 def get_campground_urls(forest_url):
     """Retrieves all the urls for campgrounds in a national forest.
     
@@ -28,21 +43,10 @@ def get_campground_urls(forest_url):
         * :func:`scrape_all_forests`
 
     """
-    r = requests.get(forest_url)
-    soup = BeautifulSoup(r.text, 'html.parser')
-    urls = []
-    for i in soup.find_all(re.compile("h\d")):
-        if 'Campground Camping Areas' in i.contents:
-            for j in i.find_next_siblings('ul'):
-                for k in j.findAll('a'):
-                    url = k.get('href')
-                    s = k.contents[0].string
-                    if s is not None:
-                        if s.endswith('Campground'):
-                            if not url.endswith('.pdf') and url is not None:
-                                url = url_pref + url
-                                urls.append([s, url])
-    return urls
+    r = fetch.get(forest_url)
+    soup = extraction.parse_page(r.text, [LISTING_HEADING])
+    return extraction.extract_listing(
+        soup, LISTING_HEADING, suffix='Campground')
 
 def find_tag_containing_text(tag, text):
     """BeautifulSoup find_all function to find tags that contain a text pattern
@@ -59,9 +63,7 @@ def find_tag_containing_text(tag, text):
             if not.
     
     See Also:
-        * :func:`find_elevation_div`
-        * :func:`find_latitude_div`
-        * :func:`find_longitude_tag`
+        * :func:`find_link_url`
 
     """
     result = False
@@ -73,150 +75,77 @@ def find_tag_containing_text(tag, text):
             pass
     return result
 
-def find_campground_a(tag):
-    """Helper to find tags about campgrounds.
-    
-    Args:
-        tag (bs4.element.tag): Tag from BeautifulSoup parsed HTML site.
-    
-    Returns:
-        bool: True when the text 'Campground Camping' was found in the tag's contents,
-            False if not.
-
-    See Also:
-        * :func:`find_value`
-    """
-    return find_tag_containing_text(tag, 'Campground Camping')
+def get_campground_data(url):
+    """Scrapes all the desired data for a campground.
 
-def find_elevation_div(tag):
-    """Helper to find tags about elevation.
+    Collects all of the data in the "At a Glance" section of the
+    campground webpage, elevation, longitude, and latitude on the
+    side of the webpage, and the area status, using
+    :data:`extraction.CAMPGROUND_SCHEMA`. The dictionary
+    is then converted to a pandas.DataFrame, which will eventually be
+    a row in the final table.
     
     Args:
-        tag (bs4.element.tag): Tag from BeautifulSoup parsed HTML site.
+        url (str): URL to the campground webpage.
     
     Returns:
-        bool: True when the text 'elevation' was found in the tag's contents,
-            False if not.
+        pandas.DataFrame: single-row table with columns of all the
+            data that was scraped.
 
     See Also:
-        * :func:`find_value`
+        * :func:`scrape_campsite_data`
     """
-    return find_tag_containing_text(tag, 'elevation :')
-
-def find_latitude_div(tag):
-    """Helper to find tags about elevation.
-    
-    Args:
-        tag (bs4.element.tag): Tag from BeautifulSoup parsed HTML site.
-    
-    Returns:
-        bool: True when the text 'latitude' was found in the tag's contents,
-            False if not.
+    return pd.DataFrame(parse_campground_page(fetch_campground_page(url), url))
 
-    See Also:
-        * :func:`find_value`
-    """
-    return find_tag_containing_text(tag, 'latitude :')
+def fetch_campground_page(url, fetcher=None):
+    """Fetches a campground webpage and keeps it in the page store.
 
-def find_longitude_tag(tag):
-    """Helper to find tags about elevation.
-    
     Args:
-        tag (bs4.element.tag): Tag from BeautifulSoup parsed HTML site.
-    
-    Returns:
-        bool: True when the text 'longitude' was found in the tag's contents,
-            False if not.
-
-    See Also:
-        * :func:`find_value`
-    """
-    return find_tag_containing_text(tag, 'longitude :') 
-
-def find_value(soup, tag_function):
-    """Gets the value in the element after the first found tag.
+        url (str): URL to the campground webpage.
+        fetcher (fetch.Fetcher, optional): Defaults to the shared one.
 
-    This is used to scrape the table in the campground's side bar that
-    contains elevation, latitude, and longitude data. These data are
-    in divs, not an HTML table. For example, the data for elevation is
-    in the div after the div that contains the text "elevation". This
-    function finds the first tag containing certain text, then returns
-    the contents of the first sibling after that element.
-    
-    Args:
-        soup (bs4.BeautifulSoup): Parsed HTML text of campground website.
-        tag_function (func): function to find tags whose contents
-            contain the desired text.
-    
     Returns:
-        str: Contents of the element after the tag that contains the
-            searched-for text.
+        str: HTML text of the page.
+
+    Raises:
+        fetch.FetchError: if the page could not be fetched.
 
-    Examples:
-        >>> find_value(soup, find_elevation_tag)
-        '5,000 ft'
-    
     See Also:
-        * :func:`get_campground_data`
+        * :mod:`page_store`
     """
-    tag = soup.find_all(tag_function)[0]
-    val = tag.findNextSiblings()[0].text.strip()
-    return val
+    html = (fetcher or fetch.default_fetcher()).get(url).text
+    page_store.keep(url, html, CAMPGROUND_MARKERS)
+    return html
 
-def get_campground_data(url):
-    """Scrapes all the desired data for a campground.
+def parse_campground_page(html, url):
+    """Parses a fetched campground webpage into a dictionary of fields.
+
+    This is the CPU-bound half of :func:`get_campground_data`. It only
+    takes and returns plain python objects, so it can be run in a
+    worker process.
 
-    Collects all of the data in the "At a Glance" section of the
-    campground webpage, and elevation, longitude, and latitude on the
-    side of the webpage and stores it in a dictionary. The dictionary
-    is then converted to a pandas.DataFrame, which will eventually be
-    a row in the final table.
-    
     Args:
-        url (str): URL to the campground webpage.
-    
+        html (str): HTML text of the campground webpage.
+        url (str): URL the page was fetched from.
+
     Returns:
-        pandas.DataFrame: single-row table with columns of all the
-            data that was scraped.
+        dict: column name to value(s). "At a Glance" values are lists,
+            see :func:`extraction.apply_schema`.
 
     See Also:
-        * :func:`scrape_campsite_data`
+        * :func:`pipeline.scrape_all_forests_pipelined`
     """
-    # parse the html
-    r = requests.get(url)
-    soup=BeautifulSoup(r.text, 'html.parser')
-
-    # get the 'at a glance' table data
-    table_data = {}
-    for i in soup.find_all(re.compile("h\d")):
-        if 'At a Glance' in i.contents:
-            for j in i.find_next_siblings('div'):
-                for k in j.findChildren('tr'):
-                    header = k.find('th').string.replace(':', '')
-                    content = k.find('td').get_text().replace(u'\xa0', '').strip()
-                    if table_data.get(header) is None:
-                        table_data[header] = [content]
-                    else:
-                        table_data[header].append(content)
-
-    # get the data from the sidebar
-    side_div_funcs = {
-    'Elevation': find_elevation_div,
-    'Longitude': find_longitude_tag,
-    'Latitude': find_latitude_div,
-    }
-    for label, tag_func in side_div_funcs.iteritems():
-        try:
-            val = find_value(soup, tag_func)
-        except Exception as e:
-            val = pd.np.nan
-        table_data[label] = val
-
-    # get the open/closed status
-    status = uc.get_campground_status(url)
-    table_data['Status'] = status
+    # only the parts of the page holding the fields are parsed
+    soup = extraction.parse_page(html, CAMPGROUND_MARKERS)
+
+    # get the 'at a glance' table, sidebar and status in one pass
+    table_data = extraction.apply_schema(soup)
+    for label in ['Elevation', 'Longitude', 'Latitude']:
+        table_data.setdefault(label, pd.np.nan)
+    table_data.setdefault('Status', None)
     table_data['URL'] = url
-    return pd.DataFrame(table_data)
+    table_data['Campground ID'] = identity.campground_id(url)
+    return table_data
 
 def scrape_campsite_data(urls):
     """Creates a table of campground data given a list of campground URLs.
@@ -234,10 +163,18 @@ def scrape_campsite_data(urls):
     """
     rows = []
     for campground, camp_url in urls:
-        data = get_campground_data(camp_url)
+        try:
+            data = get_campground_data(camp_url)
+        except fetch.FetchError as e:
+            # a removed or unreachable page leaves an empty row
+            print 'could not fetch {}: {}'.format(camp_url, e)
+            data = pd.DataFrame({
+                'URL': [camp_url],
+                'Campground ID': [identity.campground_id(camp_url)],
+                }, columns=MUNGED_COLUMNS + ['URL', 'Campground ID'])
         data['Campground'] = campground
         rows.append(data)
-    df = pd.concat(rows).reset_index(drop=True)
+    df = pd.concat(rows, sort=False).reset_index(drop=True)
     return df
 
 def munge_reservations(cell):
@@ -393,11 +330,13 @@ def munge_elevation(cell):
             elev_int = '???'
     return elev_int
 
-def munge_campground_data(df):
+def munge_campground_data(df, columns=None):
     """Summary
     
     Args:
         df (TYPE): Description
+        columns (list(str, ), optional): columns of the final table.
+            Defaults to config.campgrounds_final_table_columns.
     
     Returns:
         TYPE: Description
@@ -416,12 +355,39 @@ def munge_campground_data(df):
     df.fillna('', inplace=True)
 
     # empty dataframe containing all the desired columns
-    coltable = pd.DataFrame(columns=config.campgrounds_final_table_columns)
+    columns = columns or config.campgrounds_final_table_columns
+    coltable = pd.DataFrame(columns=columns)
     df = pd.concat([coltable, df])
 
-    return df[config.campgrounds_final_table_columns]
+    return df[columns]
+
+def activity_url(forest_name, recreation_type):
+    """URL of a forest's page for one recreation activity"""
+    return ('https://www.fs.usda.gov/activity/{}/recreation/{}'
+            .format(forest_name, recreation_type))
+
+def find_link_url(soup, text):
+    """Full URL of the first link whose text contains `text`.
+
+    Args:
+        soup (bs4.BeautifulSoup): Parsed HTML text of an activity page.
+        text (str): link text to look for. Case insensitive.
+
+    Returns:
+        str: URL of the link, or None if there is no such link.
+    """
+    tags = soup.find_all(lambda tag: find_tag_containing_text(tag, text))
+    if not tags:
+        return None
+    tag = tags[0]
+    if tag.get('href') is None:
+        tag = tag.findParent('a')
+    if tag is None or tag.get('href') is None:
+        return None
+    return url_pref + tag.get('href')
 
-def get_forest_rec_url(forest_name, recreation_type='camping-cabins'):
+def get_forest_rec_url(forest_name, recreation_type='camping-cabins',
+                       link_text='Campground Camping'):
     """Retrieves the url for the website listing all the campgrounds
     or trailheads.
 
@@ -432,26 +398,84 @@ def get_forest_rec_url(forest_name, recreation_type='camping-cabins'):
             the national forests that you want to scrape. Not case
             sensitive, but must match what is in the config file lookup
         recreation_type (str, optional): either camping-cabins or hiking
+        link_text (str, optional): text of the link to the listing on
+            the activity page.
     
     Returns:
         dict: key is the forest_name and value is url pointing to the
             main page that contains links to each campground or hiking
             trail in the forest.
     
+    See Also:
+        * :func:`discover_recreation`
     """
-    url = (
-        'https://www.fs.usda.gov/activity/{}/recreation/{}'
-        .format(forest_name, recreation_type))
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text, 'html.parser')
-    tag = soup.find_all(find_campground_a)[0]
-
-    if tag.get('href') is None:
-        tag = tag.findParent('a')
-    suffix = tag.get('href')
-    url = url_pref + suffix
+    r = fetch.get(activity_url(forest_name, recreation_type))
+    soup = extraction.parse_page(r.text, [link_text])
+    url = find_link_url(soup, link_text)
+    if url is None:
+        raise ValueError('no {} link for {}'.format(link_text, forest_name))
     return url
 
+def discover_recreation(forest_name, kinds=None):
+    """Lists the areas of several recreation types of a forest in one pass.
+
+    Every activity page and every listing page is fetched and parsed
+    once, however many of the requested types it serves, e.g. day
+    hiking and backpacking are both linked from the hiking page.
+
+    Args:
+        forest_name (str): forest URL descriptor, a key of
+            config.AllNationalForests.
+        kinds (list(str, ), optional): keys of config.recreation_types.
+            Defaults to config.recreation_types_to_scrape.
+
+    Returns:
+        dict: recreation type to a list of [name, URL] of its areas.
+            Types the forest has no listing for, or whose pages could
+            not be fetched, are left out.
+
+    See Also:
+        * :func:`pipeline.scrape_recreation_pipelined`
+    """
+    kinds = kinds or config.recreation_types_to_scrape
+    by_activity = {}
+    for kind in kinds:
+        activity = config.recreation_types[kind]['activity']
+        by_activity.setdefault(activity, []).append(kind)
+
+    by_listing = {}
+    for activity, group in sorted(by_activity.iteritems()):
+        try:
+            r = fetch.get(activity_url(forest_name, activity))
+        except fetch.FetchError as e:
+            print 'could not fetch {} of {}: {}'.format(
+                activity, forest_name, e)
+            continue
+        soup = extraction.parse_page(r.text, [
+            config.recreation_types[kind]['link'] for kind in group])
+        for kind in group:
+            url = find_link_url(soup, config.recreation_types[kind]['link'])
+            if url is None:
+                print 'no {} listing for {}'.format(kind, forest_name)
+                continue
+            by_listing.setdefault(url, []).append(kind)
+
+    found = {}
+    for url, group in sorted(by_listing.iteritems()):
+        try:
+            r = fetch.get(url)
+        except fetch.FetchError as e:
+            print 'could not list {} of {}: {}'.format(
+                ', '.join(group), forest_name, e)
+            continue
+        soup = extraction.parse_page(r.text, [
+            config.recreation_types[kind]['heading'] for kind in group])
+        for kind in group:
+            spec = config.recreation_types[kind]
+            found[kind] = extraction.extract_listing(
+                soup, spec['heading'], spec.get('suffix'))
+    return found
+
 def scrape_all_forests(URLS):
     """Summary
     
@@ -464,26 +488,91 @@ def scrape_all_forests(URLS):
     collect = []
     for forest, url in URLS.iteritems():
         print 'scraping {} National Forest'.format(forest)
-        urls = get_campground_urls(url)
+        try:
+            urls = get_campground_urls(url)
+        except fetch.FetchError as e:
+            print 'could not list {}: {}'.format(forest, e)
+            continue
+        if not urls:
+            continue
         df = scrape_campsite_data(urls)
         df = munge_campground_data(df)
         df.loc[:, 'Forest'] = forest
         collect.append(df)
-    final = pd.concat(collect)
+    if not collect:
+        return pd.DataFrame(
+            columns=config.campgrounds_final_table_columns + ['Forest'])
+    # one row label per campground; the per-forest tables each start at 0
+    final = pd.concat(collect).reset_index(drop=True)
     return final
 
-def main():
-    # make the forest urls
+def typed_campground_table(df):
+    """Converts the numeric columns of a munged table to numbers.
+
+    :func:`munge_campground_data` fills missing values with '' and
+    :func:`munge_elevation` marks unreadable elevations with '???',
+    which leaves Elevation, Latitude and Longitude as object columns.
+    Both become NaN here, so the table can be handed to
+    :mod:`analyze_campgrounds` without a csv round trip.
+
+    Args:
+        df (pandas.DataFrame): munged campground table.
+
+    Returns:
+        pandas.DataFrame: copy of `df` with float Elevation, Latitude
+            and Longitude columns, and a fresh 0..n-1 index, as if read
+            back from a csv.
+    """
+    df = df.reset_index(drop=True)
+    for col in ['Elevation', 'Latitude', 'Longitude']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def report_traffic():
+    """Prints the bytes fetched per forest, and stored by the page store"""
+    print fetch.default_fetcher().traffic.report()
+    store = page_store.default_store()
+    if store is not None:
+        print store.report()
+
+def configured_forest_urls():
+    """Campground listing URL of each forest in config.forests_to_scrape
+
+    Returns:
+        dict: full forest name to the forest's campground listing URL.
+            Forests whose pages could not be fetched, or have no
+            campground listing link, are left out.
+    """
     forest_urls = {}
     for forest in config.forests_to_scrape:
         full_name = config.AllNationalForests[forest]
-        url = get_forest_rec_url(forest)
+        try:
+            url = get_forest_rec_url(forest)
+        except (fetch.FetchError, ValueError) as e:
+            print 'could not find the campgrounds of {}: {}'.format(
+                full_name, e)
+            continue
         forest_urls[full_name] = url
+    return forest_urls
+
+def main(persist=True):
+    """Scrapes the configured forests.
+
+    Args:
+        persist (bool, optional): write the table to config.scraped_file.
+
+    Returns:
+        pandas.DataFrame: the munged campground table.
+    """
+    forest_urls = configured_forest_urls()
     print 'These forests will be scraped:'
     print forest_urls.keys()
     print
     final = scrape_all_forests(forest_urls)
-    final.to_csv('./scraped_campgrounds.csv', index=False)
+    if persist:
+        final.to_csv(config.scraped_file, index=False)
+    report_traffic()
+    return final
 
 if __name__ == '__main__':
     main()
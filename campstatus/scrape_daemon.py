@@ -0,0 +1,441 @@
+"""Resident scraper daemon
+
+A cron job that runs scrape_campsite_data.py or update_campstatus.py
+starts from nothing every time: interpreter start up and imports, new
+TLS connections to NFS, looking up every forest's listing URL again
+and authorizing with Google Sheets again. The daemon pays for that
+once, then keeps warm:
+
+* the shared fetch.Fetcher and a fixed pool of worker threads, so the
+  requests.Session of every worker keeps its connections open,
+* a :class:`Catalog` of forest listing URLs and campground listings,
+* a :class:`PageCache` of parsed campground pages,
+* the authorized worksheet and its identity index.
+
+Jobs are sent over a Unix socket (config.daemon_socket) and run as
+soon as they arrive. A request is one line of JSON with the 'job' name
+and its parameters; the reply is one line of JSON::
+
+    python cli.py daemon &
+    python cli.py job status
+    python cli.py job scrape --forests eldorado tahoe
+    python cli.py job sync-sheet
+
+Jobs:
+
+* ping: uptime, cache sizes and the number of jobs run.
+* status: statuses of the campgrounds at 'urls', or of every
+  campground of update_campstatus.FOREST_URLS.
+* scrape: scrapes 'forests' (URL descriptors, defaults to
+  config.forests_to_scrape) to config.scraped_file, unless 'persist'
+  is false.
+* sync-sheet: updates the statuses in the Google sheet, like
+  update_campstatus.py.
+* flush: empties the caches named in 'caches' (pages, catalog,
+  sheet), or all of them.
+* stop: shuts the daemon down.
+
+Pages are reused while younger than config.daemon_page_ttl seconds, or
+the 'max_age' parameter of a job; 'max_age': 0 fetches everything.
+
+"""
+import collections
+import json
+import os
+import socket
+import SocketServer
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import fetch
+import config
+
+class DaemonError(Exception):
+    """A job failed, or the daemon could not be reached"""
+
+class Catalog(object):
+    """Forest listing URLs and the campgrounds listed on them.
+
+    A forest's listing URL is looked up once. Its campground listing is
+    read again after config.daemon_listing_ttl seconds.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = config.daemon_listing_ttl if ttl is None else ttl
+        self.forest_urls = {}
+        self.listings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.listings)
+
+    def forest_url(self, forest):
+        """Campground listing URL of a forest URL descriptor"""
+        import scrape_campsite_data as scd
+        with self._lock:
+            url = self.forest_urls.get(forest)
+        if url is None:
+            url = scd.get_forest_rec_url(forest)
+            with self._lock:
+                self.forest_urls[forest] = url
+        return url
+
+    def campgrounds(self, listing_url, now=None, suffix=None):
+        """[name, URL] of the campgrounds on a listing page
+
+        Args:
+            listing_url (str): forest's campground listing URL.
+            now (float, optional): time of the request.
+            suffix (str, optional): only keep names ending with it, as
+                :func:`scrape_campsite_data.get_campground_urls` does.
+                Every listed area is returned without it, as
+                :func:`update_campstatus.list_campgrounds` does.
+        """
+        import update_campstatus as uc
+        now = time.time() if now is None else now
+        with self._lock:
+            listed = self.listings.get(listing_url)
+        if listed is None or now - listed[0] >= self.ttl:
+            listed = (now, uc.list_forest_campgrounds(listing_url))
+            with self._lock:
+                self.listings[listing_url] = listed
+        if suffix is None:
+            return listed[1]
+        return [[name, url] for name, url in listed[1]
+                if name.endswith(suffix)]
+
+    def clear(self):
+        with self._lock:
+            self.forest_urls.clear()
+            self.listings.clear()
+
+class PageCache(object):
+    """Parsed campground pages, oldest dropped first when full.
+
+    Attributes:
+        hits (int): pages served from the cache.
+        misses (int): pages fetched.
+    """
+
+    def __init__(self, ttl=None, size=None):
+        self.ttl = config.daemon_page_ttl if ttl is None else ttl
+        self.size = size or config.daemon_page_cache_size
+        self.pages = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pages)
+
+    def get(self, url, max_age=None):
+        """Parsed page of a campground, fetched if not fresh enough.
+
+        Args:
+            url (str): campground URL.
+            max_age (float, optional): oldest acceptable page, in
+                seconds. Defaults to the cache's ttl.
+
+        Returns:
+            dict: see :func:`scrape_campsite_data.parse_campground_page`.
+                None if the page could not be fetched.
+        """
+        import scrape_campsite_data as scd
+        max_age = self.ttl if max_age is None else max_age
+        now = time.time()
+        with self._lock:
+            cached = self.pages.get(url)
+            if cached is not None and now - cached[0] < max_age:
+                self.hits += 1
+                return dict(cached[1])
+            self.misses += 1
+        try:
+            data = scd.parse_campground_page(
+                scd.fetch_campground_page(url), url)
+        except fetch.FetchError as e:
+            print 'could not fetch {}: {}'.format(url, e)
+            return None
+        with self._lock:
+            self.pages.pop(url, None)
+            self.pages[url] = (now, data)
+            while len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+        return dict(data)
+
+    def clear(self):
+        with self._lock:
+            self.pages.clear()
+
+class ScraperDaemon(object):
+    """Warm state shared by the jobs, and the jobs themselves.
+
+    Every job method takes the request's parameters as keyword
+    arguments and returns a JSON-ready dictionary.
+    """
+
+    def __init__(self, threads=None):
+        self.started = time.time()
+        self.catalog = Catalog()
+        self.pages = PageCache()
+        self.jobs_run = collections.Counter()
+        # the worker threads live as long as the daemon, and so do
+        # their sessions and connections
+        self.pool = ThreadPool(threads or config.fetch_threads)
+        self._sheet = None
+        self._sheet_lock = threading.Lock()
+        self.server = None
+
+    def sheet(self):
+        """Authorized worksheet of update_campstatus.SHEET_KEY and its index
+
+        Opened again after config.daemon_sheet_ttl seconds.
+        """
+        import identity
+        import update_campstatus as uc
+        with self._sheet_lock:
+            if (self._sheet is None or
+                    time.time() - self._sheet[0] >= config.daemon_sheet_ttl):
+                worksheet = uc.open_camping_sheet(uc.SHEET_KEY)
+                self._sheet = (time.time(), worksheet,
+                               identity.index_sheet(worksheet))
+            return self._sheet[1], self._sheet[2]
+
+    def _get_pages(self, urls, max_age=None):
+        return self.pool.map(
+            lambda url: self.pages.get(url, max_age), urls)
+
+    def _status_campgrounds(self):
+        import update_campstatus as uc
+        campgrounds = []
+        for listing_url in uc.FOREST_URLS:
+            campgrounds.extend(self.catalog.campgrounds(listing_url))
+        return campgrounds
+
+    def ping(self):
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'pages': len(self.pages),
+            'page_hits': self.pages.hits,
+            'page_misses': self.pages.misses,
+            'listings': len(self.catalog),
+            'sheet': self._sheet is not None,
+            'jobs': dict(self.jobs_run),
+            'traffic': fetch.default_fetcher().traffic.snapshot(),
+            }
+
+    def status(self, urls=None, max_age=None):
+        if urls:
+            campgrounds = [[url, url] for url in urls]
+        else:
+            campgrounds = self._status_campgrounds()
+        pages = self._get_pages([url for _, url in campgrounds], max_age)
+        return {'statuses': [
+            {'name': name, 'url': url,
+             'status': page.get('Status') if page else None}
+            for (name, url), page in zip(campgrounds, pages)]}
+
+    def scrape(self, forests=None, max_age=None, persist=True):
+        import pandas as pd
+        import pipeline
+        import scrape_campsite_data as scd
+        forests = forests or config.forests_to_scrape
+        collect = []
+        failed = 0
+        failed_forests = []
+        for forest in forests:
+            full_name = config.AllNationalForests[forest]
+            try:
+                # the same campgrounds as scrape_campsite_data.py scrapes
+                listed = self.catalog.campgrounds(
+                    self.catalog.forest_url(forest), suffix='Campground')
+            except (fetch.FetchError, ValueError) as e:
+                print 'could not list {}: {}'.format(full_name, e)
+                failed_forests.append(full_name)
+                continue
+            pages = self._get_pages([url for _, url in listed], max_age)
+            frames = []
+            for (name, url), data in zip(listed, pages):
+                if data is None:
+                    failed += 1
+                    continue
+                data['Campground'] = name
+                frames.append(pipeline._campground_frame(data))
+            if not frames:
+                continue
+            df = pd.concat(
+                [pd.DataFrame(columns=scd.MUNGED_COLUMNS)] + frames,
+                sort=False).reset_index(drop=True)
+            df = scd.munge_campground_data(df)
+            df.loc[:, 'Forest'] = full_name
+            collect.append(df)
+        rows = 0
+        if collect:
+            final = pd.concat(collect).reset_index(drop=True)
+            rows = len(final)
+            if persist:
+                final.to_csv(config.scraped_file, index=False,
+                             encoding='utf-8')
+        return {'campgrounds': rows, 'failed': failed,
+                'failed_forests': failed_forests}
+
+    def sync_sheet(self, max_age=None):
+        import update_campstatus as uc
+        try:
+            worksheet, index = self.sheet()
+            checked = 0
+            for row in self.status(max_age=max_age)['statuses']:
+                if row['status'] is None:
+                    continue
+                uc.update_sheet(worksheet, row['name'], row['status'],
+                                index=index, url=row['url'])
+                checked += 1
+        except Exception:
+            # a stale token or a changed sheet: open it again next time
+            with self._sheet_lock:
+                self._sheet = None
+            raise
+        return {'checked': checked}
+
+    def flush(self, caches=None):
+        caches = caches or ['pages', 'catalog', 'sheet']
+        if 'pages' in caches:
+            self.pages.clear()
+        if 'catalog' in caches:
+            self.catalog.clear()
+        if 'sheet' in caches:
+            with self._sheet_lock:
+                self._sheet = None
+        return {'flushed': caches}
+
+    def stop(self):
+        # shutdown() waits for serve_forever to return, so it cannot be
+        # called from the request's own thread
+        threading.Thread(target=self.server.shutdown).start()
+        return {'stopping': True}
+
+    JOBS = {
+        'ping': ping,
+        'status': status,
+        'scrape': scrape,
+        'sync-sheet': sync_sheet,
+        'flush': flush,
+        'stop': stop,
+        }
+
+    def run(self, request):
+        """Runs the job of a request.
+
+        Args:
+            request (dict): 'job' name and keyword parameters.
+
+        Returns:
+            dict: the job's result, or an 'error'.
+        """
+        request = dict(request)
+        name = request.pop('job', None)
+        job = self.JOBS.get(name)
+        if job is None:
+            return {'error': 'unknown job {}'.format(name)}
+        start = time.time()
+        try:
+            result = job(self, **dict((str(k), v)
+                                      for k, v in request.iteritems()))
+        except Exception as e:
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        self.jobs_run[name] += 1
+        result['seconds'] = round(time.time() - start, 3)
+        return result
+
+class JobHandler(SocketServer.StreamRequestHandler):
+    """Reads one JSON request line and writes one JSON reply line"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            reply = {'error': 'bad request'}
+        else:
+            reply = self.server.daemon.run(request)
+        self.wfile.write(json.dumps(reply) + '\n')
+
+class DaemonServer(SocketServer.ThreadingMixIn,
+                   SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        SocketServer.UnixStreamServer.__init__(self, path, JobHandler)
+        self.daemon = daemon
+        daemon.server = self
+
+def _running(path):
+    """True if a daemon answers on the socket at `path`"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        return False
+    finally:
+        client.close()
+    return True
+
+def send(job, path=None, timeout=None, **params):
+    """Runs a job on the daemon and returns its result.
+
+    Args:
+        job (str): name of the job, see the module docstring.
+        path (str, optional): Defaults to config.daemon_socket.
+        timeout (float, optional): seconds to wait for the reply.
+            Waits as long as the job takes by default.
+        **params: the job's parameters.
+
+    Returns:
+        dict: the job's result.
+
+    Raises:
+        DaemonError: the daemon is not running, or the job failed.
+    """
+    request = dict(params, job=job)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path or config.daemon_socket)
+        client.sendall(json.dumps(request) + '\n')
+        reply = client.makefile('rb').readline()
+    except socket.error as e:
+        raise DaemonError('daemon not reachable: {}'.format(e))
+    finally:
+        client.close()
+    if not reply:
+        raise DaemonError('no reply from the daemon')
+    reply = json.loads(reply)
+    if 'error' in reply:
+        raise DaemonError(reply['error'])
+    return reply
+
+def main(path=None):
+    """Runs the daemon on `path` (config.daemon_socket) until stopped"""
+    path = path or config.daemon_socket
+    if os.path.exists(path):
+        if _running(path):
+            raise DaemonError('a daemon is already running on {}'.format(path))
+        # left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+    daemon = ScraperDaemon()
+    # the socket is created by bind, so it must be private from the start
+    umask = os.umask(0177)
+    try:
+        server = DaemonServer(path, daemon)
+    finally:
+        os.umask(umask)
+    print 'daemon listening on {}'.format(path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.pool.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
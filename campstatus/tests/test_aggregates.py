@@ -0,0 +1,77 @@
+"""Incremental summaries must see every changed campground"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import aggregates
+import config
+
+def analyzed():
+    return pd.DataFrame({
+        'Forest': ['Eldorado', 'Eldorado', 'Tahoe', 'Tahoe'],
+        'Geo Group': [0, 0, 1, 2],
+        'Campground ID': ['17875', '17876', '6000', '6000'],
+        'URL': ['u1', 'u2', 'u3', 'u4'],
+        'Status': ['Open', 'Open', 'Open', 'Closed'],
+        'Fees': ['$20', '$22', '', '$10'],
+        'Potable Water': [True, False, True, True],
+        'Elevation': [4900.0, 5000.0, 6000.0, 6100.0],
+        'Latitude': [38.8, 38.81, 39.3, 39.4],
+        'Longitude': [-120.3, -120.31, -120.5, -120.6],
+        })
+
+class RowHashesTest(unittest.TestCase):
+
+    def test_same_keys_after_csv(self):
+        df = analyzed()
+        buffer = io.BytesIO()
+        df.to_csv(buffer, index=False)
+        buffer.seek(0)
+        read = pd.read_csv(buffer)
+        self.assertEqual(read['Campground ID'].dtype.kind, 'i')
+        self.assertEqual(sorted(aggregates.row_hashes(df)),
+                         sorted(aggregates.row_hashes(read)))
+        read['Campground ID'] = read['Campground ID'].astype(float)
+        self.assertEqual(sorted(aggregates.row_hashes(df)),
+                         [u'17875', u'17876', u'6000'])
+        self.assertEqual(sorted(aggregates.row_hashes(read)),
+                         [u'17875', u'17876', u'6000'])
+
+    def test_duplicates_hashed_together(self):
+        df = analyzed()
+        before = aggregates.row_hashes(df)
+        self.assertEqual(before[u'6000'][0], [u'Tahoe|1', u'Tahoe|2'])
+        df.loc[3, 'Status'] = 'Open'
+        after = aggregates.row_hashes(df)
+        self.assertNotEqual(before[u'6000'], after[u'6000'])
+        df.loc[2, 'Status'] = 'Closed'
+        self.assertNotEqual(after[u'6000'], aggregates.row_hashes(df)[u'6000'])
+
+class UpdateSummariesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = (config.group_summary_file, config.forest_summary_file,
+                      config.summary_state_file)
+        config.group_summary_file = os.path.join(self.dir, 'groups.csv')
+        config.forest_summary_file = os.path.join(self.dir, 'forests.csv')
+        config.summary_state_file = os.path.join(self.dir, 'state.json')
+
+    def tearDown(self):
+        (config.group_summary_file, config.forest_summary_file,
+         config.summary_state_file) = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_change_to_duplicate_row(self):
+        df = analyzed()
+        aggregates.update_summaries(df)
+        df.loc[3, 'Status'] = 'Open'
+        groups, forests = aggregates.update_summaries(df)
+        full_groups, full_forests = aggregates.update_summaries(df, full=True)
+        self.assertEqual(groups['Open'].tolist(), full_groups['Open'].tolist())
+        self.assertEqual(forests['Open'].tolist(), [2, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""Grouping a forest's campgrounds with the clustering tree"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import analyze_campgrounds as ac
+import config
+
+def forest():
+    return pd.DataFrame({
+        'Forest': ['Eldorado'] * 4,
+        'Latitude': [38.80, 38.801, 38.90, None],
+        'Longitude': [-120.30, -120.301, -120.10, None],
+        })
+
+class CollapsePointsTest(unittest.TestCase):
+
+    def line(self):
+        # 60 points 40 m apart, 2.4 km end to end
+        return np.column_stack([np.full(60, 38.8),
+                                -120.3 + np.arange(60) * 0.04 / 86.8])
+
+    def test_identical_points(self):
+        X = np.array([[38.8, -120.3], [38.9, -120.1], [38.8, -120.3]])
+        locations, counts, inverse = ac.collapse_points(X)
+        self.assertEqual(len(locations), 2)
+        self.assertEqual(sorted(counts.tolist()), [1.0, 2.0])
+        self.assertEqual(locations[inverse].tolist(), X.tolist())
+
+    def test_default_keeps_near_points(self):
+        locations, _, _ = ac.collapse_points(self.line())
+        self.assertEqual(len(locations), 60)
+
+    def test_no_chaining(self):
+        X = self.line()
+        locations, counts, inverse = ac.collapse_points(X, tolerance_km=0.05)
+        self.assertEqual(counts.sum(), 60)
+        self.assertEqual(len(locations), 30)
+        # every point stays within the tolerance of its location
+        spread = np.abs(X[:, 1] - locations[inverse][:, 1]) * 86.8
+        self.assertLess(spread.max(), 0.05)
+
+class HierarchyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = config.cluster_cache_dir
+        config.cluster_cache_dir = None
+
+    def tearDown(self):
+        config.cluster_cache_dir = self.saved
+
+    def test_without_cache_dir(self):
+        df = ac.hierarchy_group_points(forest(), max_radius=2.5)
+        groups = df['Geo Group'].tolist()
+        self.assertEqual(groups[0], groups[1])
+        self.assertNotEqual(groups[0], groups[2])
+
+    def test_cached_tree(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            built = ac.load_hierarchy(forest(), cache_dir)
+            loaded = ac.load_hierarchy(forest(), cache_dir)
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual(built['fingerprint'], loaded['fingerprint'])
+        self.assertEqual(built['linkage'].tolist(), loaded['linkage'].tolist())
+
+def camps(points):
+    lat, lon = zip(*points)
+    return pd.DataFrame({'Forest': ['Eldorado'] * len(points),
+                         'Latitude': lat, 'Longitude': lon})
+
+class CachedGroupPointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = ac.group_points
+        self.clustered = []
+        def group_points(df, **params):
+            self.clustered.append(len(df))
+            df['Geo Group'] = range(len(df))
+            return df
+        ac.group_points = group_points
+
+    def tearDown(self):
+        ac.group_points = self.saved
+        shutil.rmtree(self.dir)
+
+    def group(self, points):
+        df = ac.cached_group_points(camps(points), self.dir,
+                                    incremental=False)
+        return df['Geo Group'].tolist()
+
+    def test_hit_and_miss(self):
+        points = [(38.80, -120.30), (38.90, -120.10)]
+        self.assertEqual(self.group(points), [0, 1])
+        self.assertEqual(self.clustered, [2])
+        # same points in another order: read back, not clustered again
+        self.assertEqual(self.group(points[::-1]), [1, 0])
+        self.assertEqual(self.clustered, [2])
+        self.group(points + [(39.0, -120.0)])
+        self.assertEqual(self.clustered, [2, 3])
+
+    def test_one_file_per_forest(self):
+        self.group([(38.80, -120.30)])
+        self.group([(38.80, -120.30), (38.90, -120.10)])
+        self.group([(38.90, -120.10)])
+        self.assertEqual(os.listdir(self.dir), ['forest_Eldorado.json'])
+
+def previous_grouping(points, labels):
+    df = camps(points)
+    df['Geo Group'] = labels
+    return {'points': points, 'labels': labels,
+            'centroids': sorted(ac.group_centroids(df).items())}
+
+class IncrementalGroupPointsTest(unittest.TestCase):
+
+    POINTS = [(38.800, -120.300), (38.801, -120.301), (38.802, -120.300),
+              (38.900, -120.100), (38.901, -120.101)]
+    LABELS = [0, 0, 0, 1, 1]
+
+    def update(self, points, **kwargs):
+        previous = previous_grouping(self.POINTS, self.LABELS)
+        kwargs.setdefault('max_changed', 1.0)
+        df = ac.incremental_group_points(camps(points), previous, **kwargs)
+        return None if df is None else df['Geo Group'].tolist()
+
+    def test_nearest_centroid(self):
+        self.assertEqual(self.update(self.POINTS + [(38.899, -120.099)]),
+                         self.LABELS + [1])
+
+    def test_new_group_beyond_max_radius(self):
+        self.assertEqual(self.update(self.POINTS + [(39.5, -121.0)]),
+                         self.LABELS + [2])
+
+    def test_removed_points(self):
+        self.assertEqual(self.update(self.POINTS[1:]), self.LABELS[1:])
+
+    def test_recluster_on_drift(self):
+        # a group 2 km across, clustered when it fit the radius; a point
+        # joining it leaves its mean radius at 0.67 km
+        points = [(38.800, -120.300), (38.818, -120.300)]
+        previous = previous_grouping(points, [0, 0])
+        added = camps(points + [(38.809, -120.300)])
+        self.assertIsNone(ac.incremental_group_points(
+            added.copy(), previous, max_radius=0.5, drift=0.2,
+            max_changed=1.0))
+        df = ac.incremental_group_points(
+            added.copy(), previous, max_radius=0.5, drift=0.5,
+            max_changed=1.0)
+        self.assertEqual(df['Geo Group'].tolist(), [0, 0, 0])
+
+    def test_recluster_when_too_much_changed(self):
+        self.assertIsNone(self.update(self.POINTS + [(39.5, -121.0)],
+                                      max_changed=0.1))
+
+class AlignLabelsTest(unittest.TestCase):
+
+    POINTS = [(38.800, -120.300), (38.801, -120.301), (38.900, -120.100),
+              (38.901, -120.101), (39.300, -120.500)]
+
+    def align(self, points, labels, previous_labels):
+        previous = previous_grouping(self.POINTS, previous_labels)
+        return ac.align_labels(np.array(points), labels, previous)
+
+    def test_renumbered_groups_keep_their_labels(self):
+        # KMeans numbered the same three groups differently
+        self.assertEqual(self.align(self.POINTS, [2, 2, 0, 0, 1],
+                                    [5, 5, 7, 7, 9]),
+                         [5, 5, 7, 7, 9])
+
+    def test_unmatched_group_gets_a_fresh_label(self):
+        points = self.POINTS + [(40.0, -121.0), (40.001, -121.001)]
+        self.assertEqual(self.align(points, [1, 1, 0, 0, 2, 3, 3],
+                                    [5, 5, 7, 7, 9]),
+                         [5, 5, 7, 7, 9, 10, 10])
+
+    def test_split_group(self):
+        # the larger part of a split group keeps the label
+        points = self.POINTS + [(38.802, -120.300)]
+        labels = self.align(points, [0, 0, 1, 1, 2, 3],
+                            [5, 5, 7, 7, 9])
+        self.assertEqual(labels[:5], [5, 5, 7, 7, 9])
+        self.assertNotIn(labels[5], [5, 7, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
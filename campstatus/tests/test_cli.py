@@ -0,0 +1,46 @@
+"""Subcommand imports, and their start up times"""
+import ast
+import inspect
+import os
+import textwrap
+import unittest
+import cli
+import config
+
+HERE = os.path.dirname(os.path.abspath(cli.__file__))
+
+def handler_imports(func):
+    """Modules of this package imported by a subcommand handler"""
+    tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+    return set(name for name in names
+               if os.path.exists(os.path.join(HERE, name + '.py')))
+
+class CommandModulesTest(unittest.TestCase):
+
+    def test_matches_handler_imports(self):
+        parser = cli.build_parser()
+        commands = parser._subparsers._group_actions[0].choices
+        for command, subparser in commands.iteritems():
+            self.assertEqual(
+                set(cli.COMMAND_MODULES.get(command, [])),
+                handler_imports(subparser.get_default('func')), command)
+
+@unittest.skipUnless(os.environ.get('CAMPSTATUS_TIMING_TESTS'),
+                     'set CAMPSTATUS_TIMING_TESTS=1 to time start up')
+class StartupTest(unittest.TestCase):
+
+    def test_within_budget(self):
+        for command in sorted(cli.COMMAND_MODULES):
+            elapsed = cli.measure_startup(command)
+            self.assertLess(
+                elapsed, config.cli_startup_budget,
+                '{} starts in {:.3f}s'.format(command, elapsed))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""A saved compact table loads back with the same values"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from compact_table import CompactTable
+
+def analyzed():
+    return pd.DataFrame({
+        'Campground': [u'Wench Creek', u'Yellowjacket', u'Ice House',
+                       u'Silver Creek'],
+        'Status': ['Open', 'Open', 'Closed', np.nan],
+        'Elevation': [4900.0, np.nan, '', '???'],
+        'Latitude': [38.8875, 38.89, np.nan, 38.7],
+        'Geo Group': [0, 0, 1, 1],
+        'Potable Water': [True, False, np.nan, True],
+        'Flush Toilets': ['True', 'False', 'False', ''],
+        }, columns=['Campground', 'Status', 'Elevation', 'Latitude',
+                    'Geo Group', 'Potable Water', 'Flush Toilets'])
+
+class RoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'table.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def round_trip(self, table):
+        table.save(self.path)
+        return CompactTable.load(self.path)
+
+    def test_values(self):
+        table = CompactTable.from_frame(analyzed())
+        loaded = self.round_trip(table)
+        self.assertEqual(loaded.columns, table.columns)
+        self.assertEqual(len(loaded), 4)
+        df = loaded.to_frame()
+        self.assertEqual(df['Campground'].tolist(), analyzed()['Campground']
+                         .tolist())
+        self.assertEqual(df['Status'].tolist()[:3], ['Open', 'Open', 'Closed'])
+        self.assertTrue(pd.isnull(df['Status'].tolist()[3]))
+        self.assertAlmostEqual(df['Latitude'].tolist()[0], 38.8875, places=4)
+        self.assertTrue(np.isnan(df['Latitude'].tolist()[2]))
+
+    def test_missing_elevations(self):
+        loaded = self.round_trip(CompactTable.from_frame(analyzed()))
+        self.assertEqual(loaded.data['Elevation'].kind, 'int')
+        self.assertEqual(loaded.data['Elevation'].mask().tolist(),
+                         [False, True, True, True])
+        self.assertEqual(loaded.between('Elevation', 0, 5000).tolist(),
+                         [True, False, False, False])
+
+    def test_bools(self):
+        loaded = self.round_trip(CompactTable.from_frame(analyzed()))
+        self.assertEqual(loaded.data['Flush Toilets'].kind, 'bool')
+        water = loaded.data['Potable Water'].values().tolist()
+        self.assertEqual(water[:2], [True, False])
+        self.assertTrue(pd.isnull(water[2]))
+        self.assertEqual(water[3], True)
+        self.assertEqual(loaded.isin('Flush Toilets', [True]).tolist(),
+                         [True, False, False, False])
+        self.assertEqual(loaded.isin('Potable Water', [False]).tolist(),
+                         [False, True, False, False])
+
+    def test_selection(self):
+        loaded = self.round_trip(CompactTable.from_frame(analyzed()))
+        rows = loaded.isin('Status', ['Open']) & loaded.isin('Geo Group', [0])
+        taken = self.round_trip(loaded.take(rows))
+        self.assertEqual(taken.to_frame()['Campground'].tolist(),
+                         [u'Wench Creek', u'Yellowjacket'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Jobs of the scraper daemon list the same areas as the scripts"""
+import io
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+import pandas as pd
+import config
+import scrape_campsite_data as scd
+import scrape_daemon
+import update_campstatus as uc
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixture_page(url, fetcher=None):
+    with io.open(os.path.join(FIXTURES, 'campground.html'),
+                 encoding='utf-8') as f:
+        return f.read()
+
+def no_listing_link(forest):
+    raise ValueError('no Campground Camping link for {}'.format(forest))
+
+def fake_listing(forest_url):
+    return [['{} Campground'.format(forest_url), forest_url + '/1'],
+            ['{} Equestrian Area'.format(forest_url), forest_url + '/2']]
+
+class DaemonListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (uc.list_forest_campgrounds, scd.fetch_campground_page,
+                      uc.FOREST_URLS, config.scraped_file,
+                      scd.get_forest_rec_url)
+        uc.list_forest_campgrounds = fake_listing
+        scd.get_forest_rec_url = no_listing_link
+        scd.fetch_campground_page = fixture_page
+        uc.FOREST_URLS = ['eldorado-listing']
+        self.dir = tempfile.mkdtemp()
+        config.scraped_file = os.path.join(self.dir, 'scraped.csv')
+        self.daemon = scrape_daemon.ScraperDaemon(threads=2)
+        self.daemon.catalog.forest_urls.update({
+            'eldorado': 'eldorado-listing', 'tahoe': 'tahoe-listing'})
+
+    def tearDown(self):
+        self.daemon.pool.close()
+        shutil.rmtree(self.dir)
+        (uc.list_forest_campgrounds, scd.fetch_campground_page,
+         uc.FOREST_URLS, config.scraped_file,
+         scd.get_forest_rec_url) = self.saved
+
+    def test_status_lists_every_area(self):
+        statuses = self.daemon.status()['statuses']
+        self.assertEqual([row['name'] for row in statuses], [
+            'eldorado-listing Campground',
+            'eldorado-listing Equestrian Area'])
+        self.assertEqual([row['status'] for row in statuses], ['Open'] * 2)
+
+    def test_scrape_lists_campgrounds(self):
+        result = self.daemon.scrape(
+            forests=['eldorado', 'stanislaus', 'tahoe'])
+        self.assertEqual(result, {'campgrounds': 2, 'failed': 0,
+                                  'failed_forests': ['Stanislaus National Forest']})
+        df = pd.read_csv(config.scraped_file)
+        self.assertEqual(df['Campground'].tolist(), [
+            'eldorado-listing Campground', 'tahoe-listing Campground'])
+        # the unfiltered listing is cached for the status job
+        self.assertEqual(len(self.daemon.catalog.campgrounds(
+            'eldorado-listing')), 2)
+
+class SocketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'daemon.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_socket_private_from_bind(self):
+        umask = os.umask(0022)
+        try:
+            server = threading.Thread(target=scrape_daemon.main,
+                                      args=(self.path,))
+            server.daemon = True
+            server.start()
+            for _ in range(100):
+                if os.path.exists(self.path):
+                    break
+                time.sleep(0.05)
+            mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            self.assertEqual(os.umask(0022), 0022)
+        finally:
+            os.umask(umask)
+        self.assertEqual(mode, 0600)
+        scrape_daemon.send('stop', self.path, timeout=10)
+        server.join(10)
+        self.assertFalse(server.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Scraping within a deadline fetches the most important campgrounds first"""
+import datetime
+import io
+import os
+import time
+import unittest
+import pandas as pd
+import config
+import deadline_scrape
+import scrape_campsite_data as scd
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixture_page(url, fetcher=None):
+    if url == 'u-slow':
+        time.sleep(2)
+    with io.open(os.path.join(FIXTURES, 'campground.html'),
+                 encoding='utf-8') as f:
+        return f.read()
+
+class PrioritizeTest(unittest.TestCase):
+
+    def test_order(self):
+        now = time.mktime(datetime.datetime(2026, 1, 15).timetuple())
+        names = ['new', 'star', 'open', 'changed', 'old', 'recent', 'winter']
+        jobs = [('Tahoe', name, 'u-' + name) for name in reversed(names)]
+        previous = pd.DataFrame({
+            'URL': ['u-star', 'u-open', 'u-changed', 'u-old', 'u-recent',
+                    'u-winter'],
+            'Campground': ['star', 'open', 'changed', 'old', 'recent',
+                           'winter'],
+            'Status': ['Closed', 'Open', 'Closed', 'Closed', 'Closed',
+                       'Closed'],
+            'Open Season': [None, None, None, None, None, 'May - September'],
+            'Scraped At': ['2026-01-14T00:00:00Z'] * 3 +
+                          ['2026-01-10T00:00:00Z', '2026-01-12T00:00:00Z',
+                           '2026-01-01T00:00:00Z'],
+            })
+        ordered = deadline_scrape.prioritize(
+            jobs, previous, starred=['star'], changed=set(['u-changed']),
+            now=now)
+        self.assertEqual([name for _, name, _ in ordered], names)
+
+class ScrapeWithDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (scd.fetch_campground_page, scd.get_forest_rec_url,
+                      scd.get_campground_urls, config.deadline_margin,
+                      config.fetch_threads, config.starred_campgrounds,
+                      config.refresh_schedule_file)
+        scd.fetch_campground_page = fixture_page
+        scd.get_forest_rec_url = lambda forest, **kwargs: 'listing'
+        scd.get_campground_urls = lambda url: [
+            ['fast', 'u-fast'], ['slow', 'u-slow'], ['late', 'u-late']]
+        config.deadline_margin = 0
+        config.fetch_threads = 1
+        config.starred_campgrounds = ['slow']
+        config.refresh_schedule_file = '/nonexistent/schedule.json'
+        self.forest = config.AllNationalForests['tahoe']
+        self.previous = pd.DataFrame({
+            'Forest': [self.forest] * 2,
+            'Campground': ['slow', 'late'],
+            'URL': ['u-slow', 'u-late'],
+            'Status': ['Closed', 'Closed'],
+            'Scraped At': ['2026-01-01T00:00:00Z'] * 2,
+            })
+
+    def tearDown(self):
+        (scd.fetch_campground_page, scd.get_forest_rec_url,
+         scd.get_campground_urls, config.deadline_margin,
+         config.fetch_threads, config.starred_campgrounds,
+         config.refresh_schedule_file) = self.saved
+
+    def test_stale_values_kept_after_deadline(self):
+        start = time.time()
+        df = deadline_scrape.scrape_with_deadline(
+            1.0, forests=['tahoe'], previous=self.previous)
+        self.assertLess(time.time() - start, 1.9)
+        scraped_at = dict(zip(df['URL'], df['Scraped At']))
+        self.assertEqual(sorted(scraped_at), ['u-fast', 'u-late', 'u-slow'])
+        # u-fast is new, so it went first; u-slow ran past the deadline
+        self.assertNotEqual(scraped_at['u-fast'], '2026-01-01T00:00:00Z')
+        self.assertEqual(scraped_at['u-slow'], '2026-01-01T00:00:00Z')
+        self.assertEqual(scraped_at['u-late'], '2026-01-01T00:00:00Z')
+
+    def test_previous_not_modified(self):
+        previous = self.previous.drop('Scraped At', axis=1)
+        deadline_scrape.scrape_with_deadline(
+            1.0, forests=['tahoe'], previous=previous)
+        self.assertNotIn('Scraped At', previous)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Map tiles are recomputed only where groups changed"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import config
+import export_map
+
+def analyzed():
+    return pd.DataFrame({
+        'Campground': ['a', 'b', 'c', 'd'],
+        'Status': ['Open', 'Open', 'Open', 'Closed'],
+        'Forest': ['Eldorado', 'Eldorado', 'Tahoe', 'Tahoe'],
+        'Geo Group': [0, 0, 1, 1],
+        'URL': ['u1', 'u2', 'u3', 'u4'],
+        'Latitude': [38.8, 38.81, 39.3, 39.31],
+        'Longitude': [-120.3, -120.31, -110.5, -110.51],
+        })
+
+def group_tiles(tiles):
+    """(z, x, y) of every tile holding a group feature"""
+    return sorted(key for key, content in tiles.iteritems()
+                  if any('Centroid' in f['properties']
+                         for f in content['features']))
+
+class BuildTilesTest(unittest.TestCase):
+
+    def test_group_in_centroid_tile_only(self):
+        # the two campgrounds straddle x tiles 0 and 1 at zoom 3
+        df = pd.DataFrame({
+            'Campground': ['a', 'b'], 'Forest': ['Tahoe', 'Tahoe'],
+            'Geo Group': [0, 0], 'Latitude': [39.0, 39.0],
+            'Longitude': [-135.5, -134.0]})
+        groups = export_map.group_features(df)
+        tiles = export_map.build_tiles(df, groups, min_zoom=3, max_zoom=3)
+        self.assertEqual(sorted(tiles), [(3, 0, 3), (3, 1, 3)])
+        self.assertEqual(group_tiles(tiles), [(3, 1, 3)])
+
+    def test_only_matches_full_build(self):
+        df = analyzed()
+        groups = export_map.group_features(df)
+        full = export_map.build_tiles(df, groups, min_zoom=5, max_zoom=9)
+        only = set(list(full)[:3])
+        self.assertEqual(
+            export_map.build_tiles(df, groups, min_zoom=5, max_zoom=9,
+                                   only=only),
+            dict((key, full[key]) for key in only))
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = config.map_min_zoom, config.map_max_zoom
+        config.map_min_zoom, config.map_max_zoom = 5, 9
+
+    def tearDown(self):
+        config.map_min_zoom, config.map_max_zoom = self.saved
+        shutil.rmtree(self.dir)
+
+    def tile_files(self):
+        found = []
+        for root, _, files in os.walk(os.path.join(self.dir, 'tiles')):
+            found += [os.path.join(root, f) for f in files
+                      if f != 'manifest.json']
+        return len(found)
+
+    def test_unchanged_writes_nothing(self):
+        df = analyzed()
+        written, removed = export_map.export(df, self.dir)
+        self.assertEqual((written, removed), (self.tile_files(), 0))
+        self.assertEqual(export_map.export(df, self.dir), (0, 0))
+
+    def test_only_changed_group_recomputed(self):
+        df = analyzed()
+        export_map.export(df, self.dir)
+        calls = []
+        build_tiles = export_map.build_tiles
+
+        def spy(df, groups, only=None, **kwargs):
+            calls.append(only)
+            return build_tiles(df, groups, only=only, **kwargs)
+
+        export_map.build_tiles = spy
+        try:
+            df.loc[3, 'Status'] = 'Open'
+            written, removed = export_map.export(df, self.dir)
+        finally:
+            export_map.build_tiles = build_tiles
+        # the Tahoe group is in one tile per zoom level, Eldorado untouched
+        self.assertEqual(len(calls[0]), 5)
+        self.assertEqual(set(z for z, _, _ in calls[0]), set(range(5, 10)))
+        # below zoom 9 both campgrounds are one cluster, which has no status
+        self.assertEqual((written, removed), (1, 0))
+
+    def test_moved_group_removes_old_tiles(self):
+        df = analyzed()
+        export_map.export(df, self.dir)
+        df = df[df['Forest'] == 'Eldorado']
+        written, removed = export_map.export(df, self.dir)
+        self.assertEqual((written, removed), (0, 5))
+        with open(os.path.join(self.dir, 'tiles', 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(sorted(manifest['groups']), ['["Eldorado", 0]'])
+        self.assertEqual(len(manifest['tiles']), self.tile_files())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Partial parsing must extract the same values as a full parse
+
+The fixture pages follow the markup of NFS campground, status and
+listing pages, with the cases the pre-scan has to get right: labels
+inside <script> and <style>, labels that appear more than once, and
+unclosed <p>, <li>, <tr> and <td> tags.
+
+"""
+import io
+import os
+import unittest
+from bs4 import BeautifulSoup
+import extraction
+import scrape_campsite_data as scd
+import update_campstatus as uc
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixture(name):
+    with io.open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+def full_parse(html):
+    return BeautifulSoup(html, 'html.parser')
+
+class CampgroundParityTest(unittest.TestCase):
+
+    def assert_parity(self, name, schema, markers):
+        html = fixture(name)
+        full = extraction.apply_schema(full_parse(html), schema)
+        partial = extraction.apply_schema(
+            extraction.parse_page(html, markers), schema)
+        self.assertEqual(full, partial)
+        return partial
+
+    def test_campground_page(self):
+        data = self.assert_parity('campground.html',
+                                  extraction.CAMPGROUND_SCHEMA,
+                                  scd.CAMPGROUND_MARKERS)
+        self.assertEqual(data['Status'], 'Open')
+        self.assertEqual(data['Elevation'], '4,900 ft')
+        self.assertEqual(data['Longitude'], '-120.3880')
+        self.assertEqual(data['Open Season'], ['Mid-May - October'])
+
+    def test_label_inside_script(self):
+        # a <script> holding the labels comes after them in the body,
+        # one holding 'Area Status: ' is in the head of the status page
+        # and one holding 'Elevation :' is in the head of the unclosed
+        # page. Their content is text to both parsers.
+        data = self.assert_parity('campground.html',
+                                  extraction.CAMPGROUND_SCHEMA,
+                                  scd.CAMPGROUND_MARKERS)
+        self.assertEqual(data['Latitude'], '38.8875')
+        self.assert_parity('status.html', uc.STATUS_SCHEMA,
+                           uc.STATUS_MARKERS)
+        self.assert_parity('campground_unclosed.html',
+                           extraction.CAMPGROUND_SCHEMA,
+                           scd.CAMPGROUND_MARKERS)
+
+    def test_unclosed_tags_and_repeated_labels(self):
+        data = self.assert_parity('campground_unclosed.html',
+                                  extraction.CAMPGROUND_SCHEMA,
+                                  scd.CAMPGROUND_MARKERS)
+        # the first of the repeated labels wins in both modes
+        self.assertEqual(data['Status'], 'Closed for the season')
+        self.assertEqual(data['Latitude'], '39.6208')
+        self.assertEqual(len(data['Usage']), 2)
+
+    def test_status_page(self):
+        data = self.assert_parity('status.html', uc.STATUS_SCHEMA,
+                                  uc.STATUS_MARKERS)
+        self.assertEqual(data['Status'], 'Open (reservations recommended)')
+
+    def test_parse_campground_page(self):
+        html = fixture('campground.html')
+        url = ('https://www.fs.usda.gov/recarea/eldorado/recreation/'
+               'camping-cabins/recarea/?recid=17875&actid=29')
+        partial = scd.parse_campground_page(html, url)
+        full = extraction.apply_schema(full_parse(html))
+        for key, value in full.iteritems():
+            self.assertEqual(partial[key], value)
+
+class ListingParityTest(unittest.TestCase):
+
+    def test_listing(self):
+        html = fixture('listing.html')
+        heading = 'Campground Camping Areas'
+        for suffix in (None, 'Campground'):
+            full = extraction.extract_listing(full_parse(html), heading,
+                                              suffix)
+            partial = extraction.extract_listing(
+                extraction.parse_page(html, [heading]), heading, suffix)
+            self.assertEqual(full, partial)
+        # the list under the second heading also follows the first one
+        self.assertEqual([name for name, _ in full], [
+            'Wench Creek Campground', 'Yellowjacket Campground',
+            'Silver Creek Group Campground', 'Ice House Campground',
+            'Ice House Campground'])
+
+    def test_link_url(self):
+        html = fixture('listing.html')
+        text = 'Campground Camping'
+        self.assertEqual(
+            scd.find_link_url(full_parse(html), text),
+            scd.find_link_url(extraction.parse_page(html, [text]), text))
+
+class RelevantHtmlTest(unittest.TestCase):
+
+    def test_skips_chrome(self):
+        html = fixture('campground.html')
+        kept = extraction.relevant_html(html, scd.CAMPGROUND_MARKERS)
+        self.assertLess(len(kept), len(html))
+        self.assertNotIn('About the Forest', kept)
+
+    def test_no_marker(self):
+        self.assertEqual(
+            extraction.relevant_html(u'<p>nothing here</p>', ['Area Status']),
+            u'')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+"""Concurrency limits, circuit breaking and retries of fetch.Fetcher"""
+import threading
+import time
+import unittest
+import fetch
+
+HOST = 'https://www.fs.usda.gov/recarea/eldorado/recreation/'
+
+class Response(object):
+
+    def __init__(self, status_code, headers=None, content='<html></html>'):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.text = content
+
+class Session(object):
+    """Answers each URL with its list of responses, then with 200s"""
+
+    def __init__(self, responses=None):
+        self.responses = dict((url, list(r))
+                              for url, r in (responses or {}).iteritems())
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(url)
+        answers = self.responses.get(url)
+        if answers:
+            return answers.pop(0)
+        return Response(200)
+
+class FakeTime(object):
+    """time module whose sleep only records the seconds asked for"""
+
+    def __init__(self):
+        self.slept = []
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def test_additive_increase(self):
+        limiter = fetch.AdaptiveLimiter(initial=4, maximum=5,
+                                        target_latency=1.0)
+        limiter.acquire()
+        limiter.release(0.1, False)
+        self.assertEqual(limiter.limit, 4.25)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(0.1, False)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_one_decrease_per_burst(self):
+        limiter = fetch.AdaptiveLimiter(initial=8, maximum=16,
+                                        target_latency=1.0)
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(0.5, True)
+        self.assertEqual(limiter.limit, 4)
+        limiter.acquire()
+        limiter.release(2.0, False)
+        # slow, and sent before the last decrease
+        self.assertEqual(limiter.limit, 4)
+        time.sleep(0.01)
+        limiter.acquire()
+        limiter.release(0.001, True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_waits_for_a_slot(self):
+        limiter = fetch.AdaptiveLimiter(initial=1, maximum=1)
+        limiter.acquire()
+        started = []
+        waiter = threading.Thread(
+            target=lambda: (limiter.acquire(), started.append(True)))
+        waiter.start()
+        waiter.join(0.1)
+        self.assertEqual(started, [])
+        limiter.release(0.1, False)
+        waiter.join(5)
+        self.assertEqual(started, [True])
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_failed_pages(self):
+        breaker = fetch.CircuitBreaker(failures=2, cooldown=0.2)
+        breaker.record(False)
+        self.assertFalse(breaker.wait())
+        breaker.record(True)
+        breaker.record(False)
+        self.assertFalse(breaker.wait())
+        breaker.record(False)
+        self.assertIsNotNone(breaker.opened_at)
+
+    def test_waits_out_the_cooldown(self):
+        breaker = fetch.CircuitBreaker(failures=1, cooldown=0.2)
+        breaker.record(False)
+        start = time.time()
+        self.assertTrue(breaker.wait())
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        breaker.record(True)
+        self.assertFalse(breaker.wait())
+
+    def test_others_wait_for_the_trial(self):
+        breaker = fetch.CircuitBreaker(failures=1, cooldown=0.05)
+        breaker.record(False)
+        self.assertTrue(breaker.wait())
+        trials = []
+        waiter = threading.Thread(target=lambda: trials.append(breaker.wait()))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+        # a failed trial opens the circuit again for a whole cooldown
+        breaker.record(False)
+        waiter.join(5)
+        self.assertEqual(trials, [True])
+
+    def test_gives_up_after_max_wait(self):
+        breaker = fetch.CircuitBreaker(failures=1, cooldown=60, max_wait=0.05)
+        breaker.record(False)
+        self.assertRaises(fetch.FetchError, breaker.wait)
+
+class FetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.time = fetch.time
+        fetch.time = FakeTime()
+
+    def tearDown(self):
+        fetch.time = self.time
+
+    def fetcher(self, responses, cooldown=0.01):
+        fetcher = fetch.Fetcher(fetch.AdaptiveLimiter(initial=4), attempts=4,
+                                backoff=1.0)
+        fetcher._local.session = Session(responses)
+        fetcher.breakers[fetch.urlparse.urlparse(HOST).netloc] = \
+            fetch.CircuitBreaker(failures=5, cooldown=cooldown)
+        return fetcher
+
+    def test_broken_pages_do_not_stop_the_rest(self):
+        broken = [HOST + 'broken1', HOST + 'broken2']
+        fetcher = self.fetcher(dict((url, [Response(500)] * 4)
+                                    for url in broken))
+        failed = 0
+        ok = 0
+        for url in broken + [HOST + str(i) for i in range(200)]:
+            try:
+                fetcher.get(url)
+                ok += 1
+            except fetch.FetchError:
+                failed += 1
+        self.assertEqual((ok, failed), (200, 2))
+        self.assertEqual(len(fetcher.session.requests), 208)
+
+    def test_open_circuit_waits(self):
+        urls = [HOST + 'broken{}'.format(i) for i in range(5)]
+        fetcher = self.fetcher(dict((url, [Response(503)] * 4)
+                                    for url in urls), cooldown=0.2)
+        for url in urls:
+            self.assertRaises(fetch.FetchError, fetcher.get, url)
+        start = time.time()
+        self.assertEqual(fetcher.get(HOST + 'good').status_code, 200)
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_retry_after(self):
+        fetcher = self.fetcher({HOST + 'busy': [
+            Response(429, {'Retry-After': '3'}),
+            Response(503, {'Retry-After': '86400'}),
+            Response(503)]})
+        self.assertEqual(fetcher.get(HOST + 'busy').status_code, 200)
+        slept = fetch.time.slept
+        self.assertEqual(slept[:2], [3.0, 16.0])
+        self.assertLessEqual(slept[2], 4.0)
+
+    def test_removed_page_is_not_retried(self):
+        fetcher = self.fetcher({HOST + 'gone': [Response(404)]})
+        self.assertRaises(fetch.FetchError, fetcher.get, HOST + 'gone')
+        self.assertEqual(fetcher.session.requests, [HOST + 'gone'])
+        self.assertEqual(fetcher.breaker(HOST).failures, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Campground matching must never write to another campground's row"""
+import unittest
+import identity
+import update_campstatus as uc
+
+URL = ('https://www.fs.usda.gov/recarea/tahoe/recreation/camping-cabins/'
+       'recarea/?recid={}&actid=29')
+
+class FakeSheet(object):
+    """Worksheet with the reads and writes update_campstatus uses"""
+
+    def __init__(self, rows):
+        self.rows = [list(r) for r in rows]
+        self.updates = []
+
+    def row_values(self, row):
+        return self.rows[row - 1]
+
+    def col_values(self, col):
+        return [r[col - 1] if col <= len(r) else '' for r in self.rows]
+
+    def update_cell(self, row, col, value):
+        self.updates.append((row, col, value))
+
+class LookupTest(unittest.TestCase):
+
+    def test_similar_names_do_not_match(self):
+        index = identity.CampgroundIndex()
+        index.add(1, 'Upper Sardine Lake')
+        index.add(2, 'Silver Creek')
+        self.assertIsNone(index.lookup('Lower Sardine Lake Campground'))
+        self.assertIsNone(index.lookup('Silver Creek Group Campground'))
+        self.assertIsNone(index.lookup('Lower Sardine Lake Campground',
+                                       fuzzy=True))
+        self.assertIsNone(index.lookup('Silver Creek Group Campground',
+                                       fuzzy=True))
+
+    def test_exact_name(self):
+        index = identity.CampgroundIndex()
+        index.add(1, 'Upper Sardine Lake')
+        self.assertEqual(index.lookup(u'upper  sardine lake campground'), 1)
+
+    def test_fuzzy_needs_a_clear_lead(self):
+        index = identity.CampgroundIndex()
+        index.add(1, 'Wrights Lake Equestrian')
+        self.assertEqual(index.lookup('Wright Lake Equestrian', fuzzy=True), 1)
+        index.add(2, 'Wrights Lake Equestrians')
+        self.assertIsNone(index.lookup('Wright Lake Equestrian', fuzzy=True))
+
+    def test_duplicate_names_match_nothing(self):
+        index = identity.CampgroundIndex()
+        index.add(1, 'Lakeside')
+        index.add(2, 'Lakeside Campground')
+        self.assertIsNone(index.lookup('Lakeside'))
+
+    def test_id_first_and_only(self):
+        index = identity.CampgroundIndex()
+        index.add(1, 'Upper Sardine Lake', URL.format(11))
+        index.add(2, 'Sardine Lake', recid=12.0)
+        self.assertEqual(index.lookup('anything', URL.format(11)), 1)
+        self.assertEqual(index.lookup(recid='12'), 2)
+        # the index has IDs, so a campground missing from it is not
+        # matched by name
+        self.assertIsNone(index.lookup('Sardine Lake', URL.format(13)))
+
+class UpdateSheetTest(unittest.TestCase):
+
+    def test_writes_by_url_column(self):
+        sheet = FakeSheet([
+            ['Campground', 'Status', 'URL'],
+            ['Upper Sardine Lake', 'Open', URL.format(11)],
+            ['Lower Sardine Lake', 'Open', URL.format(12)],
+            ])
+        index = identity.index_sheet(sheet)
+        uc.update_sheet(sheet, 'Lower Sardine Lake Campground', 'Closed',
+                        index=index, url=URL.format(12))
+        uc.update_sheet(sheet, 'Upper Sardine Lake', 'Closed',
+                        index=index, url=URL.format(99))
+        self.assertEqual(sheet.updates, [(3, 2, 'Closed')])
+
+    def test_names_only_sheet(self):
+        sheet = FakeSheet([['Upper Sardine Lake'], ['Silver Creek']])
+        index = identity.index_sheet(sheet)
+        uc.update_sheet(sheet, 'Lower Sardine Lake Campground', 'Closed',
+                        index=index, url=URL.format(12))
+        uc.update_sheet(sheet, 'Silver Creek Campground', 'Open',
+                        index=index, url=URL.format(13))
+        self.assertEqual(sheet.updates, [(2, 2, 'Open')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Stored pages parse to the same values as fetched ones"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import fetch
+import page_store
+import scrape_campsite_data as scd
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+URL = ('https://www.fs.usda.gov/recarea/eldorado/recreation/'
+       'camping-cabins/recarea/?recid=17875&actid=29')
+
+class PageStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with io.open(os.path.join(FIXTURES, 'campground.html'),
+                     encoding='utf-8') as f:
+            self.html = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check_round_trip(self, strip):
+        store = page_store.PageStore(self.dir, strip=strip)
+        written = store.save(URL, self.html, scd.CAMPGROUND_MARKERS)
+        loaded = store.load(URL)
+        self.assertEqual(scd.parse_campground_page(loaded, URL),
+                         scd.parse_campground_page(self.html, URL))
+        self.assertEqual(store.stored_bytes, written)
+        return loaded
+
+    def test_stripped_page(self):
+        loaded = self.check_round_trip(strip=True)
+        self.assertLess(len(loaded), len(self.html))
+
+    def test_whole_page(self):
+        self.assertEqual(self.check_round_trip(strip=False), self.html)
+
+    def test_not_stored(self):
+        store = page_store.PageStore(self.dir)
+        self.assertIsNone(store.load(URL))
+
+class TrafficSnapshotTest(unittest.TestCase):
+
+    def test_snapshot_is_a_copy(self):
+        log = fetch.TrafficLog()
+        log.add(URL, 100, 400)
+        snapshot = log.snapshot()
+        log.add(URL, 100, 400)
+        (counts,) = snapshot.values()
+        self.assertEqual(counts, {'requests': 1, 'wire': 100, 'decoded': 400})
+        self.assertEqual(log.totals()['requests'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
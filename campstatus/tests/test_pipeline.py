@@ -0,0 +1,73 @@
+"""The pipeline must stop, not hang, when a stage fails"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import pipeline
+import scrape_campsite_data as scd
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixture_page(url, fetcher=None):
+    with io.open(os.path.join(FIXTURES, 'campground.html'),
+                 encoding='utf-8') as f:
+        return f.read()
+
+def failing_write(batch, out_file, header, kind='campgrounds'):
+    raise IOError('disk full')
+
+class FailedWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = scd.fetch_campground_page, pipeline._write_batch
+        scd.fetch_campground_page = fixture_page
+        pipeline._write_batch = failing_write
+        self.dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.dir, 'scraped.csv')
+
+    def tearDown(self):
+        scd.fetch_campground_page, pipeline._write_batch = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_write_error_is_raised(self):
+        jobs = [('Eldorado', 'Campground {}'.format(i), 'url-{}'.format(i))
+                for i in range(40)]
+        errors = []
+        def run():
+            try:
+                pipeline.run_pipeline(jobs, self.out_file, fetch_threads=4,
+                                      parse_processes=2, queue_size=2,
+                                      batch_size=1)
+            except IOError as e:
+                errors.append(e)
+        runner = threading.Thread(target=run)
+        runner.daemon = True
+        runner.start()
+        runner.join(60)
+        self.assertFalse(runner.is_alive(), 'pipeline hung after an error')
+        self.assertEqual(len(errors), 1)
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = scd.fetch_campground_page
+        scd.fetch_campground_page = fixture_page
+        self.dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.dir, 'scraped.csv')
+
+    def tearDown(self):
+        scd.fetch_campground_page = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_all_rows_written(self):
+        jobs = [('Eldorado', 'Campground {}'.format(i), 'url-{}'.format(i))
+                for i in range(10)]
+        written = pipeline.run_pipeline(jobs, self.out_file, fetch_threads=2,
+                                        parse_processes=2, queue_size=2,
+                                        batch_size=3)
+        self.assertEqual(written, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Publishing writes only the cells that changed"""
+import unittest
+import pandas as pd
+import config
+import publish_sheet as ps
+
+COLUMNS = ['Campground', 'Status', 'Elevation']
+
+def table(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+ROWS = [['Wench Creek', 'Open', 5000.0],
+        ['Yellowjacket', 'Open', 4900.0],
+        ['Ice House', 'Closed', 5500.0]]
+
+class ChangedRangesTest(unittest.TestCase):
+
+    def test_no_change(self):
+        grid = [['a', 'b'], ['c', 'd']]
+        self.assertEqual(ps.changed_ranges(grid, [list(r) for r in grid]), [])
+
+    def test_single_cell(self):
+        self.assertEqual(
+            ps.changed_ranges([['a', 'b'], ['c', 'd']],
+                              [['a', 'b'], ['c', 'x']]),
+            [{'range': 'B2:B2', 'values': [['x']]}])
+
+    def test_adjacent_runs_merge(self):
+        old = [['a', 'b', 'c'], ['d', 'e', 'f'], ['g', 'h', 'i']]
+        new = [['a', 'B', 'C'], ['d', 'E', 'F'], ['g', 'h', 'i']]
+        self.assertEqual(ps.changed_ranges(old, new), [
+            {'range': 'B1:C2', 'values': [['B', 'C'], ['E', 'F']]}])
+
+    def test_different_runs_stay_apart(self):
+        old = [['a', 'b', 'c'], ['d', 'e', 'f']]
+        new = [['A', 'b', 'c'], ['d', 'E', 'f']]
+        self.assertEqual([u['range'] for u in ps.changed_ranges(old, new)],
+                         ['A1:A1', 'B2:B2'])
+
+    def test_shorter_grid_clears(self):
+        self.assertEqual(
+            ps.changed_ranges([['a', 'b'], ['c', 'd']], [['a', 'b']]),
+            [{'range': 'A2:B2', 'values': [['', '']]}])
+
+class PublishTableTest(unittest.TestCase):
+
+    def publish(self, sheet, rows):
+        return ps.publish_table(sheet, table(rows), COLUMNS,
+                                ranges_per_call=2)
+
+    def test_first_publish(self):
+        sheet = ps.MemoryWorksheet()
+        self.publish(sheet, ROWS)
+        self.assertEqual(sheet.get_all_values(),
+                         ps.table_to_grid(table(ROWS), COLUMNS))
+        self.assertEqual(sheet.update_calls, 1)
+
+    def test_republish_is_a_no_op(self):
+        sheet = ps.MemoryWorksheet()
+        self.publish(sheet, ROWS)
+        self.assertEqual(self.publish(sheet, ROWS), [])
+        self.assertEqual(sheet.update_calls, 1)
+
+    def test_single_cell_change(self):
+        sheet = ps.MemoryWorksheet()
+        self.publish(sheet, ROWS)
+        rows = [list(r) for r in ROWS]
+        rows[1][1] = 'Closed'
+        written = sheet.cells_written
+        self.assertEqual([u['range'] for u in self.publish(sheet, rows)],
+                         ['B3:B3'])
+        self.assertEqual(sheet.cells_written, written + 1)
+
+    def test_grow_and_shrink(self):
+        sheet = ps.MemoryWorksheet(rows=3, cols=2)
+        self.publish(sheet, ROWS[:2])
+        self.assertEqual((sheet.row_count, sheet.col_count), (3, 3))
+        self.publish(sheet, ROWS)
+        self.assertEqual(sheet.row_count, 4)
+        self.assertEqual(sheet.get_all_values(),
+                         ps.table_to_grid(table(ROWS), COLUMNS))
+        self.publish(sheet, ROWS[:1])
+        self.assertEqual(sheet.get_all_values(),
+                         ps.table_to_grid(table(ROWS[:1]), COLUMNS))
+
+    def test_batches_ranges(self):
+        sheet = ps.MemoryWorksheet()
+        self.publish(sheet, ROWS)
+        rows = [list(r) for r in ROWS]
+        rows[0][0], rows[1][2], rows[2][0] = 'x', 1.0, 'y'
+        self.assertEqual(len(self.publish(sheet, rows)), 3)
+        self.assertEqual(sheet.update_calls, 3)
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = config.publish_sheet_key, config.analyzed_file
+        config.publish_sheet_key = None
+        config.analyzed_file = '/nonexistent/analyzed.csv'
+
+    def tearDown(self):
+        config.publish_sheet_key, config.analyzed_file = self.saved
+
+    def test_needs_sheet_key(self):
+        with self.assertRaises(ValueError) as raised:
+            ps.main()
+        self.assertIn('publish_sheet_key', str(raised.exception))
+
+if __name__ == '__main__':
+    unittest.main()
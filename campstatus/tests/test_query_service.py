@@ -0,0 +1,101 @@
+"""Queries over the analyzed table"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import config
+import query_service
+
+def analyzed():
+    return pd.DataFrame({
+        'Campground': ['Wench Creek', 'Yellowjacket', 'Ice House', 'Airport',
+                       'Unknown'],
+        'Forest': ['Eldorado National Forest'] * 3 + ['Tahoe National Forest']
+            * 2,
+        'Status': ['Open', 'Open', 'Closed', 'Open', 'Open'],
+        'Elevation': [4900.0, 4900.0, 5500.0, 6000.0, np.nan],
+        # Wench Creek and Yellowjacket are 1.7 km apart, Ice House 9 km
+        'Latitude': [38.8875, 38.8900, 38.8300, 39.30, np.nan],
+        'Longitude': [-120.3880, -120.3690, -120.3000, -120.50, np.nan],
+        'Geo Group': [0, 0, 0, 0, np.nan],
+        })
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = config.cluster_cache_dir
+        config.cluster_cache_dir = None
+        self.store = query_service.CampgroundStore(analyzed(), 'v1')
+
+    def tearDown(self):
+        config.cluster_cache_dir = self.saved
+
+    def names(self, result):
+        return [r['Campground'] for r in result['results']]
+
+    def test_filters(self):
+        result = self.store.query({'forest': ['eldorado'], 'status': ['open']})
+        self.assertEqual(self.names(result), ['Wench Creek', 'Yellowjacket'])
+        result = self.store.query({'max_elevation': ['5000']})
+        self.assertEqual(result['total'], 2)
+
+    def test_radius(self):
+        small = self.store.query({'forest': ['eldorado'], 'radius': ['0.5']})
+        self.assertEqual(len(set(r['Geo Group'] for r in small['results'])), 3)
+        medium = self.store.query({'forest': ['eldorado'], 'radius': ['1']})
+        groups = [r['Geo Group'] for r in medium['results']]
+        self.assertEqual(groups[0], groups[1])
+        self.assertNotEqual(groups[0], groups[2])
+        # the stored groups are unchanged
+        self.assertEqual(self.store.records[2]['Geo Group'], 0)
+        # a campground without coordinates has no group
+        unknown = self.store.query({'radius': ['1'], 'offset': ['4']})
+        self.assertIsNone(unknown['results'][0]['Geo Group'])
+
+    def test_geo_group_at_radius(self):
+        result = self.store.query({'forest': ['eldorado'], 'radius': ['1'],
+                                   'geo_group': [str(int(
+                                       self.store.geo_groups(1.0)[2]))]})
+        self.assertEqual(self.names(result), ['Ice House'])
+
+    def test_bad_radius(self):
+        for radius in ('0', '-1', 'wide'):
+            self.assertRaises(query_service.QueryError, self.store.query,
+                              {'radius': [radius]})
+
+class StoreReloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'analyzed.csv')
+        analyzed().to_csv(self.path, index=False)
+        os.utime(self.path, (1000, 1000))
+        self.reloader = query_service.StoreReloader(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, df, mtime):
+        with open(self.path, 'w') as f:
+            if df is not None:
+                df.to_csv(f, index=False)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_unchanged(self):
+        self.assertFalse(self.reloader.check())
+
+    def test_retries_after_failed_parse(self):
+        store = self.reloader.store
+        # a file caught while it is being written
+        self.write(None, 2000)
+        self.assertRaises(Exception, self.reloader.check)
+        self.assertIs(self.reloader.store, store)
+        self.write(analyzed().head(2), 2000)
+        self.assertTrue(self.reloader.check())
+        self.assertEqual(self.reloader.store.query({})['total'], 2)
+        self.assertFalse(self.reloader.check())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Reading Open Season texts"""
+import unittest
+from refresh_scheduler import parse_open_season
+
+class OpenSeasonTest(unittest.TestCase):
+
+    def test_range(self):
+        self.assertEqual(parse_open_season('May 25 - October 15'),
+                         ((5, 25), (10, 15)))
+        self.assertEqual(parse_open_season('May 25-October 15'),
+                         ((5, 25), (10, 15)))
+        self.assertEqual(parse_open_season('May - September'),
+                         ((5, None), (9, None)))
+
+    def test_prefixed_months(self):
+        self.assertEqual(parse_open_season('Mid-May - October'),
+                         ((5, None), (10, None)))
+        self.assertEqual(parse_open_season('Late-May - Mid-October'),
+                         ((5, None), (10, None)))
+        self.assertEqual(parse_open_season('Late-June'), ((6, None), None))
+
+    def test_closing_only(self):
+        self.assertEqual(parse_open_season('- October 8'), (None, (10, 8)))
+        self.assertEqual(parse_open_season('-Mid-October'),
+                         (None, (10, None)))
+
+    def test_no_dates(self):
+        self.assertEqual(parse_open_season('year-round'), 'year-round')
+        self.assertIsNone(parse_open_season('varies'))
+        self.assertIsNone(parse_open_season(float('nan')))
+
+    def test_month_inside_word(self):
+        self.assertIsNone(parse_open_season('Decided each spring'))
+        self.assertIsNone(parse_open_season('Summer, see Marina office'))
+        self.assertEqual(parse_open_season('Opens Sept. 1 - Nov'),
+                         ((9, 1), (11, None)))
+        self.assertIsNone(parse_open_season('Junebug - Mayfield'))
+
+if __name__ == '__main__':
+    unittest.main()
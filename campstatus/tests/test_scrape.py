@@ -0,0 +1,107 @@
+"""Scraping forests into one table"""
+import io
+import os
+import unittest
+import pandas as pd
+import config
+import fetch
+import refresh_scheduler
+import scrape_campsite_data as scd
+
+def fake_campgrounds(forest_url):
+    return [['{} {}'.format(forest_url, i), 'url-{}-{}'.format(forest_url, i)]
+            for i in range(3)]
+
+def fake_scrape(urls):
+    return pd.DataFrame({
+        'Campground': [name for name, _ in urls],
+        'URL': [url for _, url in urls],
+        'Reservations': 'fcfs', 'Fees': '$5', 'Water': 'yes',
+        'Restroom': 'vault', 'Elevation': '5,000 ft',
+        'Latitude': '38.5', 'Longitude': '-120.1',
+        })
+
+class ScrapeAllForestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = scd.get_campground_urls, scd.scrape_campsite_data
+        scd.get_campground_urls = fake_campgrounds
+        scd.scrape_campsite_data = fake_scrape
+
+    def tearDown(self):
+        scd.get_campground_urls, scd.scrape_campsite_data = self.saved
+
+    def test_one_label_per_campground(self):
+        df = scd.scrape_all_forests({'Tahoe': 'a', 'Eldorado': 'b'})
+        self.assertEqual(list(df.index), range(6))
+        typed = scd.typed_campground_table(df)
+        self.assertEqual(list(typed.index), range(6))
+        self.assertEqual(typed['Elevation'].tolist(), [5000.0] * 6)
+
+    def test_typed_table_resets_index(self):
+        df = pd.DataFrame({'Elevation': ['1', '???'], 'Latitude': ['', '1'],
+                           'Longitude': ['2', '3']}, index=[0, 0])
+        typed = scd.typed_campground_table(df)
+        self.assertEqual(list(typed.index), [0, 1])
+        self.assertEqual(list(df.index), [0, 0])
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fake_page(url, fetcher=None):
+    if url.endswith('1'):
+        raise fetch.FetchError('404 for {}'.format(url))
+    with io.open(os.path.join(FIXTURES, 'campground.html'),
+                 encoding='utf-8') as f:
+        return f.read()
+
+def fake_listing(forest_url):
+    if forest_url == 'gone':
+        raise fetch.FetchError('circuit open for gone')
+    return fake_campgrounds(forest_url)
+
+class FetchErrorTest(unittest.TestCase):
+    """One missing page or forest does not stop the others"""
+
+    def setUp(self):
+        self.saved = (scd.get_campground_urls, scd.fetch_campground_page,
+                      scd.configured_forest_urls)
+        scd.get_campground_urls = fake_listing
+        scd.fetch_campground_page = fake_page
+
+    def tearDown(self):
+        (scd.get_campground_urls, scd.fetch_campground_page,
+         scd.configured_forest_urls) = self.saved
+
+    def test_missing_campground_page(self):
+        df = scd.scrape_campsite_data(fake_campgrounds('a'))
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df['Status'].tolist()[0], 'Open')
+        self.assertTrue(pd.isnull(df['Status'].tolist()[1]))
+        self.assertEqual(df['Campground'].tolist()[1], 'a 1')
+
+    def test_missing_forest(self):
+        df = scd.scrape_all_forests({'Gone': 'gone', 'Tahoe': 'a'})
+        self.assertEqual(df['Forest'].tolist(), ['Tahoe'] * 3)
+        self.assertEqual(len(scd.scrape_all_forests({'Gone': 'gone'})), 0)
+
+    def test_forest_without_listing_link(self):
+        saved = scd.get_forest_rec_url, config.forests_to_scrape
+        def rec_url(forest):
+            if forest == 'stanislaus':
+                raise ValueError('no Campground Camping link')
+            return forest
+        scd.get_forest_rec_url = rec_url
+        config.forests_to_scrape = ['tahoe', 'stanislaus']
+        try:
+            self.assertEqual(scd.configured_forest_urls(),
+                             {'Tahoe National Forest': 'tahoe'})
+        finally:
+            scd.get_forest_rec_url, config.forests_to_scrape = saved
+
+    def test_discover_skips_missing_forest(self):
+        scd.configured_forest_urls = lambda: {'Gone': 'gone', 'Tahoe': 'a'}
+        schedule = refresh_scheduler.RefreshSchedule('/nonexistent/schedule')
+        self.assertEqual(refresh_scheduler.discover(schedule, now=0), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,6 @@
-from bs4 import BeautifulSoup
-import requests
-import re
-import gspread
-import json
-from oauth2client import file, client, tools
+import fetch
+import extraction
+import identity
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 SECRETS = 'client_secret.json'
@@ -14,59 +11,83 @@ FOREST_URLS = [
 # Google sheet key
 # for sheet https://docs.google.com/spreadsheets/d/19TrtOtNcBHffXP1NFfz_XB_7xb3LbexpjVSGjyKpHWo/edit#gid=0
 SHEET_KEY = "19TrtOtNcBHffXP1NFfz_XB_7xb3LbexpjVSGjyKpHWo"
+# only the area status is needed when refreshing the sheet
+STATUS_SCHEMA = extraction.compile_schema([
+    extraction.Field('Status', 'strong', 'Area Status: ', extraction.clean_text),
+    ], section=None)
+STATUS_MARKERS = extraction.schema_markers(STATUS_SCHEMA)
+LISTING_HEADING = 'Campground Camping Areas'
 
-def authenticate():
+def authenticate(store):
+    from oauth2client import client, tools
     flow = client.flow_from_clientsecrets(SECRETS, SCOPES)
     creds = tools.run_flow(flow, store)
     return creds
 
-def open_camping_sheet(key):
-    """Opens the google sheet object"""
+def open_camping_sheet(key, worksheet=None):
+    """Opens the google sheet object
+
+    The first worksheet is opened unless a `worksheet` title is given.
+    """
+    # gspread and oauth2client are only needed when talking to Sheets,
+    # so they are not imported with the module
+    import gspread
+    from oauth2client import file
     # Setup the Sheets API
     store = file.Storage('credentials.json')
     creds = store.get()
     if not creds or creds.invalid:
-        creds = authenticate()
+        creds = authenticate(store)
     f = gspread.authorize(creds) # authenticate with Google
-    sheet = f.open_by_key(key).sheet1
+    spreadsheet = f.open_by_key(key)
+    if worksheet is None:
+        sheet = spreadsheet.sheet1
+    else:
+        sheet = spreadsheet.worksheet(worksheet)
     return sheet
 
-def update_sheet(sheet, campground_name, status, status_col=2):
-    """Updates the appropriate cell with campground status"""
-    try:
-        cell = sheet.find(re.compile('(?i){}'.format(campground_name)))
-    except Exception as e:
-        if type(e).__name__ == 'CellNotFound':
-            print '{} not found in sheet'.format(campground_name)
-            return None
-    row = cell.row
-    current_status = sheet.cell(row, status_col).value
+def update_sheet(sheet, campground_name, status, status_col=2, index=None,
+                 url=None):
+    """Updates the appropriate cell with campground status
+
+    The row is found with `index`, built once per sheet by
+    :func:`identity.index_sheet`, instead of searching the sheet. It is
+    matched by campground ID if the sheet has a URL or Campground ID
+    column, and otherwise by a name on exactly one row. Similar names
+    are never matched, so no status lands in another campground's row.
+    """
+    if index is None:
+        index = identity.index_sheet(sheet)
+    row = index.lookup(campground_name, url)
+    if row is None:
+        print u'{} not found in sheet'.format(campground_name)
+        return None
     sheet.update_cell(row, status_col, status)
 
 def get_campground_status(url):
     """Gets campground status from the campground webpage"""
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text, 'html.parser')
-    for i in soup.find_all('strong'):
-        if 'Area Status: ' in i.contents:
-            return i.next_sibling.strip()
+    r = fetch.get(url)
+    soup = extraction.parse_page(r.text, STATUS_MARKERS)
+    return extraction.apply_schema(soup, STATUS_SCHEMA).get('Status')
+
+def list_forest_campgrounds(forest_url):
+    """Lists [name, url] of every area on one forest's listing page"""
+    r = fetch.get(forest_url)
+    soup = extraction.parse_page(r.text, [LISTING_HEADING])
+    return extraction.extract_listing(soup, LISTING_HEADING)
+
+def list_campgrounds(forest_urls):
+    """Lists [name, url] of the campgrounds on the forests' listing pages"""
+    campgrounds = []
+    for furl in forest_urls:
+        campgrounds.extend(list_forest_campgrounds(furl))
+    return campgrounds
 
 def update_campground_status(sheet):
-    for furl in FOREST_URLS:
-        r = requests.get(furl)
-        soup=BeautifulSoup(r.text, 'html.parser')
-        campgrounds = []
-        url_pref = 'https://www.fs.usda.gov'
-        for i in soup.find_all(re.compile("h\d")):
-            if 'Campground Camping Areas' in i.contents:
-                for j in i.find_next_siblings('ul'):
-                    for k in j.findAll('a'):
-                        url = k.get('href')
-                        if not url.endswith('.pdf') and url is not None:
-                            url = url_pref + url
-                            status = get_campground_status(url)
-                            campname = k.getText()
-                            update_sheet(sheet, campname, status)
+    index = identity.index_sheet(sheet)
+    for campname, url in list_campgrounds(FOREST_URLS):
+        status = get_campground_status(url)
+        update_sheet(sheet, campname, status, index=index, url=url)
 
 def main():
     print 'opening sheet'